@@ -22,7 +22,9 @@ from typing import List, Optional, Tuple
 
 import pandas as pd
 
-from .utils import progress_bar
+from .library_frame import working_copy
+from .track_index import track_key
+from .utils import progress_bar, sqlite_lookup
 from .llm_client import _call_llm
 
 
@@ -219,7 +221,7 @@ def discover_similar(
         ]
         scores = score_playlists(single_track_dfs, benchmark_vecs, vectorizer)
 
-        library_df = library_df.copy()
+        library_df = working_copy(library_df)
         library_df["_discovery_score"] = scores
         top = (
             library_df.sort_values("_discovery_score", ascending=False)
@@ -333,20 +335,34 @@ def batch_enrich_metadata(
         )
         conn = None
 
-    df = df.copy()
+    df = working_copy(df)
     for col in ("Mood", "Energy", "Valence"):
         if col not in df.columns:
             df[col] = None
 
     # Build list of tracks that still need enrichment
     to_enrich = []  # (df_idx, cache_key, label_string)
+    # Key each row from the same strings the checks below use, so the cache
+    # key can never disagree with them
+    candidates = []  # (df_idx, row, artist, name, cache_key)
     for idx, row in df.iterrows():
         artist = str(row.get("Artist") or "")
         name = str(row.get("Name") or "")
-        if not artist or not name:
-            continue
-        key = f"{artist} - {name}".lower().strip()
-
+        if artist and name:
+            candidates.append((idx, row, artist, name, track_key(artist, name)))
+    # One temp-table join for the whole library instead of a SELECT per row
+    cache_hits = (
+        sqlite_lookup(
+            conn,
+            "claude_enrichment",
+            "key",
+            ("mood", "energy", "valence"),
+            [c[-1] for c in candidates],
+        )
+        if conn
+        else {}
+    )
+    for idx, row, artist, name, key in candidates:
         # Skip if Mood already populated from Last.fm / mood_map
         if pd.notnull(row.get("Mood")) and row.get("Mood") not in (
             "Unknown",
@@ -356,19 +372,15 @@ def batch_enrich_metadata(
             continue
 
         # Check SQLite cache
-        if conn:
-            cached = conn.execute(
-                "SELECT mood, energy, valence FROM claude_enrichment WHERE key=?",
-                (key,),
-            ).fetchone()
-            if cached:
-                if cached[0]:
-                    df.at[idx, "Mood"] = cached[0]
-                if cached[1] is not None:
-                    df.at[idx, "Energy"] = int(cached[1])
-                if cached[2] is not None:
-                    df.at[idx, "Valence"] = int(cached[2])
-                continue
+        cached = cache_hits.get(key)
+        if cached:
+            if cached[0]:
+                df.at[idx, "Mood"] = cached[0]
+            if cached[1] is not None:
+                df.at[idx, "Energy"] = int(cached[1])
+            if cached[2] is not None:
+                df.at[idx, "Valence"] = int(cached[2])
+            continue
 
         genre = str(row.get("Genre") or "")
         bpm = row.get("BPM")
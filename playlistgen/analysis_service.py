@@ -0,0 +1,449 @@
+"""
+Persistent warm audio-analysis workers for PlaylistGen.
+
+Every analyze_library() call normally starts a fresh ProcessPoolExecutor, and
+each new worker spends several seconds importing librosa and JIT-compiling
+its numba kernels before it analyzes anything.  On a run that only has a few
+new tracks, that start-up is most of the time.  The analysis service keeps
+one pool of warmed-up workers alive between pipeline runs and GUI actions:
+
+    python -m playlistgen analysis-service      # foreground, Ctrl-C to stop
+    AUDIO_WORKER_SERVICE: true                  # runs use it while it is up
+
+Clients connect over a Unix socket (multiprocessing.connection).  Connections
+are authenticated with a random key written next to the socket, readable only
+by its owner (<socket>.key, mode 0600).  Each connection authenticates on its
+own thread under a timeout, so a client that stalls mid-handshake cannot block
+the others.  connect_service() returns a
+ServiceExecutor, whose submit() returns a concurrent.futures.Future, so
+audio_analysis._run_pool() drives it exactly like a local pool.  It returns
+None when no compatible service is running, and the caller then starts its
+own pool.
+
+The handshake compares a hash of the code the workers run (audio_analysis.py
+and the modules it imports), so a service started before an upgrade is never
+used with the new code.
+"""
+
+import hashlib
+import itertools
+import logging
+import multiprocessing
+import os
+import socket
+import struct
+import threading
+import time
+from concurrent.futures import Future, ProcessPoolExecutor
+from concurrent.futures import wait as futures_wait
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing.connection import (
+    AuthenticationError,
+    Client,
+    Listener,
+    answer_challenge,
+    deliver_challenge,
+)
+from pathlib import Path
+from typing import Optional
+
+from . import audio_analysis, library_frame, track_index, utils
+from .audio_analysis import _analyze_one, _warm_worker
+
+_PROTOCOL_VERSION = 1
+_HANDSHAKE_TIMEOUT = 5.0
+
+# Everything a worker executes: a change to any of these makes a running
+# service incompatible
+_WORKER_MODULES = (audio_analysis, library_frame, track_index, utils)
+
+
+def _code_version() -> str:
+    """Protocol version plus a hash of the analysis code the workers run."""
+    digest = hashlib.blake2b(digest_size=8)
+    for module in _WORKER_MODULES:
+        with open(module.__file__, "rb") as f:
+            digest.update(f.read())
+    return f"{_PROTOCOL_VERSION}:{digest.hexdigest()}"
+
+
+def _key_path(socket_path: Path) -> Path:
+    return socket_path.with_name(socket_path.name + ".key")
+
+
+def _set_recv_timeout(conn, seconds: float) -> None:
+    """
+    Make blocking reads on conn fail with OSError after `seconds` (0 = wait
+    forever).  The option belongs to the socket, so setting it through a
+    duplicate descriptor applies to conn.
+    """
+    sock = socket.socket(fileno=os.dup(conn.fileno()))
+    try:
+        usec = int(round((seconds % 1) * 1e6))
+        sock.setsockopt(
+            socket.SOL_SOCKET, socket.SO_RCVTIMEO, struct.pack("ll", int(seconds), usec)
+        )
+    finally:
+        sock.close()
+
+
+def _hang_up(conn) -> None:
+    """
+    Shut down conn's socket in both directions, waking any thread blocked
+    reading it.  Only the reading thread closes conn: closing under a
+    blocked read lets the descriptor number be reused by a new connection
+    while the old read is still pending on it.
+    """
+    try:
+        sock = socket.socket(fileno=os.dup(conn.fileno()))
+    except OSError:
+        return  # already closed
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    finally:
+        sock.close()
+
+
+def _close(conn, send_lock: threading.Lock) -> None:
+    """Close conn once no other thread is writing to it."""
+    with send_lock:
+        conn.close()
+
+
+def _open_connection(path: Path, key_path: Path, timeout: float):
+    """Connect and authenticate as a client.  Reads stay bounded by timeout."""
+    conn = Client(str(path), family="AF_UNIX")
+    try:
+        _set_recv_timeout(conn, timeout)
+        key = key_path.read_bytes()
+        answer_challenge(conn, key)
+        deliver_challenge(conn, key)
+    except BaseException:
+        conn.close()
+        raise
+    return conn
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+# ---------------------------------------------------------------------------
+# Client
+# ---------------------------------------------------------------------------
+
+
+class ServiceExecutor:
+    """
+    Executor-like connection to a running analysis service.
+
+    submit(fn, task) sends one _analyze_one task — (idx, path, options) — and
+    returns a Future for its result; fn is accepted for signature
+    compatibility with ProcessPoolExecutor and must be _analyze_one.
+    workers is the service's pool size.
+    """
+
+    def __init__(self, conn, workers: int):
+        self.workers = workers
+        self._conn = conn
+        self._futures: dict = {}
+        self._ids = itertools.count()
+        self._send_lock = threading.Lock()
+        self._reader = threading.Thread(
+            target=self._read, name="analysis-service-reader", daemon=True
+        )
+        self._reader.start()
+
+    def submit(self, fn, task) -> Future:
+        if fn is not _analyze_one:
+            raise ValueError("the analysis service only runs _analyze_one")
+        future: Future = Future()
+        tid = next(self._ids)
+        self._futures[tid] = future
+        try:
+            with self._send_lock:
+                self._conn.send(("task", tid, task))
+        except (OSError, EOFError) as exc:
+            self._futures.pop(tid, None)
+            future.set_exception(ConnectionError(f"analysis service disconnected: {exc}"))
+        return future
+
+    def _read(self) -> None:
+        try:
+            while True:
+                kind, tid, payload = self._conn.recv()
+                future = self._futures.pop(tid, None)
+                if future is None or future.done():
+                    continue
+                if kind == "result":
+                    future.set_result(payload)
+                else:
+                    future.set_exception(RuntimeError(payload))
+        except (OSError, EOFError):
+            pass
+        _close(self._conn, self._send_lock)
+        # Connection closed: fail whatever the service never answered
+        for future in list(self._futures.values()):
+            if not future.done():
+                future.set_exception(ConnectionError("analysis service disconnected"))
+        self._futures.clear()
+
+    def shutdown(self, wait: bool = True, cancel_futures: bool = False) -> None:
+        if cancel_futures:
+            for future in list(self._futures.values()):
+                future.cancel()
+        elif wait and self._futures:
+            futures_wait(list(self._futures.values()))
+        # The reader sees EOF and closes the connection; the service then
+        # cancels this connection's queued work
+        _hang_up(self._conn)
+        self._reader.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.shutdown(wait=True)
+        return False
+
+
+def connect_service(
+    socket_path: str, timeout: float = _HANDSHAKE_TIMEOUT
+) -> Optional[ServiceExecutor]:
+    """
+    Connect to the analysis service at socket_path.
+
+    Returns None (after logging why at debug / warning level) when no service
+    is listening, the key does not match, the service runs different code, or
+    the handshake takes longer than `timeout` seconds.
+    """
+    path = Path(socket_path).expanduser()
+    key_path = _key_path(path)
+    if not path.exists() or not key_path.exists():
+        return None
+    try:
+        conn = _open_connection(path, key_path, timeout)
+    except (OSError, EOFError, ValueError, AuthenticationError) as exc:
+        # ValueError: no AF_UNIX support on this platform
+        logging.debug("Analysis service at %s not reachable: %s", path, exc)
+        return None
+    try:
+        conn.send(("hello", None, _code_version()))
+        reply = conn.recv()
+        _set_recv_timeout(conn, 0)  # results may take as long as they take
+    except (OSError, EOFError) as exc:
+        logging.debug("Analysis service handshake failed: %s", exc)
+        conn.close()
+        return None
+    if reply[0] != "hello":
+        logging.warning(
+            "Analysis service at %s runs a different version (%s) — restart it. "
+            "Using local workers.",
+            path,
+            reply[2],
+        )
+        conn.close()
+        return None
+    return ServiceExecutor(conn, reply[2])
+
+
+def stop_service(socket_path: str, timeout: float = _HANDSHAKE_TIMEOUT) -> bool:
+    """Ask the service at socket_path to shut down.  Returns False if none answered."""
+    path = Path(socket_path).expanduser()
+    key_path = _key_path(path)
+    if not path.exists() or not key_path.exists():
+        return False
+    try:
+        with _open_connection(path, key_path, timeout) as conn:
+            conn.send(("stop", None, None))
+    except (OSError, EOFError, ValueError, AuthenticationError):
+        return False
+    return True
+
+
+# ---------------------------------------------------------------------------
+# Server
+# ---------------------------------------------------------------------------
+
+
+class _Service:
+    """Warm worker pool plus the connection threads that feed it."""
+
+    def __init__(self, workers: int):
+        self.workers = workers
+        self.stop = threading.Event()
+        self.last_activity = time.monotonic()
+        self.version = _code_version()
+        self._pool_lock = threading.Lock()
+        self._pool = self._start_pool()
+
+    def _start_pool(self) -> ProcessPoolExecutor:
+        # Spawned, not forked: the pool is (re)started from a threaded process,
+        # and a fork can copy a lock another thread holds
+        pool = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=_warm_worker,
+        )
+        # One task per worker spawns (and warms) every process now rather
+        # than on the first client's tracks
+        futures_wait([pool.submit(_ping) for _ in range(self.workers)])
+        return pool
+
+    def submit(self, task) -> Future:
+        with self._pool_lock:
+            try:
+                return self._pool.submit(_analyze_one, task)
+            except BrokenProcessPool:
+                # A worker died (e.g. a decoder crashed): start a fresh pool
+                logging.warning("Analysis worker pool broke — restarting it.")
+                self._pool = self._start_pool()
+                return self._pool.submit(_analyze_one, task)
+
+    def shutdown(self) -> None:
+        """Stop the pool, abandoning running analyses so stopping is bounded."""
+        with self._pool_lock:
+            pool = self._pool
+            pool.shutdown(wait=False, cancel_futures=True)
+            for proc in list((pool._processes or {}).values()):
+                proc.terminate()
+            pool.shutdown(wait=True)
+
+    def handle(self, conn, key: bytes) -> None:
+        """Authenticate one client connection, then serve it until it closes."""
+        send_lock = threading.Lock()
+        futures: dict = {}
+
+        def send(message) -> None:
+            with send_lock:
+                try:
+                    conn.send(message)
+                except (OSError, EOFError, ValueError):
+                    pass  # client went away; its futures are cancelled below
+
+        def reply(tid, future: Future) -> None:
+            futures.pop(tid, None)
+            self.last_activity = time.monotonic()
+            if future.cancelled():
+                return
+            exc = future.exception()
+            if exc is not None:
+                send(("error", tid, f"{type(exc).__name__}: {exc}"))
+            else:
+                send(("result", tid, future.result()))
+
+        try:
+            _set_recv_timeout(conn, _HANDSHAKE_TIMEOUT)
+            try:
+                deliver_challenge(conn, key)
+                answer_challenge(conn, key)
+            except AuthenticationError:
+                logging.warning("Analysis service: rejected a connection with a bad key.")
+                return
+            kind, _, version = conn.recv()
+            _set_recv_timeout(conn, 0)
+            if kind == "stop":
+                self.stop.set()
+                return
+            if kind != "hello" or version != self.version:
+                send(("mismatch", None, self.version))
+                return
+            send(("hello", None, self.workers))
+            while True:
+                kind, tid, task = conn.recv()
+                self.last_activity = time.monotonic()
+                if kind != "task":
+                    continue
+                future = self.submit(task)
+                futures[tid] = future
+                future.add_done_callback(lambda f, tid=tid: reply(tid, f))
+        except (OSError, EOFError):
+            pass
+        finally:
+            for future in list(futures.values()):
+                future.cancel()
+            _close(conn, send_lock)  # a done-callback may be mid-send
+
+
+def serve(socket_path: str, workers: int = 0, idle_timeout: Optional[float] = None) -> None:
+    """
+    Run the analysis service in the foreground until stop_service(), Ctrl-C,
+    or `idle_timeout` seconds without any client activity.
+
+    Args:
+        socket_path:  Unix socket to listen on (its directory is created;
+                      a stale socket from a crashed service is replaced).
+        workers:      Warm worker processes (default os.cpu_count() or 4).
+        idle_timeout: Optional seconds of inactivity after which the service
+                      exits on its own.
+    """
+    if workers <= 0:
+        workers = os.cpu_count() or 4
+    path = Path(socket_path).expanduser()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    if path.exists():
+        probe = connect_service(str(path))
+        if probe is not None:
+            probe.shutdown(wait=False)
+            raise RuntimeError(f"an analysis service is already running at {path}")
+        path.unlink()
+
+    key = os.urandom(32)
+    key_path = _key_path(path)
+    fd = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+    with os.fdopen(fd, "wb") as f:
+        f.write(key)
+
+    started = time.perf_counter()
+    service = _Service(workers)
+    # No authkey here: Listener.accept() would authenticate inline, so one
+    # stalled client could block every other connection
+    listener = Listener(str(path), family="AF_UNIX")
+    os.chmod(path, 0o600)
+    logging.info(
+        "Analysis service: %d warm workers ready in %.1f s, listening on %s.",
+        workers,
+        time.perf_counter() - started,
+        path,
+    )
+
+    def accept_loop() -> None:
+        while True:
+            try:
+                conn = listener.accept()
+            except OSError:
+                return  # listener closed
+            if service.stop.is_set():
+                conn.close()
+                return
+            threading.Thread(target=service.handle, args=(conn, key), daemon=True).start()
+
+    acceptor = threading.Thread(target=accept_loop, name="analysis-service-accept", daemon=True)
+    acceptor.start()
+    try:
+        while not service.stop.wait(1.0):
+            if idle_timeout and time.monotonic() - service.last_activity >= idle_timeout:
+                logging.info("Analysis service: idle for %.0f s — exiting.", idle_timeout)
+                break
+    except KeyboardInterrupt:
+        pass
+    finally:
+        # Closing a listening socket does not wake a blocked accept(), so
+        # connect once to let the accept thread see the stop flag
+        service.stop.set()
+        try:
+            with socket.socket(socket.AF_UNIX) as wake:
+                wake.connect(str(path))
+        except OSError:
+            pass
+        acceptor.join(_HANDSHAKE_TIMEOUT)
+        listener.close()
+        service.shutdown()
+        for p in (path, key_path):
+            try:
+                p.unlink()
+            except OSError:
+                pass
+        logging.info("Analysis service stopped.")
@@ -3,9 +3,27 @@ Local audio feature extraction using libROSA.
 
 Extracts BPM (tempo), Energy (RMS mean), SpectralBrightness (spectral centroid mean),
 and ZCR (zero-crossing rate mean) from audio files without any external API calls.
+Either the first N seconds are analyzed ("full") or a few short windows spread
+across the track ("sampled"); compare_analysis_modes() measures the difference.
+Audio is decoded block by block with running statistics, so memory per worker
+does not grow with file length or sample rate.
 
 Results are cached in a SQLite database keyed by (path, mtime) to avoid
-re-analyzing unchanged files. Falls back gracefully if librosa is not installed.
+re-analyzing unchanged files.  Each row also stores a content fingerprint
+(file size + hash of a few sampled byte ranges), so files that were moved or
+renamed are matched to their existing features and only their path is
+rewritten.
+
+Optionally (extended=True / AUDIO_EXTENDED_FEATURES) the same decoded frames
+also produce a DESCRIPTOR_NAMES vector — MFCC means/variances, chroma and key,
+onset density, intro/outro energy — stored as a versioned float32 blob and
+read back with load_descriptors().
+
+For very large first runs the work can be split across machines:
+export_analysis_shards() writes the uncached work list as N shard files,
+analyze_shard() analyzes one shard into its own SQLite file (no library or
+network access needed beyond the audio files), and merge_analysis_shards()
+loads the results back into the main cache. Falls back gracefully if librosa is not installed.
 
 Usage in pipeline.py:
     from .audio_analysis import analyze_library
@@ -14,21 +32,33 @@ Usage in pipeline.py:
 
 from __future__ import annotations
 
+import hashlib
+import io
+import json
 import logging
 import os
 import sqlite3
+import stat
 import time
-from concurrent.futures import ProcessPoolExecutor, as_completed
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+from itertools import islice
 from pathlib import Path
 from typing import Optional
 from urllib.parse import unquote
 
+import numpy as np
 import pandas as pd
 from tqdm import tqdm
 
+from .library_frame import working_copy
+from .track_index import track_keys
+from .utils import sqlite_lookup
+
 try:
     import librosa
-    import numpy as np
+    import soundfile as sf
+    import soxr
 
     LIBROSA_AVAILABLE = True
 except ImportError:
@@ -47,20 +77,99 @@ CREATE TABLE IF NOT EXISTS audio_features (
     energy    REAL,
     spectral_brightness REAL,
     zcr       REAL,
-    analyzed_at INTEGER
+    analyzed_at INTEGER,
+    fingerprint TEXT,
+    descriptors BLOB,
+    descriptor_version INTEGER
 );
 """
 
+_FEATURE_KEYS = ("bpm", "energy", "spectral_brightness", "zcr")
+_FEATURE_SQL = ", ".join(_FEATURE_KEYS)
+# Every stored column but the (path, mtime) key, for row copies
+_ROW_SQL = f"{_FEATURE_SQL}, analyzed_at, fingerprint, descriptors, descriptor_version"
+
+# Columns added after the first release: (name, type), migrated in _init_db
+_ADDED_COLUMNS = (
+    ("fingerprint", "TEXT"),
+    ("descriptors", "BLOB"),
+    ("descriptor_version", "INTEGER"),
+)
+
+# Extended descriptors: one little-endian float32 vector per track, laid out
+# as DESCRIPTOR_NAMES.  Bump DESCRIPTOR_VERSION whenever the layout or the
+# way a value is computed changes — rows with another version are recomputed.
+DESCRIPTOR_VERSION = 1
+_N_MFCC = 13
+_PITCHES = ("C", "C#", "D", "D#", "E", "F", "F#", "G", "G#", "A", "A#", "B")
+DESCRIPTOR_NAMES = (
+    tuple(f"mfcc{i}_mean" for i in range(_N_MFCC))
+    + tuple(f"mfcc{i}_var" for i in range(_N_MFCC))
+    + tuple(f"chroma_{p}" for p in _PITCHES)
+    + (
+        "key",  # tonic pitch class, 0 = C
+        "key_mode",  # 1 major, 0 minor
+        "key_strength",  # correlation with the best key profile
+        "onset_density",  # onsets per second
+        "intro_energy",  # RMS mean of the first _EDGE_SEC seconds
+        "outro_energy",  # RMS mean of the last _EDGE_SEC seconds
+    )
+)
+_DESCRIPTOR_DTYPE = np.dtype("<f4")
+
+# Bytes hashed at the start, middle and end of a file for its fingerprint
+_FP_CHUNK = 8192
+
 
 def _init_db(db_path: str) -> sqlite3.Connection:
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.execute("PRAGMA journal_mode=WAL")
     conn.execute(_SCHEMA)
+    # Caches created by older versions
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(audio_features)")}
+    for name, sql_type in _ADDED_COLUMNS:
+        if name not in cols:
+            conn.execute(f"ALTER TABLE audio_features ADD COLUMN {name} {sql_type}")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_audio_features_fingerprint "
+        "ON audio_features(fingerprint)"
+    )
     conn.commit()
     return conn
 
 
+def _file_fingerprint(path: str) -> Optional[str]:
+    """
+    Cheap content identity for an audio file: "<size>:<hash>", where the hash
+    covers _FP_CHUNK bytes at the start, middle and end of the file.
+    Returns None if the file cannot be read.
+    """
+    try:
+        size = os.path.getsize(path)
+        digest = hashlib.blake2b(digest_size=12)
+        with open(path, "rb") as f:
+            for offset in sorted(
+                {0, max(0, size // 2 - _FP_CHUNK // 2), max(0, size - _FP_CHUNK)}
+            ):
+                f.seek(offset)
+                digest.update(f.read(_FP_CHUNK))
+    except OSError:
+        return None
+    return f"{size}:{digest.hexdigest()}"
+
+
+def _size_matches(cached: dict, size: int) -> bool:
+    """False if the cached row's fingerprint records another file size."""
+    fingerprint = cached.get("fingerprint")
+    return not fingerprint or fingerprint.split(":", 1)[0] == str(size)
+
+
+def _matches_file(cached: dict, st: os.stat_result) -> bool:
+    """True if a cached row was computed from the file as it is now (mtime and size)."""
+    return cached.get("mtime") == st.st_mtime and _size_matches(cached, st.st_size)
+
+
 def _resolve_path(raw: str) -> str:
     """Decode file://localhost URLs to plain filesystem paths."""
     if raw.startswith("file://localhost"):
@@ -70,83 +179,72 @@ def _resolve_path(raw: str) -> str:
     return raw
 
 
-def _cache_get(conn: sqlite3.Connection, path: str, mtime: float) -> Optional[dict]:
-    row = conn.execute(
-        "SELECT bpm, energy, spectral_brightness, zcr "
-        "FROM audio_features WHERE path=? AND mtime=?",
-        (path, mtime),
-    ).fetchone()
-    if row:
-        return {
-            "bpm": row[0],
-            "energy": row[1],
-            "spectral_brightness": row[2],
-            "zcr": row[3],
-        }
-    return None
+def _pack_descriptors(features: dict) -> tuple[Optional[bytes], Optional[int]]:
+    """(blob, version) columns for a feature dict; (None, None) without descriptors."""
+    vec = features.get("descriptors")
+    if vec is None:
+        return None, None
+    return np.asarray(vec, dtype=_DESCRIPTOR_DTYPE).tobytes(), DESCRIPTOR_VERSION
+
+
+def _unpack_descriptors(blob: Optional[bytes], version: Optional[int]) -> Optional[np.ndarray]:
+    """Descriptor vector from its stored columns, or None if absent or stale."""
+    if blob is None or version != DESCRIPTOR_VERSION:
+        return None
+    vec = np.frombuffer(blob, dtype=_DESCRIPTOR_DTYPE)
+    if len(vec) != len(DESCRIPTOR_NAMES):
+        return None
+    return vec
 
 
 def _cache_set(
-    conn: sqlite3.Connection, path: str, mtime: float, features: dict
+    conn: sqlite3.Connection,
+    path: str,
+    mtime: float,
+    features: dict,
+    fingerprint: Optional[str] = None,
 ) -> None:
-    conn.execute(
-        """INSERT OR REPLACE INTO audio_features
-           (path, mtime, bpm, energy, spectral_brightness, zcr, analyzed_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
-        (
-            path,
-            mtime,
-            features.get("bpm"),
-            features.get("energy"),
-            features.get("spectral_brightness"),
-            features.get("zcr"),
-            int(time.time()),
-        ),
-    )
-    conn.commit()
+    _cache_set_batch(conn, [(path, mtime, features, fingerprint)])
 
 
 def _cache_get_batch(
     conn: sqlite3.Connection, paths_mtimes: list[tuple[str, float]]
 ) -> dict[str, dict]:
-    """Batch cache lookup. Returns {path: {bpm, energy, spectral_brightness, zcr}}."""
-    if not paths_mtimes:
-        return {}
-    result = {}
-    # SQLite max variables is 999; batch in chunks of 400 (2 params each)
-    chunk_size = 400
-    for i in range(0, len(paths_mtimes), chunk_size):
-        chunk = paths_mtimes[i : i + chunk_size]
-        placeholders = " OR ".join(["(path=? AND mtime=?)"] * len(chunk))
-        params = []
-        for p, m in chunk:
-            params.extend([p, m])
-        rows = conn.execute(
-            f"SELECT path, bpm, energy, spectral_brightness, zcr "
-            f"FROM audio_features WHERE {placeholders}",
-            params,
-        ).fetchall()
-        for row in rows:
-            result[row[0]] = {
-                "bpm": row[1],
-                "energy": row[2],
-                "spectral_brightness": row[3],
-                "zcr": row[4],
-            }
-    return result
+    """
+    Batch cache lookup (one temp-table join, see utils.sqlite_lookup).
+
+    Returns {path: {bpm, energy, spectral_brightness, zcr, fingerprint,
+    descriptor_version}}.
+    """
+    cols = _FEATURE_KEYS + ("fingerprint", "descriptor_version")
+    rows = sqlite_lookup(conn, "audio_features", ("path", "mtime"), cols, paths_mtimes)
+    return {path: dict(zip(cols, row)) for (path, _), row in rows.items()}
+
+
+def _cache_get_paths(
+    conn: sqlite3.Connection, paths: list[str]
+) -> dict[str, dict]:
+    """
+    Path-only cache lookup (any mtime).
+    Returns {path: {bpm, energy, ..., mtime, fingerprint, descriptor_version}}.
+    """
+    cols = _FEATURE_KEYS + ("mtime", "fingerprint", "descriptor_version")
+    rows = sqlite_lookup(conn, "audio_features", "path", cols, paths)
+    return {path: dict(zip(cols, row)) for path, row in rows.items()}
 
 
 def _cache_set_batch(
-    conn: sqlite3.Connection, records: list[tuple[str, float, dict]]
+    conn: sqlite3.Connection,
+    records: list[tuple[str, float, dict, Optional[str]]],
 ) -> None:
-    """Batch cache write in a single transaction."""
+    """Batch cache write in a single transaction.  Records: (path, mtime, features, fingerprint)."""
     if not records:
         return
     now = int(time.time())
     conn.executemany(
-        """INSERT OR REPLACE INTO audio_features
-           (path, mtime, bpm, energy, spectral_brightness, zcr, analyzed_at)
-           VALUES (?, ?, ?, ?, ?, ?, ?)""",
+        f"""INSERT OR REPLACE INTO audio_features
+            (path, mtime, {_ROW_SQL})
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)""",
         [
             (
                 path,
@@ -156,62 +254,974 @@ def _cache_set_batch(
                 features.get("spectral_brightness"),
                 features.get("zcr"),
                 now,
+                fingerprint,
+                *_pack_descriptors(features),
             )
-            for path, mtime, features in records
+            for path, mtime, features, fingerprint in records
         ],
     )
     conn.commit()
 
 
-def analyze_track(file_path: str, duration: int = 120) -> dict:
+def _cache_get_fingerprints(
+    conn: sqlite3.Connection, fingerprints: list[str]
+) -> dict[str, dict]:
+    """
+    Content lookup.  Returns {fingerprint: {path, bpm, energy, ..., fingerprint,
+    descriptor_version}} (any one row per fingerprint).
+    """
+    cols = ("path",) + _FEATURE_KEYS + ("fingerprint", "descriptor_version")
+    rows = sqlite_lookup(conn, "audio_features", "fingerprint", cols, fingerprints)
+    return {fp: dict(zip(cols, row)) for fp, row in rows.items()}
+
+
+def _cache_relocate(
+    conn: sqlite3.Connection, moves: list[tuple[str, str, float]]
+) -> None:
+    """
+    Point cached rows at the files' new locations.  Moves: (old_path,
+    new_path, new_mtime).  The old row is kept only if that file still exists
+    (a duplicate copy rather than a move).
+    """
+    if not moves:
+        return
+    conn.executemany(
+        f"""INSERT OR REPLACE INTO audio_features
+            (path, mtime, {_ROW_SQL})
+            SELECT ?, ?, {_ROW_SQL}
+            FROM audio_features WHERE path=?""",
+        [(new, mtime, old) for old, new, mtime in moves],
+    )
+    new_paths = {new for _, new, _ in moves}
+    gone = {old for old, _, _ in moves if old not in new_paths and not os.path.exists(old)}
+    conn.executemany("DELETE FROM audio_features WHERE path=?", [(p,) for p in gone])
+    conn.commit()
+
+
+# Every track is resampled to this rate on load, whatever its native rate
+# (96 kHz FLAC costs 4x as much to analyze as it would at 22.05 kHz, and none
+# of the features look above 11 kHz anyway).
+ANALYSIS_SR = 22050
+_N_FFT = 2048
+_HOP = 512
+
+# Tag BPMs outside this range are treated as junk (same bounds as itunes.py)
+_TRUSTED_BPM = (40, 300)
+
+
+def _trusted_bpm(value) -> bool:
+    """True if value is a usable BPM from tags / the iTunes library."""
+    try:
+        bpm = float(value)
+    except (TypeError, ValueError):
+        return False
+    return _TRUSTED_BPM[0] <= bpm <= _TRUSTED_BPM[1]
+
+
+# Tempogram columns computed at a time by _estimate_tempo()
+_TEMPOGRAM_CHUNK = 512
+
+
+def _estimate_tempo(onset_env: np.ndarray, sr: int) -> float:
+    """
+    librosa.feature.tempo() on an onset envelope, with the time-averaged
+    autocorrelation tempogram accumulated in chunks of columns.
+
+    The full tempogram is ~3 KB per onset frame (~130 KB per second of
+    audio); summing it chunk by chunk gives the same estimate at constant
+    memory.
+    """
+    win = int(librosa.time_to_frames(8.0, sr=sr, hop_length=_HOP))
+    n = len(onset_env)
+    half = win // 2
+    padded = np.pad(onset_env, (half, half), mode="linear_ramp", end_values=(0, 0))
+    total = np.zeros(win)
+    for start in range(0, n, _TEMPOGRAM_CHUNK):
+        stop = min(start + _TEMPOGRAM_CHUNK, n)
+        tg = librosa.feature.tempogram(
+            onset_envelope=padded[start : stop + win - 1],
+            sr=sr,
+            hop_length=_HOP,
+            win_length=win,
+            center=False,
+        )
+        total += tg.sum(axis=1)
+    mean = (total / max(n, 1))[:, None]
+    return float(librosa.feature.tempo(tg=mean, sr=sr, hop_length=_HOP, aggregate=None)[0])
+
+
+def _buffer_features(y, sr: int, need_bpm: bool = True) -> dict:
+    """
+    bpm / energy / spectral_brightness / zcr for one decoded mono buffer.
+
+    One magnitude STFT feeds RMS, spectral centroid and (via a mel
+    spectrogram) the onset envelope for tempo, instead of each feature
+    framing the signal again.  With need_bpm=False the mel/onset/tempo work
+    is skipped and bpm is None.
+    """
+    S = np.abs(librosa.stft(y, n_fft=_N_FFT, hop_length=_HOP))
+
+    # Energy (RMS amplitude mean)
+    rms = librosa.feature.rms(S=S, frame_length=_N_FFT, hop_length=_HOP)
+    energy = float(np.mean(rms))
+
+    # Spectral brightness — spectral centroid normalised by Nyquist frequency
+    centroid = librosa.feature.spectral_centroid(S=S, sr=sr, n_fft=_N_FFT, hop_length=_HOP)
+    spectral_brightness = float(np.mean(centroid)) / (sr / 2)
+
+    # Zero-crossing rate (indicator of noisiness / consonance)
+    zcr_feat = librosa.feature.zero_crossing_rate(y, frame_length=_N_FFT, hop_length=_HOP)
+    zcr = float(np.mean(zcr_feat))
+
+    # Tempo from the onset envelope — the same estimate beat_track() makes,
+    # without its dynamic-programming beat search (beat positions are unused)
+    bpm = None
+    if need_bpm:
+        mel = librosa.feature.melspectrogram(S=S**2, sr=sr, n_fft=_N_FFT, hop_length=_HOP)
+        onset_env = librosa.onset.onset_strength(
+            S=librosa.power_to_db(mel), sr=sr, hop_length=_HOP
+        )
+        tempo = _estimate_tempo(onset_env, sr)
+        bpm = tempo if tempo else None
+
+    return {
+        "bpm": bpm,
+        "energy": energy,
+        "spectral_brightness": spectral_brightness,
+        "zcr": zcr,
+    }
+
+
+def _sample_offsets(length: float, windows: int, window_sec: float) -> list[float]:
+    """
+    Start offsets of `windows` windows centred at 1/(n+1), 2/(n+1), ... of the
+    track (25% / 50% / 75% for three windows), clamped inside the track.
+    """
+    last = max(0.0, length - window_sec)
+    return [
+        min(last, max(0.0, length * (i + 1) / (windows + 1) - window_sec / 2))
+        for i in range(windows)
+    ]
+
+
+def _aggregate_windows(per_window: list[dict]) -> dict:
+    """Mean of the spectral features, median of the per-window tempo."""
+    if not per_window:
+        return {}
+    bpms = [f["bpm"] for f in per_window if f.get("bpm")]
+    result = {"bpm": float(np.median(bpms)) if bpms else None}
+    for key in ("energy", "spectral_brightness", "zcr"):
+        result[key] = float(np.mean([f[key] for f in per_window]))
+    return result
+
+
+# Streaming decode reads this many native-rate frames at a time, so a worker's
+# peak memory is a few MB whatever the file's length, sample rate or channels.
+_STREAM_BLOCK_FRAMES = 1 << 18
+
+# Seconds at each end of a track averaged into intro_energy / outro_energy
+_EDGE_SEC = 15.0
+_EDGE_FRAMES = int(_EDGE_SEC * ANALYSIS_SR / _HOP)
+
+# Krumhansl-Kessler key profiles, tonic first
+_MAJOR_PROFILE = np.array([6.35, 2.23, 3.48, 2.33, 4.38, 4.09, 2.52, 5.19, 2.39, 3.66, 2.29, 2.88])
+_MINOR_PROFILE = np.array([6.33, 2.68, 3.52, 5.38, 2.60, 3.53, 2.54, 4.75, 3.98, 2.69, 3.34, 3.17])
+
+
+def _estimate_key(chroma: np.ndarray) -> tuple[int, int, float]:
+    """(tonic pitch class, 1 major / 0 minor, correlation) for a mean chroma vector."""
+    best = (0, 1, -1.0)
+    if not np.any(chroma):
+        return best
+    for mode, profile in ((1, _MAJOR_PROFILE), (0, _MINOR_PROFILE)):
+        for tonic in range(12):
+            r = float(np.corrcoef(chroma, np.roll(profile, tonic))[0, 1])
+            if r > best[2]:
+                best = (tonic, mode, r)
+    return best
+
+
+class _StreamAccumulator:
+    """
+    Running bpm / energy / spectral_brightness / zcr statistics over a mono
+    ANALYSIS_SR signal pushed in blocks of any size.
+
+    Frames are the same n_fft / hop frames _buffer_features() uses (without
+    centre padding); the n_fft - hop samples that overlap the next block are
+    carried over.  Only per-frame sums and the onset envelope (one float per
+    hop, ~170 bytes per second of audio) are kept.
+
+    With extended=True the same frames also feed the DESCRIPTOR_NAMES
+    statistics (MFCC sums and squares, chroma sums, the RMS of the first and
+    last _EDGE_SEC seconds).
+    """
+
+    def __init__(self, need_bpm: bool, extended: bool = False):
+        self.need_bpm = need_bpm
+        self.extended = extended
+        self.tail = np.zeros(0, dtype=np.float32)
+        self.frames = 0
+        self.rms_sum = self.centroid_sum = self.zcr_sum = 0.0
+        self.mel_basis = (
+            librosa.filters.mel(sr=ANALYSIS_SR, n_fft=_N_FFT) if need_bpm or extended else None
+        )
+        self.db_max = -np.inf
+        self.prev_db = None
+        self.onset: list = []
+        if extended:
+            self.chroma_basis = librosa.filters.chroma(sr=ANALYSIS_SR, n_fft=_N_FFT, tuning=0.0)
+            self.mfcc_sum = np.zeros(_N_MFCC)
+            self.mfcc_sq = np.zeros(_N_MFCC)
+            self.chroma_sum = np.zeros(12)
+            self.intro_rms: list = []
+            self.outro_rms: deque = deque(maxlen=_EDGE_FRAMES)
+
+    def push(self, y: np.ndarray) -> None:
+        buf = np.concatenate((self.tail, y)) if len(self.tail) else y
+        if len(buf) < _N_FFT:
+            self.tail = buf
+            return
+        n = 1 + (len(buf) - _N_FFT) // _HOP
+        span = buf[: (n - 1) * _HOP + _N_FFT]
+        self.tail = buf[n * _HOP:]
+
+        S = np.abs(librosa.stft(span, n_fft=_N_FFT, hop_length=_HOP, center=False))
+        self.frames += S.shape[1]
+        rms = librosa.feature.rms(S=S, frame_length=_N_FFT, hop_length=_HOP)[0]
+        self.rms_sum += float(rms.sum())
+        self.centroid_sum += float(
+            librosa.feature.spectral_centroid(
+                S=S, sr=ANALYSIS_SR, n_fft=_N_FFT, hop_length=_HOP
+            ).sum()
+        )
+        self.zcr_sum += float(
+            librosa.feature.zero_crossing_rate(
+                span, frame_length=_N_FFT, hop_length=_HOP, center=False
+            ).sum()
+        )
+        if self.mel_basis is None:
+            return
+        power = S**2
+        # Same onset strength as librosa.onset.onset_strength() on a dB
+        # mel spectrogram; the 80 dB floor follows the running peak
+        # instead of the (unknown) whole-file peak.
+        db = librosa.power_to_db(self.mel_basis @ power, top_db=None)
+        self.db_max = max(self.db_max, float(db.max()))
+        np.maximum(db, self.db_max - 80.0, out=db)
+        prev = db[:, :1] if self.prev_db is None else self.prev_db
+        diff = np.diff(np.concatenate((prev, db), axis=1), axis=1)
+        self.onset.append(np.maximum(0.0, diff).mean(axis=0).astype(np.float32))
+        self.prev_db = db[:, -1:]
+
+        if self.extended:
+            mfcc = librosa.feature.mfcc(S=db, n_mfcc=_N_MFCC)
+            self.mfcc_sum += mfcc.sum(axis=1)
+            self.mfcc_sq += (mfcc.astype(np.float64) ** 2).sum(axis=1)
+            chroma = self.chroma_basis @ power
+            chroma /= np.maximum(chroma.max(axis=0, keepdims=True), np.finfo(np.float32).tiny)
+            self.chroma_sum += chroma.sum(axis=1)
+            if len(self.intro_rms) < _EDGE_FRAMES:
+                self.intro_rms.extend(rms[: _EDGE_FRAMES - len(self.intro_rms)].tolist())
+            self.outro_rms.extend(rms[-_EDGE_FRAMES:].tolist())
+
+    def _descriptors(self, onset_env: np.ndarray) -> np.ndarray:
+        mfcc_mean = self.mfcc_sum / self.frames
+        mfcc_var = np.maximum(self.mfcc_sq / self.frames - mfcc_mean**2, 0.0)
+        chroma = self.chroma_sum / self.frames
+        onsets = librosa.onset.onset_detect(
+            onset_envelope=onset_env, sr=ANALYSIS_SR, hop_length=_HOP
+        )
+        seconds = self.frames * _HOP / ANALYSIS_SR
+        return np.concatenate(
+            (
+                mfcc_mean,
+                mfcc_var,
+                chroma,
+                _estimate_key(chroma),
+                (
+                    len(onsets) / seconds,
+                    float(np.mean(self.intro_rms)),
+                    float(np.mean(self.outro_rms)),
+                ),
+            )
+        ).astype(_DESCRIPTOR_DTYPE)
+
+    def result(self) -> dict:
+        if not self.frames:
+            if not len(self.tail):
+                return {}
+            # Shorter than one frame — zero-pad it to one
+            self.push(np.zeros(_N_FFT - len(self.tail), dtype=np.float32))
+        onset_env = np.concatenate(self.onset) if self.onset else None
+        bpm = None
+        if self.need_bpm:
+            tempo = _estimate_tempo(onset_env, ANALYSIS_SR)
+            bpm = tempo if tempo else None
+        result = {
+            "bpm": bpm,
+            "energy": self.rms_sum / self.frames,
+            "spectral_brightness": self.centroid_sum / self.frames / (ANALYSIS_SR / 2),
+            "zcr": self.zcr_sum / self.frames,
+        }
+        if self.extended:
+            result["descriptors"] = self._descriptors(onset_env)
+        return result
+
+
+def _stream_features(
+    source, offset: float, duration: float, need_bpm: bool, extended: bool = False
+) -> Optional[dict]:
+    """
+    Features of `duration` seconds from `offset`, decoded block by block.
+
+    Each block is downmixed, resampled to ANALYSIS_SR with a streaming soxr
+    resampler (no seams between blocks) and pushed into a _StreamAccumulator.
+    Returns None if soundfile cannot open the source, so the caller can fall
+    back to librosa.load().
+    """
+    try:
+        f = sf.SoundFile(source)
+    except RuntimeError:  # LibsndfileError: format not supported by libsndfile
+        return None
+    with f:
+        native_sr = f.samplerate
+        if offset:
+            f.seek(min(int(offset * native_sr), f.frames))
+        remaining = int(duration * native_sr)
+        resampler = (
+            soxr.ResampleStream(native_sr, ANALYSIS_SR, 1, dtype="float32", quality="HQ")
+            if native_sr != ANALYSIS_SR
+            else None
+        )
+        acc = _StreamAccumulator(need_bpm, extended)
+        while remaining > 0:
+            block = f.read(min(_STREAM_BLOCK_FRAMES, remaining), dtype="float32", always_2d=True)
+            if not len(block):
+                break
+            remaining -= len(block)
+            y = block.mean(axis=1) if block.shape[1] > 1 else block[:, 0]
+            acc.push(resampler.resample_chunk(y) if resampler else y)
+        if resampler:
+            acc.push(resampler.resample_chunk(np.zeros(0, dtype=np.float32), last=True))
+    return acc.result()
+
+
+def _load_features(
+    source, offset: float, duration: float, need_bpm: bool, extended: bool = False
+) -> dict:
+    """
+    Features of one span of audio: streamed when libsndfile can read the
+    format (WAV, FLAC, AIFF, Ogg, MP3), otherwise decoded whole with
+    librosa.load() (AAC/ALAC via audioread).
+    """
+    features = _stream_features(source(), offset, duration, need_bpm, extended)
+    if features is not None:
+        return features
+    y, sr = librosa.load(source(), sr=ANALYSIS_SR, mono=True, offset=offset, duration=duration)
+    if len(y) == 0:
+        return {}
+    if not extended:
+        return _buffer_features(y, sr, need_bpm)
+    acc = _StreamAccumulator(need_bpm, extended)
+    acc.push(y)
+    return acc.result()
+
+
+def _edge_energy(source, offset: float) -> Optional[float]:
+    """RMS mean of the _EDGE_SEC seconds from offset (intro / outro energy)."""
+    return _load_features(source, offset, _EDGE_SEC, need_bpm=False).get("energy")
+
+
+def _aggregate_descriptors(per_window: list[np.ndarray]) -> np.ndarray:
+    """Mean of per-window descriptor vectors, with the key re-estimated from the mean chroma."""
+    vec = np.mean(per_window, axis=0)
+    chroma_at = 2 * _N_MFCC
+    key_at = chroma_at + 12
+    vec[key_at : key_at + 3] = _estimate_key(vec[chroma_at:key_at])
+    return vec.astype(_DESCRIPTOR_DTYPE)
+
+
+def _decode_features(
+    source,
+    duration: int,
+    mode: str,
+    windows: int,
+    window_sec: float,
+    need_bpm: bool,
+    extended: bool = False,
+) -> dict:
+    """
+    analyze_track() body.  source() returns something librosa can open — the
+    path, or a fresh BytesIO over prefetched file bytes.
+
+    With extended, the intro / outro energy needs audio the plan did not
+    decode, so it is read in extra _EDGE_SEC decodes: the outro alone in full
+    mode on tracks longer than `duration`, both ends in sampled mode (the
+    windows never reach them).  In sampled mode that is 30 s decoded on top
+    of the default 3 x 10 s windows — about twice the sampled decode time.
+    The windows are not moved to the edges, so the scalar features are the
+    same with or without extended.
+    """
+    length = librosa.get_duration(path=source()) if mode == "sampled" or extended else None
+    if mode == "sampled" and length > windows * window_sec:
+        per_window = []
+        for offset in _sample_offsets(length, windows, window_sec):
+            features = _load_features(source, offset, window_sec, need_bpm, extended)
+            if features:
+                per_window.append(features)
+        result = _aggregate_windows(per_window)
+        if result and extended:
+            vec = _aggregate_descriptors([f["descriptors"] for f in per_window])
+            # The windows never cover the ends of the track
+            edges = _edge_energy(source, 0.0), _edge_energy(source, max(0.0, length - _EDGE_SEC))
+            vec[-2:] = [np.nan if e is None else e for e in edges]
+            result["descriptors"] = vec
+        return result
+
+    result = _load_features(source, 0.0, duration, need_bpm, extended)
+    if result and extended and length > duration:
+        # Only the start was decoded — read the last seconds for the outro
+        outro = _edge_energy(source, max(0.0, length - _EDGE_SEC))
+        result["descriptors"][-1] = np.nan if outro is None else outro
+    return result
+
+
+def analyze_track(
+    file_path: str,
+    duration: int = 120,
+    mode: str = "full",
+    windows: int = 3,
+    window_sec: float = 10.0,
+    need_bpm: bool = True,
+    data: Optional[bytes] = None,
+    extended: bool = False,
+) -> dict:
     """
     Extract audio features from a single audio file using libROSA.
 
-    Analyzes the first `duration` seconds of the track to keep runtime reasonable.
+    Audio is decoded as mono and resampled to ANALYSIS_SR, streamed in
+    bounded blocks where libsndfile supports the format.  Pass
+    need_bpm=False when the track already has a trusted BPM — tempo
+    estimation is then skipped and bpm is None.
+
+    mode="full" analyzes the first `duration` seconds of the track.
+    mode="sampled" decodes only `windows` short windows of `window_sec`
+    seconds spread across the track (offset-based loads) and aggregates them —
+    roughly duration / (windows * window_sec) times less decoding and beat
+    tracking.  Tracks too short to hold the windows are analyzed in full.
+
+    data, if given, is the file's content already read into memory (see the
+    read-ahead in analyze_library); formats that cannot be decoded from memory
+    fall back to reading file_path.
+
+    extended=True also computes the DESCRIPTOR_NAMES vector from the same
+    decoded frames, plus separate _EDGE_SEC reads for intro / outro energy
+    where those seconds were not decoded (see _decode_features — in sampled
+    mode this roughly doubles the decode time).
 
     Returns:
-        dict with keys: bpm, energy, spectral_brightness, zcr.
+        dict with keys: bpm, energy, spectral_brightness, zcr — and
+        descriptors (float32 array) when extended.
         Returns {} if librosa is not installed or the file cannot be read.
         Never raises.
     """
     if not LIBROSA_AVAILABLE:
         return {}
+    options = (duration, mode, windows, window_sec, need_bpm, extended)
+    if data is not None:
+        try:
+            return _decode_features(lambda: io.BytesIO(data), *options)
+        except Exception as exc:
+            logging.debug("In-memory decode failed for %s (%s) — reading the file.", file_path, exc)
     try:
-        y, sr = librosa.load(file_path, sr=None, mono=True, duration=duration)
-        if len(y) == 0:
-            return {}
+        return _decode_features(lambda: file_path, *options)
+    except Exception as exc:
+        logging.warning("Audio analysis failed for %s: %s", file_path, exc)
+        return {}
 
-        # BPM via beat tracking
-        tempo, _ = librosa.beat.beat_track(y=y, sr=sr)
-        bpm = float(tempo) if tempo else None
 
-        # Energy (RMS amplitude mean)
-        rms = librosa.feature.rms(y=y)
-        energy = float(np.mean(rms))
+def compare_analysis_modes(
+    paths: list[str],
+    duration: int = 120,
+    windows: int = 3,
+    window_sec: float = 10.0,
+) -> dict:
+    """
+    Analyze each file in both modes (no cache) and report how far the sampled
+    features are from the full ones, plus the wall-clock speed-up.
 
-        # Spectral brightness — spectral centroid normalised by Nyquist frequency
-        centroid = librosa.feature.spectral_centroid(y=y, sr=sr)
-        spectral_brightness = float(np.mean(centroid)) / (sr / 2)
+    Returns a dict with keys: tracks, full_seconds, sampled_seconds, speedup,
+    bpm_within_2 (fraction of tracks whose BPMs agree within 2 BPM),
+    bpm_octave_match (same, allowing half/double tempo), and features —
+    {feature: {"mae": ..., "mean_rel_error": ...}} for energy,
+    spectral_brightness and zcr.
+    """
+    full_t = sampled_t = 0.0
+    pairs = []
+    for path in paths:
+        t0 = time.perf_counter()
+        full = analyze_track(path, duration=duration)
+        t1 = time.perf_counter()
+        sampled = analyze_track(
+            path, duration=duration, mode="sampled", windows=windows, window_sec=window_sec
+        )
+        t2 = time.perf_counter()
+        if full and sampled:
+            full_t += t1 - t0
+            sampled_t += t2 - t1
+            pairs.append((full, sampled))
 
-        # Zero-crossing rate (indicator of noisiness / consonance)
-        zcr_feat = librosa.feature.zero_crossing_rate(y=y)
-        zcr = float(np.mean(zcr_feat))
+    report: dict = {
+        "tracks": len(pairs),
+        "full_seconds": full_t,
+        "sampled_seconds": sampled_t,
+        "speedup": full_t / sampled_t if sampled_t else None,
+        "bpm_within_2": None,
+        "bpm_octave_match": None,
+        "features": {},
+    }
+    if not pairs:
+        return report
 
-        return {
-            "bpm": bpm,
-            "energy": energy,
-            "spectral_brightness": spectral_brightness,
-            "zcr": zcr,
+    bpm_pairs = [(f["bpm"], s["bpm"]) for f, s in pairs if f.get("bpm") and s.get("bpm")]
+    if bpm_pairs:
+        report["bpm_within_2"] = sum(abs(f - s) <= 2 for f, s in bpm_pairs) / len(bpm_pairs)
+        report["bpm_octave_match"] = sum(
+            min(abs(f - s), abs(f - 2 * s), abs(2 * f - s)) <= 2 for f, s in bpm_pairs
+        ) / len(bpm_pairs)
+    for key in ("energy", "spectral_brightness", "zcr"):
+        full_v = np.array([f[key] for f, _ in pairs], dtype=float)
+        samp_v = np.array([s[key] for _, s in pairs], dtype=float)
+        err = np.abs(full_v - samp_v)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            rel = np.where(full_v != 0, err / np.abs(full_v), np.nan)
+        report["features"][key] = {
+            "mae": float(err.mean()),
+            "mean_rel_error": float(np.nanmean(rel)) if np.isfinite(rel).any() else None,
         }
-    except Exception as exc:
-        logging.warning("Audio analysis failed for %s: %s", file_path, exc)
-        return {}
+    return report
+
+
+_FEATURE_COLS = {
+    "BPM": "bpm",
+    "Energy": "energy",
+    "SpectralBrightness": "spectral_brightness",
+    "ZCR": "zcr",
+}
+
+
+def _apply_cached(df: pd.DataFrame, idx, cached: dict) -> None:
+    """
+    Fill empty feature cells of row idx from a (cached or fresh) feature dict.
+
+    BPM is only filled where the library has a BPM column but no value —
+    tag BPMs are never overwritten.
+    """
+    for col, cache_key in _FEATURE_COLS.items():
+        v = cached.get(cache_key)
+        if v is not None and col in df.columns and pd.isna(df.at[idx, col]):
+            df.at[idx, col] = v
 
 
 def _analyze_one(args: tuple) -> tuple:
-    """Worker for ThreadPoolExecutor. Returns (idx, path, features)."""
-    idx, path, duration = args
-    return idx, path, analyze_track(path, duration=duration)
+    """Worker for ProcessPoolExecutor. Returns (idx, path, features, seconds)."""
+    idx, path, options = args
+    start = time.perf_counter()
+    features = analyze_track(path, **options)
+    return idx, path, features, time.perf_counter() - start
+
+
+def _warm_worker() -> None:
+    """
+    Pool initializer: run the whole kernel once on a few seconds of noise so
+    librosa's lazy imports and numba JIT happen before the first real track.
+    """
+    if not LIBROSA_AVAILABLE:
+        return
+    noise = np.random.default_rng(0).standard_normal(3 * ANALYSIS_SR).astype(np.float32)
+    acc = _StreamAccumulator(need_bpm=True, extended=True)
+    acc.push(0.1 * noise)
+    acc.result()
+
+
+def _priority_order(df: pd.DataFrame, to_analyze: list) -> list:
+    """
+    Order analysis tasks by how much their features are likely to matter:
+    highest Score (or Play Count before scoring) first, then — among equals —
+    tracks whose Mood (or Genre) group has the lowest share of analyzed
+    tracks so far.  Stable, so ties keep library order.
+    """
+    if len(to_analyze) < 2:
+        return to_analyze
+    idxs = [t[0] for t in to_analyze]
+    value_col = "Score" if "Score" in df.columns else "Play Count"
+    if value_col in df.columns:
+        value = pd.to_numeric(df.loc[idxs, value_col], errors="coerce").fillna(0).to_numpy()
+    else:
+        value = np.zeros(len(idxs))
+    group_col = "Mood" if "Mood" in df.columns else "Genre"
+    if group_col in df.columns:
+        groups = df[group_col].astype(object).fillna("")
+        coverage = df["Energy"].notna().groupby(groups).mean()
+        cover = groups.loc[idxs].map(coverage).fillna(0).to_numpy(dtype=float)
+    else:
+        cover = np.zeros(len(idxs))
+    order = np.lexsort((cover, -value))  # last key is the primary sort key
+    return [to_analyze[i] for i in order]
+
+
+def _read_file(path: str) -> Optional[bytes]:
+    try:
+        with open(path, "rb") as f:
+            return f.read()
+    except OSError:
+        return None
+
+
+class _ReadAhead:
+    """
+    Iterator over analysis tasks that reads each file on an I/O thread pool
+    `depth` files ahead of the CPU workers, so slow (network) reads overlap
+    with decoding.  Yielded tasks carry the bytes as options["data"];
+    wait_seconds is how long the CPU side was blocked waiting for a read.
+    """
+
+    def __init__(self, tasks, depth: int, io_workers: int):
+        self._tasks = iter(tasks)
+        self._depth = depth
+        self._pool = ThreadPoolExecutor(max_workers=io_workers, thread_name_prefix="audio-io")
+        self._queue: deque = deque()
+        self.wait_seconds = 0.0
+        self._fill()
+
+    def _fill(self) -> None:
+        while len(self._queue) < self._depth:
+            task = next(self._tasks, None)
+            if task is None:
+                return
+            self._queue.append((task, self._pool.submit(_read_file, task[1])))
+
+    def __iter__(self):
+        return self
+
+    def __next__(self) -> tuple:
+        if not self._queue:
+            raise StopIteration
+        (idx, path, options), read = self._queue.popleft()
+        start = time.perf_counter()
+        data = read.result()
+        self.wait_seconds += time.perf_counter() - start
+        self._fill()
+        if data is not None:
+            options = {**options, "data": data}
+        return idx, path, options
+
+    def close(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+def _plan_analysis(
+    df: pd.DataFrame,
+    conn: sqlite3.Connection,
+    changed_locations: Optional[list[str]],
+    options: dict,
+    read_only: bool = False,
+) -> tuple[list, dict, dict, dict]:
+    """
+    Fill df (in place) from the cache and work out what still needs analysis.
+
+    Rows are matched by (path, mtime) — for rows library_sync reports
+    unchanged, one path lookup plus a stat checking mtime and size — or by
+    content fingerprint (moved / renamed files,
+    whose cache rows are relocated).  With options["extended"], cached rows
+    without current-version descriptors are analyzed again for them.
+    read_only=True plans without writing to the cache (no relocation of
+    moved rows, no fingerprint backfill).
+
+    Returns:
+        (to_analyze, mtime_map, fp_map, upgrades): tasks as
+        (idx, path, options) — with need_bpm=False for rows that carry a
+        trusted BPM — plus each task's mtime and fingerprint keyed by idx,
+        and {idx: cached features} for the tasks that only need descriptors.
+    """
+    # Ensure feature columns exist
+    for col in ("Energy", "SpectralBrightness", "ZCR"):
+        if col not in df.columns:
+            df[col] = None
+
+    extended = bool(options.get("extended"))
+
+    def needs_descriptors(cached: dict) -> bool:
+        return extended and cached.get("descriptor_version") != DESCRIPTOR_VERSION
+
+    stale: list[tuple[int, str, float, dict]] = []  # (idx, path, mtime, cached)
+
+    changed = (
+        {_resolve_path(str(loc)) for loc in changed_locations}
+        if changed_locations is not None
+        else None
+    )
+
+    # Build work list — resolve paths and stat files first
+    candidates: list[tuple[int, str, float]] = []  # (idx, path, mtime)
+    sizes: dict[int, int] = {}
+    unchanged: list[tuple[int, str]] = []  # untouched since last sync
+
+    for idx, row in df.iterrows():
+        raw_loc = row.get("Location") or ""
+        if not raw_loc:
+            continue
+        path = _resolve_path(str(raw_loc))
+        if changed is not None and path not in changed:
+            unchanged.append((idx, path))
+            continue
+        try:
+            st = os.stat(path)
+        except OSError:
+            continue
+        if stat.S_ISREG(st.st_mode):
+            candidates.append((idx, path, st.st_mtime))
+            sizes[idx] = st.st_size
+
+    # Unchanged tracks: one path lookup for all of them, then a single stat
+    # each — a file replaced at the same path must not keep stale features
+    if unchanged:
+        by_path = _cache_get_paths(conn, [path for _, path in unchanged])
+        for idx, path in unchanged:
+            try:
+                st = os.stat(path)
+            except OSError:
+                continue
+            if not stat.S_ISREG(st.st_mode):
+                continue
+            cached = by_path.get(path)
+            if cached is not None and _matches_file(cached, st):
+                _apply_cached(df, idx, cached)
+                if needs_descriptors(cached):
+                    stale.append((idx, path, cached["mtime"], cached))
+                continue
+            candidates.append((idx, path, st.st_mtime))
+            sizes[idx] = st.st_size
+
+    # Batch cache lookup — single SQL query instead of N individual queries
+    cache_map = _cache_get_batch(
+        conn, [(path, mtime) for _, path, mtime in candidates]
+    )
+    # Same path and mtime but another size: replaced in place, so not a hit
+    for idx, path, _ in candidates:
+        cached = cache_map.get(path)
+        if cached is not None and not _size_matches(cached, sizes[idx]):
+            del cache_map[path]
+
+    # Cache misses: look for the same content under another path (moved /
+    # renamed files, or an unchanged file whose mtime was bumped)
+    fp_map = {
+        idx: _file_fingerprint(path)
+        for idx, path, _ in candidates
+        if path not in cache_map
+    }
+    by_content = _cache_get_fingerprints(
+        conn, sorted({fp for fp in fp_map.values() if fp})
+    )
+    moves: list[tuple[str, str, float]] = []
+    backfill: list[tuple[str, str]] = []  # (fingerprint, path)
+
+    to_analyze: list = []
+    mtime_map: dict = {}
+    options_no_bpm = {**options, "need_bpm": False}
+    has_bpm = "BPM" in df.columns
+
+    for idx, path, mtime in candidates:
+        cached = cache_map.get(path)
+        if cached is not None:
+            _apply_cached(df, idx, cached)
+            if cached.get("fingerprint") is None:
+                fingerprint = _file_fingerprint(path)
+                if fingerprint:
+                    backfill.append((fingerprint, path))
+                    cached = {**cached, "fingerprint": fingerprint}
+            if needs_descriptors(cached):
+                stale.append((idx, path, mtime, cached))
+            continue
+        moved = by_content.get(fp_map[idx]) if fp_map[idx] else None
+        if moved is not None:
+            _apply_cached(df, idx, moved)
+            moves.append((moved["path"], path, mtime))
+            if needs_descriptors(moved):
+                stale.append((idx, path, mtime, moved))
+        else:
+            trusted = has_bpm and _trusted_bpm(df.at[idx, "BPM"])
+            to_analyze.append((idx, path, options_no_bpm if trusted else options))
+            mtime_map[idx] = mtime
+
+    if read_only:
+        moves, backfill = [], []
+    if moves:
+        _cache_relocate(conn, moves)
+        logging.info(
+            "Audio cache: matched %d moved/renamed files by content.", len(moves)
+        )
+    if backfill:
+        # Rows cached before fingerprints existed — fill them in once
+        conn.executemany(
+            "UPDATE audio_features SET fingerprint=? WHERE path=?", backfill
+        )
+        conn.commit()
+
+    # Cached rows that only lack extended descriptors: the scalars are kept,
+    # so tempo is never re-estimated for them
+    upgrades: dict = {}
+    for idx, path, mtime, cached in stale:
+        to_analyze.append((idx, path, options_no_bpm))
+        mtime_map[idx] = mtime
+        fp_map[idx] = cached.get("fingerprint")
+        upgrades[idx] = cached
+    if upgrades:
+        logging.info(
+            "Audio cache: %d cached tracks need extended descriptors.", len(upgrades)
+        )
+
+    return to_analyze, mtime_map, fp_map, upgrades
+
+
+def _run_pool(
+    conn: sqlite3.Connection,
+    tasks: list,
+    workers: int,
+    record_for,
+    checkpoint_tracks: int = 200,
+    checkpoint_seconds: float = 30.0,
+    prefetch_depth: int = 0,
+    io_workers: int = 4,
+    budget_seconds: Optional[float] = None,
+    service_socket: Optional[str] = None,
+) -> dict:
+    """
+    Analyze tasks — (idx, path, options) — on a process pool and write the
+    results to the cache at conn.  With service_socket, the warm workers of
+    a running analysis service are used instead when it answers.
+
+    record_for(idx, path, features) is called in this process for every
+    successful result and returns the cache record
+    (path, mtime, features, fingerprint) to store, or None.
+
+    Returns counters: completed, failed, compute_seconds, wall_seconds.
+    """
+    completed = 0
+    failed = 0
+    pending: list[tuple[str, float, dict, Optional[str]]] = []  # not yet committed
+    last_flush = time.monotonic()
+    compute_seconds = 0.0
+    started = time.perf_counter()
+    executor = None
+    if service_socket:
+        from .analysis_service import connect_service
+
+        executor = connect_service(service_socket)
+        if executor is not None:
+            workers = executor.workers
+            logging.info("Audio analysis: using %d warm workers from the analysis service.", workers)
+    if executor is None:
+        # Use ProcessPoolExecutor for CPU-bound librosa work (bypasses GIL)
+        executor = ProcessPoolExecutor(max_workers=workers)
+    # A few tasks per worker keeps the pool busy without queueing the
+    # whole library (and its results) in memory at once.  With read-ahead
+    # the queued tasks carry file bytes, so keep fewer of them.
+    if prefetch_depth > 0:
+        max_in_flight = workers * 2
+        work = _ReadAhead(tasks, prefetch_depth, io_workers)
+    else:
+        max_in_flight = workers * 4
+        work = iter(tasks)
+    deadline = started + budget_seconds if budget_seconds else None
+
+    try:
+        with executor, tqdm(
+            total=len(tasks),
+            desc="Analyzing audio",
+            unit="track",
+            disable=len(tasks) < 10,
+        ) as bar:
+            in_flight = {executor.submit(_analyze_one, t) for t in islice(work, max_in_flight)}
+            try:
+                while in_flight:
+                    done, in_flight = wait(in_flight, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        try:
+                            idx, path, features, seconds = future.result()
+                            compute_seconds += seconds
+                            if features:
+                                record = record_for(idx, path, features)
+                                if record is not None:
+                                    pending.append(record)
+                            completed += 1
+                        except Exception as exc:
+                            logging.warning("Audio analysis worker error: %s", exc)
+                            failed += 1
+                        bar.update()
+                        if deadline is not None and time.perf_counter() >= deadline:
+                            continue  # budget spent: let in-flight work drain
+                        for t in islice(work, 1):
+                            in_flight.add(executor.submit(_analyze_one, t))
+
+                    if (
+                        len(pending) >= checkpoint_tracks
+                        or time.monotonic() - last_flush >= checkpoint_seconds
+                    ):
+                        _cache_set_batch(conn, pending)
+                        pending.clear()
+                        last_flush = time.monotonic()
+            except BaseException:
+                # Ctrl-C / error: drop queued work instead of finishing it
+                executor.shutdown(wait=False, cancel_futures=True)
+                raise
+    finally:
+        if isinstance(work, _ReadAhead):
+            work.close()
+        # Commit whatever finished, even when the run is interrupted
+        _cache_set_batch(conn, pending)
+
+    wall = time.perf_counter() - started
+    if isinstance(work, _ReadAhead):
+        logging.info(
+            "Audio analysis timing: %.1f s wall, %.1f s worker compute "
+            "(%d workers), %.1f s waiting on file reads (read-ahead %d).",
+            wall,
+            compute_seconds,
+            workers,
+            work.wait_seconds,
+            prefetch_depth,
+        )
+    else:
+        logging.info(
+            "Audio analysis timing: %.1f s wall, %.1f s worker read+compute "
+            "(%d workers).",
+            wall,
+            compute_seconds,
+            workers,
+        )
+    return {
+        "completed": completed,
+        "failed": failed,
+        "compute_seconds": compute_seconds,
+        "wall_seconds": wall,
+    }
+
+
+def _analysis_options(
+    duration: int,
+    mode: str,
+    sample_windows: int,
+    sample_seconds: float,
+    extended: bool = False,
+) -> dict:
+    """analyze_track() keyword arguments for the configured analysis mode."""
+    options = {"duration": duration, "mode": mode}
+    if mode == "sampled":
+        options.update(windows=sample_windows, window_sec=sample_seconds)
+    if extended:
+        options["extended"] = True
+    return options
 
 
 def analyze_library(
@@ -220,12 +1230,26 @@ def analyze_library(
     enabled: bool = True,
     workers: int = 0,
     duration: int = 120,
+    changed_locations: Optional[list[str]] = None,
+    mode: str = "full",
+    sample_windows: int = 3,
+    sample_seconds: float = 10.0,
+    checkpoint_tracks: int = 200,
+    checkpoint_seconds: float = 30.0,
+    prefetch_depth: int = 0,
+    io_workers: int = 4,
+    budget_seconds: Optional[float] = None,
+    budget_tracks: Optional[int] = None,
+    extended: bool = False,
+    service_socket: Optional[str] = None,
 ) -> pd.DataFrame:
     """
     Add Energy, SpectralBrightness, ZCR columns to the library DataFrame.
 
-    BPM is already populated from mutagen in itunes.py / metadata.py;
-    this adds the three acoustic feature columns that mutagen cannot provide.
+    BPM is usually populated from mutagen in itunes.py / metadata.py; this
+    adds the three acoustic feature columns that mutagen cannot provide.
+    Tempo is only estimated for rows without a trusted BPM, and fills the BPM
+    column where it is empty.
     Results are cached in SQLite — only uncached / changed files are analyzed.
 
     Args:
@@ -234,6 +1258,33 @@ def analyze_library(
         enabled:  If False, returns df unchanged (LIBROSA_ENABLED=false in config).
         workers:  Parallel analysis threads (default os.cpu_count() or 4).
         duration: Seconds of audio to analyze per track (default 120).
+        changed_locations: Optional change set from library_sync.  Rows whose
+                  Location is not listed are looked up by path in one batch
+                  and kept if the cached mtime and size still match the file
+                  (one stat each); listed, uncached or mismatching rows go
+                  through the full (path, mtime) / content lookup.
+        mode:     "full" (first `duration` seconds) or "sampled"
+                  (`sample_windows` windows of `sample_seconds` each; see
+                  analyze_track).
+        checkpoint_tracks / checkpoint_seconds: results are committed to the
+                  cache every N analyzed tracks or T seconds, whichever comes
+                  first (and on the way out of an interrupted run), so a
+                  killed run resumes where it stopped.
+        prefetch_depth: if > 0, read up to this many upcoming files into
+                  memory on `io_workers` threads while the CPU workers decode
+                  (for libraries on a NAS / slow disk).  Memory use is roughly
+                  (prefetch_depth + 2 * workers) files.  0 disables read-ahead.
+        budget_seconds / budget_tracks: stop starting new analyses after this
+                  much wall-clock time (counted from the start of analysis)
+                  or this many tracks.  Uncached tracks are queued by
+                  _priority_order(), so the most useful features land first;
+                  the rest are left for later runs.
+        extended: also compute and cache the DESCRIPTOR_NAMES vector (read
+                  it back with load_descriptors()).  Cached tracks analyzed
+                  without it are queued again, keeping their cached values.
+        service_socket: Unix socket of a running analysis service
+                  (analysis_service.serve); its warm workers replace the
+                  per-run process pool.  Ignored when nothing answers.
 
     Returns:
         DataFrame with Energy, SpectralBrightness, ZCR columns added/filled.
@@ -254,93 +1305,56 @@ def analyze_library(
         return df
 
     # Try to load librosa; analyze_track will return {} if not available
+    completed = failed = 0
     try:
-        df = df.copy()
-
-        # Ensure feature columns exist
-        for col in ("Energy", "SpectralBrightness", "ZCR"):
-            if col not in df.columns:
-                df[col] = None
-
-        # Build work list — resolve paths and get mtimes first
-        candidates: list[tuple[int, str, float]] = []  # (idx, path, mtime)
-
-        for idx, row in df.iterrows():
-            raw_loc = row.get("Location") or ""
-            if not raw_loc:
-                continue
-            path = _resolve_path(str(raw_loc))
-            if not os.path.isfile(path):
-                continue
-            try:
-                mtime = os.path.getmtime(path)
-            except OSError:
-                continue
-            candidates.append((idx, path, mtime))
-
-        # Batch cache lookup — single SQL query instead of N individual queries
-        cache_map = _cache_get_batch(
-            conn, [(path, mtime) for _, path, mtime in candidates]
+        df = working_copy(df)
+        options = _analysis_options(duration, mode, sample_windows, sample_seconds, extended)
+        to_analyze, mtime_map, fp_map, upgrades = _plan_analysis(
+            df, conn, changed_locations, options
         )
 
-        to_analyze: list = []
-        mtime_map: dict = {}
-
-        for idx, path, mtime in candidates:
-            cached = cache_map.get(path)
-            if cached is not None:
-                for col in ("Energy", "SpectralBrightness", "ZCR"):
-                    v = cached.get(col.lower() if col != "ZCR" else "zcr")
-                    # Map cache keys to DataFrame columns
-                    cache_key = {
-                        "Energy": "energy",
-                        "SpectralBrightness": "spectral_brightness",
-                        "ZCR": "zcr",
-                    }[col]
-                    v = cached.get(cache_key)
-                    if v is not None and df.at[idx, col] is None:
-                        df.at[idx, col] = v
-            else:
-                to_analyze.append((idx, path, duration))
-                mtime_map[idx] = mtime
-
         if not to_analyze:
             logging.info("Audio analysis: all %d tracks loaded from cache.", len(df))
             return df
 
+        to_analyze = _priority_order(df, to_analyze)
+        deferred = 0
+        if budget_tracks is not None and len(to_analyze) > budget_tracks:
+            deferred = len(to_analyze) - budget_tracks
+            to_analyze = to_analyze[:budget_tracks]
+
         logging.info(
             "Audio analysis: analyzing %d new tracks (cached: %d)…",
             len(to_analyze),
             len(df) - len(to_analyze),
         )
 
-        completed = 0
-        failed = 0
-        cache_batch: list[tuple[str, float, dict]] = []
+        def _record(idx, path, features):
+            previous = upgrades.get(idx)
+            if previous is not None:
+                features = {**features, **{k: previous[k] for k in _FEATURE_KEYS}}
+            _apply_cached(df, idx, features)
+            return path, mtime_map[idx], features, fp_map.get(idx)
 
-        # Use ProcessPoolExecutor for CPU-bound librosa work (bypasses GIL)
-        with ProcessPoolExecutor(max_workers=workers) as executor:
-            futures = {executor.submit(_analyze_one, t): t for t in to_analyze}
-            for future in tqdm(
-                as_completed(futures),
-                total=len(futures),
-                desc="Analyzing audio",
-                unit="track",
-                disable=len(to_analyze) < 10,
-            ):
-                try:
-                    idx, path, features = future.result()
-                    if features:
-                        cache_batch.append((path, mtime_map[idx], features))
-                        for col, value in features.items():
-                            df.at[idx, col] = value
-                    completed += 1
-                except Exception as exc:
-                    logging.warning("Audio analysis worker error: %s", exc)
-                    failed += 1
-
-        # Batch write all results to cache in one transaction
-        _cache_set_batch(conn, cache_batch)
+        stats = _run_pool(
+            conn,
+            to_analyze,
+            workers,
+            _record,
+            checkpoint_tracks=checkpoint_tracks,
+            checkpoint_seconds=checkpoint_seconds,
+            prefetch_depth=prefetch_depth,
+            io_workers=io_workers,
+            budget_seconds=budget_seconds,
+            service_socket=service_socket,
+        )
+        completed, failed = stats["completed"], stats["failed"]
+
+        deferred += len(to_analyze) - completed - failed
+        if deferred:
+            logging.info(
+                "Audio analysis budget reached: %d tracks left for later runs.", deferred
+            )
 
     finally:
         conn.close()
@@ -381,3 +1395,427 @@ def analyze_library(
             len(to_analyze),
         )
     return df
+
+
+def load_descriptors(df: pd.DataFrame, db_path: str) -> pd.DataFrame:
+    """
+    Extended descriptors of each library row, read from the audio cache
+    (nothing is decoded).
+
+    Returns a float32 DataFrame indexed like df with DESCRIPTOR_NAMES
+    columns.  Rows without current-version descriptors (not analyzed with
+    AUDIO_EXTENDED_FEATURES, or no Location) are all-NaN.
+    """
+    out = np.full((len(df), len(DESCRIPTOR_NAMES)), np.nan, dtype=np.float32)
+    paths = [
+        _resolve_path(str(loc)) if pd.notna(loc) and loc else None
+        for loc in df.get("Location", pd.Series(None, index=df.index))
+    ]
+    try:
+        conn = _init_db(str(Path(db_path).expanduser()))
+    except Exception as exc:
+        logging.warning("Audio cache DB init failed (%s) — no descriptors loaded.", exc)
+        return pd.DataFrame(out, index=df.index, columns=list(DESCRIPTOR_NAMES))
+    try:
+        rows = sqlite_lookup(
+            conn,
+            "audio_features",
+            "path",
+            ("descriptors", "descriptor_version"),
+            sorted({p for p in paths if p}),
+        )
+    finally:
+        conn.close()
+    for i, path in enumerate(paths):
+        row = rows.get(path)
+        vec = _unpack_descriptors(*row) if row else None
+        if vec is not None:
+            out[i] = vec
+    return pd.DataFrame(out, index=df.index, columns=list(DESCRIPTOR_NAMES))
+
+
+# ---------------------------------------------------------------------------
+# Importing precomputed features
+# ---------------------------------------------------------------------------
+
+# Accepted column names in external dumps (lower-cased, spaces/hyphens as _)
+_DUMP_COLUMNS = {
+    "path": "path",
+    "location": "path",
+    "file": "path",
+    "filename": "path",
+    "file_path": "path",
+    "artist": "artist",
+    "name": "name",
+    "title": "name",
+    "track": "name",
+    "track_name": "name",
+    "bpm": "bpm",
+    "tempo": "bpm",
+    "energy": "energy",
+    "rms": "energy",
+    "spectral_brightness": "spectral_brightness",
+    "spectralbrightness": "spectral_brightness",
+    "brightness": "spectral_brightness",
+    "zcr": "zcr",
+    "zero_crossing_rate": "zcr",
+}
+
+# Without partial=True, dump rows must carry all of these to be imported
+_REQUIRED_IMPORT = ("energy", "spectral_brightness", "zcr")
+
+
+def _read_feature_dump(dump_path: str) -> pd.DataFrame:
+    """
+    Load a CSV / TSV / JSON / JSON-lines feature dump with its columns
+    renamed to path / artist / name / bpm / energy / spectral_brightness / zcr
+    (unknown columns are dropped).
+    """
+    path = Path(dump_path).expanduser()
+    suffix = path.suffix.lower()
+    if suffix in (".jsonl", ".ndjson"):
+        raw = pd.read_json(path, lines=True)
+    elif suffix == ".json":
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if isinstance(data, dict):
+            data = data.get("tracks", [])
+        raw = pd.DataFrame.from_records(data)
+    else:
+        raw = pd.read_csv(path, sep="\t" if suffix == ".tsv" else ",")
+    renamed = {
+        col: _DUMP_COLUMNS.get(str(col).strip().lower().replace(" ", "_").replace("-", "_"))
+        for col in raw.columns
+    }
+    keep = [col for col in raw.columns if renamed[col]]
+    dump = raw[keep].set_axis([renamed[col] for col in keep], axis=1)
+    dump = dump.loc[:, ~dump.columns.duplicated()]
+    for key in _FEATURE_KEYS:
+        if key in dump.columns:
+            dump[key] = pd.to_numeric(dump[key], errors="coerce")
+    if "bpm" in dump.columns:
+        dump.loc[~dump["bpm"].between(*_TRUSTED_BPM), "bpm"] = np.nan
+    return dump
+
+
+def import_audio_features(
+    df: pd.DataFrame,
+    db_path: str,
+    dump_path: str,
+    overwrite: bool = False,
+    partial: bool = False,
+) -> int:
+    """
+    Bulk-load precomputed features from an external dump into the audio cache.
+
+    Dump rows are joined to the library by file path when the dump has a
+    path column, and the remaining library rows by the canonical
+    "artist - name" key (track_index.track_keys) when it has artist and
+    name/title columns.  Both joins are vectorised merges.  Matched rows are
+    written under the library file's (path, mtime) in one transaction, so
+    analyze_library() treats them as cached and only decodes what is still
+    missing.
+
+    Values must be on the same scale as local analysis: RMS energy,
+    spectral centroid / Nyquist, zero-crossing rate, BPM (out-of-range BPMs
+    are dropped).
+
+    Args:
+        df:        Library DataFrame with Location (and Artist / Name).
+        db_path:   Path to the SQLite audio cache.
+        dump_path: .csv, .tsv, .json (list of objects, or {"tracks": [...]})
+                   or .jsonl file.
+        overwrite: Replace rows already cached for the same (path, mtime);
+                   by default local results win.
+        partial:   Also import rows missing energy, spectral_brightness or
+                   zcr.  Imported rows are never re-analyzed while the file
+                   is unchanged, so their gaps stay empty.
+
+    Returns:
+        Number of rows written.
+    """
+    dump = _read_feature_dump(dump_path)
+    present = [k for k in _FEATURE_KEYS if k in dump.columns]
+    if not partial:
+        missing = [k for k in _REQUIRED_IMPORT if k not in dump.columns]
+        if missing:
+            logging.warning(
+                "Feature dump %s has no %s column — nothing imported "
+                "(use partial import to load it anyway).",
+                dump_path,
+                ", ".join(missing),
+            )
+            return 0
+        dump = dump.dropna(subset=list(_REQUIRED_IMPORT))
+    else:
+        dump = dump.dropna(subset=present, how="all")
+
+    locations = df.get("Location", pd.Series(None, index=df.index, dtype=object))
+    lib = pd.DataFrame(
+        {
+            "idx": df.index,
+            "path": [_resolve_path(str(loc)) if pd.notna(loc) and loc else None for loc in locations],
+        }
+    ).dropna(subset=["path"])
+    if "Artist" in df.columns and "Name" in df.columns:
+        rows = df.loc[lib["idx"]]
+        lib["key"] = track_keys(
+            rows["Artist"].astype(object), rows["Name"].astype(object)
+        ).to_numpy()
+
+    matched = []
+    if "path" in dump.columns:
+        by_path = dump.dropna(subset=["path"]).assign(
+            path=lambda d: d["path"].astype(str).map(_resolve_path)
+        )
+        matched.append(
+            lib[["idx", "path"]].merge(
+                by_path.drop_duplicates("path")[["path"] + present], on="path"
+            )
+        )
+    if "key" in lib.columns and {"artist", "name"} <= set(dump.columns):
+        rest = lib[~lib["idx"].isin(matched[0]["idx"])] if matched else lib
+        by_key = dump.assign(key=track_keys(dump["artist"], dump["name"]))
+        matched.append(
+            rest[["idx", "path", "key"]]
+            .merge(by_key.drop_duplicates("key")[["key"] + present], on="key")
+            .drop(columns="key")
+        )
+    if not matched:
+        logging.warning(
+            "Feature dump %s has neither a path column nor artist + title columns.",
+            dump_path,
+        )
+        return 0
+    hits = pd.concat(matched, ignore_index=True).drop_duplicates("path")
+
+    records = []
+    for row in hits.itertuples(index=False):
+        try:
+            mtime = os.path.getmtime(row.path)
+        except OSError:
+            continue
+        features = {
+            k: (None if pd.isna(getattr(row, k)) else float(getattr(row, k))) for k in present
+        }
+        records.append((row.path, mtime, features, None))
+
+    conn = _init_db(str(Path(db_path).expanduser()))
+    try:
+        if not overwrite:
+            cached = sqlite_lookup(
+                conn, "audio_features", ("path", "mtime"), (), [(p, m) for p, m, _, _ in records]
+            )
+            records = [r for r in records if (r[0], r[1]) not in cached]
+        # Fingerprints are filled in by the next analyze_library() run
+        _cache_set_batch(conn, records)
+    finally:
+        conn.close()
+
+    logging.info(
+        "Imported features for %d tracks from %s (%d dump rows, %d matched the library).",
+        len(records),
+        dump_path,
+        len(dump),
+        len(hits),
+    )
+    return len(records)
+
+
+# ---------------------------------------------------------------------------
+# Sharded offline analysis
+# ---------------------------------------------------------------------------
+
+_SHARD_VERSION = 1
+
+
+def export_analysis_shards(
+    df: pd.DataFrame,
+    db_path: str,
+    out_dir: str,
+    shards: int,
+    duration: int = 120,
+    mode: str = "full",
+    sample_windows: int = 3,
+    sample_seconds: float = 10.0,
+    extended: bool = False,
+) -> list[Path]:
+    """
+    Write the library's uncached analysis work as `shards` JSON files.
+
+    Tracks are dealt round-robin in priority order, so every shard gets a
+    similar mix.  Each file records the analysis options and, per track, the
+    path and mtime exactly as they will be keyed in the cache:
+
+        {"version": 1, "shard": 0, "shards": 4, "options": {...},
+         "tracks": [[path, mtime, need_bpm], ...]}
+
+    The cache is only read; moved files are relocated by the next
+    analyze_library() or merge run.
+
+    Returns the paths written (empty if nothing needs analysis).
+    """
+    conn = _init_db(str(Path(db_path).expanduser()))
+    try:
+        df = working_copy(df)
+        options = _analysis_options(duration, mode, sample_windows, sample_seconds, extended)
+        to_analyze, mtime_map, _, _ = _plan_analysis(
+            df, conn, None, options, read_only=True
+        )
+    finally:
+        conn.close()
+    if not to_analyze:
+        logging.info("Audio analysis: nothing to export — all tracks are cached.")
+        return []
+
+    to_analyze = _priority_order(df, to_analyze)
+    out = Path(out_dir).expanduser()
+    out.mkdir(parents=True, exist_ok=True)
+    shards = max(1, min(shards, len(to_analyze)))
+    written = []
+    for shard in range(shards):
+        tracks = [
+            [path, mtime_map[idx], opts.get("need_bpm", True)]
+            for idx, path, opts in to_analyze[shard::shards]
+        ]
+        shard_path = out / f"audio-shard-{shard + 1:03d}-of-{shards:03d}.json"
+        with open(shard_path, "w", encoding="utf-8") as f:
+            json.dump(
+                {
+                    "version": _SHARD_VERSION,
+                    "shard": shard,
+                    "shards": shards,
+                    "options": options,
+                    "tracks": tracks,
+                },
+                f,
+                ensure_ascii=False,
+            )
+        written.append(shard_path)
+    logging.info(
+        "Exported %d uncached tracks as %d shard(s) in %s.", len(to_analyze), shards, out
+    )
+    return written
+
+
+def analyze_shard(
+    shard_path: str,
+    out_db: str,
+    workers: int = 0,
+    path_map: Optional[tuple[str, str]] = None,
+    checkpoint_tracks: int = 200,
+    checkpoint_seconds: float = 30.0,
+) -> int:
+    """
+    Analyze every track of one shard file into the SQLite file out_db.
+
+    path_map=(old_prefix, new_prefix) rewrites paths that start with
+    old_prefix before reading them (the library mounted elsewhere on this
+    machine); results are always stored under the original path and mtime
+    so they merge into the main cache unchanged.  Re-running the same shard
+    skips tracks already in out_db.
+
+    Returns the number of tracks analyzed in this run.
+    """
+    with open(Path(shard_path).expanduser(), "r", encoding="utf-8") as f:
+        shard = json.load(f)
+    if shard.get("version") != _SHARD_VERSION:
+        raise ValueError(f"{shard_path}: unsupported shard version {shard.get('version')!r}")
+
+    if workers <= 0:
+        workers = os.cpu_count() or 4
+    conn = _init_db(str(Path(out_db).expanduser()))
+    try:
+        done = sqlite_lookup(
+            conn, "audio_features", ("path", "mtime"), (), [(p, m) for p, m, _ in shard["tracks"]]
+        )
+        tasks, origin = [], {}
+        for i, (path, mtime, need_bpm) in enumerate(shard["tracks"]):
+            if (path, mtime) in done:
+                continue
+            read_path = path
+            if path_map and path.startswith(path_map[0]):
+                read_path = path_map[1] + path[len(path_map[0]) :]
+            tasks.append((i, read_path, {**shard["options"], "need_bpm": need_bpm}))
+            origin[i] = (path, mtime)
+        logging.info(
+            "Shard %d/%d: analyzing %d tracks (%d already done).",
+            shard["shard"] + 1,
+            shard["shards"],
+            len(tasks),
+            len(shard["tracks"]) - len(tasks),
+        )
+        if not tasks:
+            return 0
+
+        def _record(i, read_path, features):
+            path, mtime = origin[i]
+            return path, mtime, features, _file_fingerprint(read_path)
+
+        stats = _run_pool(
+            conn,
+            tasks,
+            workers,
+            _record,
+            checkpoint_tracks=checkpoint_tracks,
+            checkpoint_seconds=checkpoint_seconds,
+        )
+    finally:
+        conn.close()
+    return stats["completed"]
+
+
+def merge_analysis_shards(db_path: str, shard_dbs: list[str]) -> int:
+    """
+    Bulk-load shard result files into the main audio cache.
+
+    Rows whose (path, mtime) is already cached are skipped, except that their
+    extended descriptors are taken from the shard when the cached row has
+    none (or an older version); a row for a path cached with a different
+    mtime replaces it.  Returns the rows merged.
+
+    Raises FileNotFoundError (before merging anything) if a shard file does
+    not exist — opening it would silently create an empty database.
+    """
+    shard_paths = [Path(shard_db).expanduser() for shard_db in shard_dbs]
+    for shard_path in shard_paths:
+        if not shard_path.is_file():
+            raise FileNotFoundError(f"Shard result file not found: {shard_path}")
+    conn = _init_db(str(Path(db_path).expanduser()))
+    merged = 0
+    try:
+        for shard_path in shard_paths:
+            # Migrate / validate the shard file like any other cache
+            _init_db(str(shard_path)).close()
+            conn.execute("ATTACH DATABASE ? AS shard", (str(shard_path),))
+            try:
+                same_row = (
+                    "FROM shard.audio_features s WHERE s.path = main.audio_features.path "
+                    "AND s.mtime = main.audio_features.mtime"
+                )
+                upgraded = conn.execute(
+                    f"""UPDATE main.audio_features
+                        SET descriptors = (SELECT s.descriptors {same_row}),
+                            descriptor_version = ?
+                        WHERE descriptor_version IS NOT ?
+                          AND EXISTS (SELECT 1 {same_row} AND s.descriptor_version = ?)""",
+                    (DESCRIPTOR_VERSION,) * 3,
+                ).rowcount
+                inserted = conn.execute(
+                    f"""INSERT OR REPLACE INTO audio_features
+                        (path, mtime, {_ROW_SQL})
+                        SELECT path, mtime, {_ROW_SQL}
+                        FROM shard.audio_features s
+                        WHERE NOT EXISTS (
+                            SELECT 1 FROM main.audio_features m
+                            WHERE m.path = s.path AND m.mtime = s.mtime
+                        )"""
+                ).rowcount
+                conn.commit()
+                merged += inserted + upgraded
+                logging.info("Merged %d rows from %s.", inserted + upgraded, shard_path)
+            finally:
+                conn.execute("DETACH DATABASE shard")
+    finally:
+        conn.close()
+    return merged
@@ -10,7 +10,7 @@ import pandas as pd
 
 from .config import load_config
 from .pipeline import run_pipeline
-from .utils import validate_path
+from .utils import parse_budget, validate_path
 
 
 def file_newer(a, b):
@@ -49,6 +49,13 @@ def main():
         action="store_true",
         help="Use Claude Haiku to batch-enrich mood/energy metadata (requires ANTHROPIC_API_KEY)",
     )
+    parser.add_argument(
+        "--analysis-budget",
+        help=(
+            "Limit this run's audio analysis to a duration (45m, 2h) or a track "
+            "count (500); the most-played tracks go first, the rest wait for later runs"
+        ),
+    )
     parser.add_argument(
         "--no-lastfm",
         action="store_true",
@@ -191,6 +198,99 @@ def main():
         help="Scan a local music directory (needed for curate mode import)",
     )
 
+    compare_parser = subparsers.add_parser(
+        "compare-analysis",
+        help="Measure sampled-window audio analysis against full analysis on a library sample",
+    )
+    compare_parser.add_argument(
+        "--sample",
+        type=int,
+        default=25,
+        help="Number of random library tracks to analyze in both modes (default: 25)",
+    )
+    compare_parser.add_argument(
+        "--library-dir",
+        help="Scan a local music directory instead of the iTunes library",
+    )
+
+    shards_parser = subparsers.add_parser(
+        "export-analysis-shards",
+        help="Split uncached audio analysis into shard files for other machines",
+    )
+    shards_parser.add_argument(
+        "--shards", type=int, required=True, help="Number of shard files to write"
+    )
+    shards_parser.add_argument(
+        "--out", required=True, help="Directory to write the shard files to"
+    )
+    shards_parser.add_argument(
+        "--library-dir",
+        help="Scan a local music directory instead of the iTunes library",
+    )
+
+    shard_worker_parser = subparsers.add_parser(
+        "analyze-shard",
+        help="Analyze one shard file into its own SQLite results file",
+    )
+    shard_worker_parser.add_argument("shard_file", help="Shard JSON from export-analysis-shards")
+    shard_worker_parser.add_argument(
+        "--out", required=True, help="SQLite file to write results to (resumable)"
+    )
+    shard_worker_parser.add_argument(
+        "--workers", type=int, default=0, help="Worker processes (default: all cores)"
+    )
+    shard_worker_parser.add_argument(
+        "--path-map",
+        metavar="OLD=NEW",
+        help="Read files under NEW where the shard lists OLD (library mounted elsewhere)",
+    )
+
+    merge_parser = subparsers.add_parser(
+        "merge-analysis-shards",
+        help="Load analyze-shard results into AUDIO_CACHE_DB",
+    )
+    merge_parser.add_argument("shard_dbs", nargs="+", help="SQLite files written by analyze-shard")
+
+    import_features_parser = subparsers.add_parser(
+        "import-audio-features",
+        help="Load precomputed audio features from a CSV/JSON dump into AUDIO_CACHE_DB",
+    )
+    import_features_parser.add_argument(
+        "dump_file", help="CSV, TSV, JSON or JSON-lines file keyed by path or artist/title"
+    )
+    import_features_parser.add_argument(
+        "--library-dir",
+        help="Scan a local music directory instead of the iTunes library",
+    )
+    import_features_parser.add_argument(
+        "--overwrite",
+        action="store_true",
+        help="Replace features already cached for the same file",
+    )
+    import_features_parser.add_argument(
+        "--partial",
+        action="store_true",
+        help="Also import rows missing energy, brightness or ZCR",
+    )
+
+    service_parser = subparsers.add_parser(
+        "analysis-service",
+        help="Keep warm audio-analysis workers running for later runs (AUDIO_WORKER_SERVICE)",
+    )
+    service_parser.add_argument(
+        "--workers", type=int, default=0, help="Worker processes (default: AUDIO_ANALYSIS_WORKERS or all cores)"
+    )
+    service_parser.add_argument(
+        "--idle-timeout",
+        type=float,
+        default=0,
+        metavar="MINUTES",
+        help="Exit after this many minutes without requests (default: never)",
+    )
+    service_parser.add_argument(
+        "--stop", action="store_true", help="Stop the running analysis service"
+    )
+
     spotify_export_parser = subparsers.add_parser(
         "export-to-spotify",
         help="Export a generated M3U playlist to your Spotify account",
@@ -232,6 +332,14 @@ def main():
         logging.error("Invalid path: %s", exc)
         sys.exit(1)
 
+    if args.analysis_budget:
+        try:
+            parse_budget(args.analysis_budget)
+        except ValueError as exc:
+            logging.error("--analysis-budget: %s", exc)
+            sys.exit(1)
+        cfg["AUDIO_ANALYSIS_BUDGET"] = args.analysis_budget
+
     # ------------------------------------------------------------------
     # Command routing
     # ------------------------------------------------------------------
@@ -405,6 +513,152 @@ def main():
                 save_m3u(playlist_df, label, out_dir=out_dir)
                 logging.info("Playlist '%s' written to %s", label, out_dir)
 
+    elif args.command == "compare-analysis":
+        from .audio_analysis import compare_analysis_modes
+
+        lib_dir = getattr(args, "library_dir", None)
+        if lib_dir:
+            from .itunes import build_library_from_dir
+            library_df = build_library_from_dir(lib_dir)
+        else:
+            from .pipeline import ensure_itunes_json
+            from .itunes import load_itunes_json
+            library_df = load_itunes_json(str(ensure_itunes_json(cfg)))
+
+        locations = library_df.get("Location", pd.Series(dtype=object)).dropna()
+        locations = locations[locations.map(lambda p: os.path.isfile(str(p)))]
+        if locations.empty:
+            logging.error("No readable audio files found in the library.")
+            return
+        paths = locations.sample(min(args.sample, len(locations)), random_state=0).tolist()
+
+        windows = int(cfg.get("AUDIO_SAMPLE_WINDOWS", 3))
+        seconds = float(cfg.get("AUDIO_SAMPLE_SECONDS", 10))
+        report = compare_analysis_modes(
+            paths,
+            duration=int(cfg.get("AUDIO_ANALYSIS_DURATION", 120)),
+            windows=windows,
+            window_sec=seconds,
+        )
+        if not report["tracks"]:
+            logging.error("None of the sampled tracks could be analyzed (is librosa installed?).")
+            return
+        print(f"Compared {report['tracks']} tracks: full vs. {windows} × {seconds:g} s windows")
+        print(
+            f"  time: full {report['full_seconds']:.1f} s, "
+            f"sampled {report['sampled_seconds']:.1f} s ({report['speedup']:.1f}× faster)"
+        )
+        if report["bpm_within_2"] is not None:
+            print(
+                f"  BPM within ±2: {report['bpm_within_2']:.0%} "
+                f"(allowing half/double tempo: {report['bpm_octave_match']:.0%})"
+            )
+        for feature, err in report["features"].items():
+            rel = err["mean_rel_error"]
+            rel_txt = f", mean relative error {rel:.1%}" if rel is not None else ""
+            print(f"  {feature}: mean absolute error {err['mae']:.4f}{rel_txt}")
+
+    elif args.command == "export-analysis-shards":
+        from .audio_analysis import export_analysis_shards
+
+        lib_dir = getattr(args, "library_dir", None)
+        if lib_dir:
+            from .itunes import build_library_from_dir
+            library_df = build_library_from_dir(lib_dir)
+        else:
+            from .pipeline import ensure_itunes_json
+            from .itunes import load_itunes_json
+            library_df = load_itunes_json(str(ensure_itunes_json(cfg)))
+
+        written = export_analysis_shards(
+            library_df,
+            db_path=cfg.get("AUDIO_CACHE_DB", str(Path.home() / ".playlistgen" / "audio.sqlite")),
+            out_dir=args.out,
+            shards=args.shards,
+            duration=int(cfg.get("AUDIO_ANALYSIS_DURATION", 120)),
+            mode=cfg.get("AUDIO_ANALYSIS_MODE", "full"),
+            sample_windows=int(cfg.get("AUDIO_SAMPLE_WINDOWS", 3)),
+            sample_seconds=float(cfg.get("AUDIO_SAMPLE_SECONDS", 10)),
+            extended=bool(cfg.get("AUDIO_EXTENDED_FEATURES", False)),
+        )
+        for shard_path in written:
+            print(shard_path)
+
+    elif args.command == "analyze-shard":
+        from .audio_analysis import analyze_shard
+
+        path_map = None
+        if args.path_map:
+            old, sep, new = args.path_map.partition("=")
+            if not sep or not old:
+                logging.error("--path-map must look like OLD=NEW")
+                sys.exit(1)
+            path_map = (old, new)
+        analyzed = analyze_shard(
+            args.shard_file,
+            out_db=args.out,
+            workers=args.workers,
+            path_map=path_map,
+            checkpoint_tracks=int(cfg.get("AUDIO_CHECKPOINT_TRACKS", 200)),
+            checkpoint_seconds=float(cfg.get("AUDIO_CHECKPOINT_SECONDS", 30)),
+        )
+        print(f"Analyzed {analyzed} tracks into {args.out}")
+
+    elif args.command == "merge-analysis-shards":
+        from .audio_analysis import merge_analysis_shards
+
+        db_path = cfg.get("AUDIO_CACHE_DB", str(Path.home() / ".playlistgen" / "audio.sqlite"))
+        try:
+            merged = merge_analysis_shards(db_path, args.shard_dbs)
+        except FileNotFoundError as exc:
+            logging.error("%s", exc)
+            sys.exit(1)
+        print(f"Merged {merged} analyzed tracks into {db_path}")
+
+    elif args.command == "import-audio-features":
+        from .audio_analysis import import_audio_features
+
+        lib_dir = getattr(args, "library_dir", None)
+        if lib_dir:
+            from .itunes import build_library_from_dir
+            library_df = build_library_from_dir(lib_dir)
+        else:
+            from .pipeline import ensure_itunes_json
+            from .itunes import load_itunes_json
+            library_df = load_itunes_json(str(ensure_itunes_json(cfg)))
+
+        db_path = cfg.get("AUDIO_CACHE_DB", str(Path.home() / ".playlistgen" / "audio.sqlite"))
+        imported = import_audio_features(
+            library_df,
+            db_path,
+            args.dump_file,
+            overwrite=args.overwrite,
+            partial=args.partial,
+        )
+        print(f"Imported features for {imported} tracks into {db_path}")
+
+    elif args.command == "analysis-service":
+        from .analysis_service import serve, stop_service
+
+        socket_path = cfg.get(
+            "AUDIO_WORKER_SOCKET", str(Path.home() / ".playlistgen" / "analysis.sock")
+        )
+        if args.stop:
+            if stop_service(socket_path):
+                print(f"Stopped the analysis service at {socket_path}")
+            else:
+                print(f"No analysis service is running at {socket_path}")
+            return
+        try:
+            serve(
+                socket_path,
+                workers=args.workers or int(cfg.get("AUDIO_ANALYSIS_WORKERS", 0)),
+                idle_timeout=args.idle_timeout * 60 or None,
+            )
+        except RuntimeError as exc:
+            logging.error("%s", exc)
+            sys.exit(1)
+
     elif args.command == "export-to-spotify":
         from .spotify_export import export_playlist_to_spotify
 
@@ -14,6 +14,8 @@ import logging
 
 import pandas as pd
 
+from .library_frame import working_copy
+
 try:
     from sklearn.feature_extraction.text import TfidfVectorizer
     from sklearn.cluster import KMeans
@@ -100,7 +102,7 @@ def cluster_by_audio_features(
     if not feature_cols:
         return []
 
-    df = df.copy()
+    df = working_copy(df)
     feat_df = df[feature_cols].copy()
     for col in feature_cols:
         feat_df[col] = pd.to_numeric(feat_df[col], errors="coerce")
@@ -153,7 +155,7 @@ def _cluster_hybrid_impl(
         return []
 
     result = []
-    for mood, mood_group in df.groupby("Mood"):
+    for mood, mood_group in df.groupby("Mood", observed=True):
         if not mood or mood == "Unknown" or mood_group.empty:
             continue
         if len(mood_group) < 10:
@@ -266,7 +268,7 @@ def cluster_tracks(
             )
         else:
             mood_groups = []
-            for mood, group in df.groupby("Mood"):
+            for mood, group in df.groupby("Mood", observed=True):
                 if mood and mood != "Unknown" and not group.empty:
                     mood_groups.append(group.copy())
             if mood_groups:
@@ -284,7 +286,7 @@ def cluster_tracks(
     if strategy == "year" or cluster_by_year:
         year_col = df.get("Year") if "Year" in df.columns else None
         if year_col is not None and year_col.notna().any():
-            df = df.copy()
+            df = working_copy(df)
             df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
             year_groups = []
 
@@ -341,11 +343,12 @@ def cluster_tracks(
         ]
         return [p for p in parts if not p.empty]
 
-    df = df.copy()
+    df = working_copy(df)
+    # astype(object) first: fillna("") can't add "" to a categorical column
     df["_text"] = (
-        df[["Genre", "Artist"]].fillna("").agg(" ".join, axis=1)
+        df[["Genre", "Artist"]].astype(object).fillna("").agg(" ".join, axis=1)
         + " "
-        + df.get("Mood", pd.Series("", index=df.index)).fillna("")
+        + df.get("Mood", pd.Series("", index=df.index)).astype(object).fillna("")
     )
 
     vectorizer = TfidfVectorizer(max_features=1000, min_df=1)
@@ -39,10 +39,15 @@ def load_config(path: str = None) -> dict:
         "CACHE_DB": str(Path.home() / ".playlistgen" / "mood_cache.sqlite"),
         "LASTFM_CACHE_DB": str(Path.home() / ".playlistgen" / "lastfm.sqlite"),
         "LASTFM_RATE_LIMIT_MS": 200,
+        "LASTFM_TRACK_MIN_PLAYS": 1,
         # Default Spotify OAuth redirect URI
         "SPOTIFY_REDIRECT_URI": "http://localhost:8888/callback",
         # mutagen audio tag enrichment
         "MUTAGEN_ENABLED": True,
+        "MUTAGEN_WORKERS": 0,
+        "MUTAGEN_CACHE_DB": str(Path.home() / ".playlistgen" / "tags.sqlite"),
+        # Categorical/float32 library frame for very large libraries
+        "COMPACT_LIBRARY": False,
         # AI playlist naming via local Ollama or Anthropic API
         "OLLAMA_BASE_URL": None,
         "OLLAMA_MODEL": "hf.co/unsloth/Qwen3.5-35B-A3B-GGUF:UD-IQ2_XXS",
@@ -59,6 +64,17 @@ def load_config(path: str = None) -> dict:
         "AUDIO_CACHE_DB": str(Path.home() / ".playlistgen" / "audio.sqlite"),
         "AUDIO_ANALYSIS_WORKERS": 0,
         "AUDIO_ANALYSIS_DURATION": 120,
+        "AUDIO_ANALYSIS_MODE": "full",  # "full" or "sampled"
+        "AUDIO_SAMPLE_WINDOWS": 3,
+        "AUDIO_SAMPLE_SECONDS": 10,
+        "AUDIO_CHECKPOINT_TRACKS": 200,
+        "AUDIO_CHECKPOINT_SECONDS": 30,
+        "AUDIO_PREFETCH_DEPTH": 0,  # files read ahead of the workers; 0 = off
+        "AUDIO_IO_WORKERS": 4,
+        "AUDIO_ANALYSIS_BUDGET": None,  # e.g. "45m", "2h" or a track count; None = all
+        "AUDIO_EXTENDED_FEATURES": False,  # MFCC / chroma / key / onset / intro-outro blob
+        "AUDIO_WORKER_SERVICE": False,  # use warm workers from `analysis-service` when running
+        "AUDIO_WORKER_SOCKET": str(Path.home() / ".playlistgen" / "analysis.sock"),
         # Phase 2: session model from Spotify streaming history JSON
         "SPOTIFY_HISTORY_PATH": None,
         "SESSION_GAP_MINUTES": 30,
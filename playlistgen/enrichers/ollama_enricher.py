@@ -19,6 +19,10 @@ from typing import Optional
 
 import pandas as pd
 
+from ..library_frame import working_copy
+from ..track_index import track_key
+from ..utils import sqlite_lookup
+
 try:
     import requests
 
@@ -146,38 +150,48 @@ def batch_enrich_ollama(
         logging.warning("Ollama enrichment cache DB init failed: %s", exc)
         conn = None
 
-    df = df.copy()
+    df = working_copy(df)
     for col in ("Mood", "Energy", "Valence"):
         if col not in df.columns:
             df[col] = None
 
     # Build list of tracks needing enrichment
     to_enrich = []
+    # Key each row from the same strings the checks below use, so the cache
+    # key can never disagree with them
+    candidates = []  # (df_idx, row, artist, name, cache_key)
     for idx, row in df.iterrows():
         artist = str(row.get("Artist") or "")
         name = str(row.get("Name") or "")
-        if not artist or not name:
-            continue
-        key = f"{artist} - {name}".lower().strip()
-
+        if artist and name:
+            candidates.append((idx, row, artist, name, track_key(artist, name)))
+    # One temp-table join for the whole library instead of a SELECT per row
+    cache_hits = (
+        sqlite_lookup(
+            conn,
+            "ollama_enrichment",
+            "key",
+            ("mood", "energy", "valence"),
+            [c[-1] for c in candidates],
+        )
+        if conn
+        else {}
+    )
+    for idx, row, artist, name, key in candidates:
         # Skip if already enriched
         if pd.notnull(row.get("Mood")) and row.get("Mood") not in ("Unknown", "", None):
             continue
 
         # Check cache
-        if conn:
-            cached = conn.execute(
-                "SELECT mood, energy, valence FROM ollama_enrichment WHERE key=?",
-                (key,),
-            ).fetchone()
-            if cached:
-                if cached[0]:
-                    df.at[idx, "Mood"] = cached[0]
-                if cached[1] is not None:
-                    df.at[idx, "Energy"] = int(cached[1])
-                if cached[2] is not None:
-                    df.at[idx, "Valence"] = int(cached[2])
-                continue
+        cached = cache_hits.get(key)
+        if cached:
+            if cached[0]:
+                df.at[idx, "Mood"] = cached[0]
+            if cached[1] is not None:
+                df.at[idx, "Energy"] = int(cached[1])
+            if cached[2] is not None:
+                df.at[idx, "Valence"] = int(cached[2])
+            continue
 
         genre = str(row.get("Genre") or "")
         bpm = row.get("BPM")
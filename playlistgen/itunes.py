@@ -1,22 +1,32 @@
 """
 iTunes library loading and local directory scanning for PlaylistGen.
 
-Provides three entry points:
-  convert_itunes_xml()    — Parse iTunes XML plist → slim JSON file.
+Provides these entry points:
+  iter_itunes_tracks()    — Stream track dicts out of an iTunes XML plist one at a time.
+  convert_itunes_xml()    — Parse iTunes XML plist → slim JSON file (streaming, constant memory).
   load_itunes_json()      — Load that JSON into a DataFrame (adds Year, BPM, Duration, Album).
   build_library_from_dir() — Scan a local directory for audio files using mutagen.
   save_itunes_json()      — Persist a DataFrame back to the slim JSON format.
+  save_library_snapshot() — Write a typed columnar .npz snapshot next to the JSON;
+                            load_itunes_json() prefers it while it is fresh.
 """
 
+import base64
 import json
 import logging
 import datetime
+import os
 import plistlib
+import textwrap
 from pathlib import Path
+from typing import Dict, Iterator, Optional
 from urllib.parse import unquote
+from xml.parsers.expat import ParserCreate
 
+import numpy as np
 import pandas as pd
 
+from .library_sync import start_sync, record_track, finish_sync
 from .utils import sanitize_label  # noqa: F401 — re-exported for backward compat
 
 
@@ -45,27 +55,187 @@ def _convert_datetimes(obj):
     return obj
 
 
-def convert_itunes_xml(in_path: str, out_path: str) -> None:
+_PLIST_CHUNK_BYTES = 1 << 16
+
+
+class _TrackStreamParser:
     """
-    Convert an iTunes Music Library XML (plist) to a slim JSON file.
+    Event-driven (expat) reader for iTunes library plists.
+
+    Only the values inside the top-level ``Tracks`` dict are materialised, and
+    each track dict is handed out as soon as its closing tag is seen.  The
+    library header and the ``Playlists`` array are skipped without building
+    any Python objects, so peak memory is one track plus one read chunk.
 
-    Decodes file:// URLs in the Location field to plain paths.
-    Converts datetime objects to ISO strings (JSON-serialisable).
+    Value conversion mirrors plistlib, except that dates become ISO strings
+    directly (what _convert_datetimes would produce afterwards).
     """
+
+    # Element depth: plist=1, root dict=2, root keys/values=3,
+    # track-ID keys / track dicts=4, track fields=5+
+    _TRACK_DEPTH = 4
+
+    def __init__(self):
+        self.parser = ParserCreate()
+        self.parser.StartElementHandler = self._begin
+        self.parser.EndElementHandler = self._end
+        self.parser.CharacterDataHandler = self._handle_data
+        self.parser.EntityDeclHandler = self._handle_entity_decl
+        self.depth = 0
+        self.root_key = None
+        self.in_tracks = False
+        self.stack: list = []
+        self.current_key = None
+        self.data: list = []
+        self.ready: list = []
+
+    def feed(self, chunk: bytes, final: bool = False) -> None:
+        self.parser.Parse(chunk, final)
+
+    def _handle_entity_decl(self, *args):
+        raise ValueError("XML entity declarations are not supported in plist files")
+
+    def _handle_data(self, data):
+        self.data.append(data)
+
+    def _add(self, value):
+        top = self.stack[-1]
+        if isinstance(top, dict):
+            top[self.current_key] = value
+            self.current_key = None
+        else:
+            top.append(value)
+
+    def _begin(self, name, attrs):
+        self.depth += 1
+        self.data = []
+        if self.in_tracks and self.depth >= self._TRACK_DEPTH:
+            if name in ("dict", "array"):
+                container = {} if name == "dict" else []
+                if self.stack:
+                    self._add(container)
+                self.stack.append(container)
+        elif self.depth == 3 and name == "dict" and self.root_key == "Tracks":
+            self.in_tracks = True
+
+    def _end(self, name):
+        depth = self.depth
+        self.depth -= 1
+        if depth == 3:
+            if name == "key":
+                self.root_key = "".join(self.data)
+            elif name == "dict" and self.in_tracks:
+                self.in_tracks = False
+            return
+        if not self.in_tracks or depth < self._TRACK_DEPTH:
+            return
+        if name in ("dict", "array"):
+            if not self.stack:
+                return
+            container = self.stack.pop()
+            if depth == self._TRACK_DEPTH and isinstance(container, dict):
+                self.ready.append(container)
+            return
+        if depth == self._TRACK_DEPTH or not self.stack:
+            return  # track-ID keys are dropped, like Tracks.values()
+        text = "".join(self.data)
+        self.data = []
+        if name == "key":
+            self.current_key = text
+        elif name == "string":
+            self._add(text)
+        elif name == "integer":
+            self._add(int(text, 16) if text[:2] in ("0x", "0X") else int(text))
+        elif name == "real":
+            self._add(float(text))
+        elif name == "true":
+            self._add(True)
+        elif name == "false":
+            self._add(False)
+        elif name == "date":
+            try:
+                value = datetime.datetime.strptime(text, "%Y-%m-%dT%H:%M:%SZ").isoformat()
+            except ValueError:
+                value = text
+            self._add(value)
+        elif name == "data":
+            self._add(base64.b64decode(text.encode("ascii")))
+
+
+def _iter_binary_plist_tracks(in_path: str) -> Iterator[dict]:
+    """Whole-file fallback for binary plists, which cannot be streamed."""
     with open(in_path, "rb") as f:
         plist = plistlib.load(f)
-    tracks = list(plist.get("Tracks", {}).values())
-    tracks = _convert_datetimes(tracks)
+    yield from _convert_datetimes(list(plist.get("Tracks", {}).values()))
+
+
+def _iter_xml_plist_tracks(in_path: str) -> Iterator[dict]:
+    parser = _TrackStreamParser()
+    with open(in_path, "rb") as f:
+        while True:
+            chunk = f.read(_PLIST_CHUNK_BYTES)
+            parser.feed(chunk, final=not chunk)
+            ready, parser.ready = parser.ready, []
+            yield from ready
+            if not chunk:
+                break
+
+
+def iter_itunes_tracks(in_path: str) -> Iterator[dict]:
+    """
+    Yield the track dicts of an iTunes library plist one at a time.
+
+    XML plists are parsed incrementally, so memory stays flat regardless of
+    library size.  Binary plists fall back to plistlib (whole file).
+    Dates are ISO strings and Location is decoded to a plain path.
+    """
+    with open(in_path, "rb") as f:
+        head = f.read(8)
+    if head.startswith(b"bplist"):
+        tracks = _iter_binary_plist_tracks(in_path)
+    else:
+        tracks = _iter_xml_plist_tracks(in_path)
 
-    # Decode file:// URLs in place so downstream code gets plain paths
     for t in tracks:
         if "Location" in t and isinstance(t["Location"], str):
             t["Location"] = _decode_location(t["Location"])
+        yield t
 
-    Path(out_path).parent.mkdir(parents=True, exist_ok=True)
-    with open(out_path, "w", encoding="utf-8") as f:
-        json.dump({"tracks": tracks}, f, ensure_ascii=False, indent=2)
-    logging.info("Converted %d iTunes tracks to %s", len(tracks), out_path)
+
+def convert_itunes_xml(in_path: str, out_path: str) -> None:
+    """
+    Convert an iTunes Music Library XML (plist) to a slim JSON file.
+
+    Tracks are streamed from the plist and written as they arrive, so peak
+    memory does not grow with library size.  The output is byte-for-byte what
+    ``json.dump({"tracks": [...]}, indent=2, ensure_ascii=False)`` would give.
+    Decodes file:// URLs in the Location field to plain paths and converts
+    dates to ISO strings.  The file is written atomically via a temp file.
+
+    Each track is also fingerprinted and diffed against the previous export
+    (see library_sync); the change set is stored beside the JSON.
+    """
+    out = Path(out_path)
+    out.parent.mkdir(parents=True, exist_ok=True)
+    tmp = out.with_name(out.name + ".tmp")
+
+    sync = start_sync(out)
+    count = 0
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            f.write('{\n  "tracks": [')
+            for t in iter_itunes_tracks(in_path):
+                record_track(sync, t)
+                f.write(",\n" if count else "\n")
+                f.write(textwrap.indent(json.dumps(t, ensure_ascii=False, indent=2), "    "))
+                count += 1
+            f.write("\n  ]\n}" if count else "]\n}")
+        os.replace(tmp, out)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    finish_sync(sync, out)
+    logging.info("Converted %d iTunes tracks to %s", count, out_path)
 
 
 # ---------------------------------------------------------------------------
@@ -94,14 +264,23 @@ _KEEP_COLS = [
 ]
 
 
-def load_itunes_json(path: str) -> pd.DataFrame:
+def load_itunes_json(path: str, use_snapshot: bool = True) -> pd.DataFrame:
     """
     Load a slim iTunes JSON file into a normalised pandas DataFrame.
 
     Preserves Year, BPM, Duration (converted from ms → seconds), and Album
     in addition to the original columns so scoring and clustering work properly.
     Decodes any remaining file:// URLs in the Location column.
+
+    If a fresh columnar snapshot of this JSON exists (see save_library_snapshot)
+    it is returned instead, skipping the JSON parse and normalisation entirely.
+    Pass use_snapshot=False to force the JSON path.
     """
+    if use_snapshot:
+        df = load_library_snapshot(path)
+        if df is not None:
+            return df
+
     with open(path, "r", encoding="utf-8") as f:
         data = json.load(f)
 
@@ -176,7 +355,47 @@ def load_itunes_json(path: str) -> pd.DataFrame:
 AUDIO_EXTS = {".mp3", ".m4a", ".flac", ".ogg", ".wav", ".aac", ".wma", ".opus"}
 
 
-def build_library_from_dir(directory: str, mutagen_enabled: bool = True) -> pd.DataFrame:
+def _scan_audio_files(root: str) -> Iterator[str]:
+    """
+    Walk root with os.scandir and yield absolute paths of audio files.
+
+    Uses the directory-entry type info the OS already returned, so plain
+    files and directories cost no extra stat calls (important on network
+    mounts).  Symlinked directories are not followed; symlinked files are
+    resolved to their target, matching Path.resolve().
+    """
+    stack = [root]
+    while stack:
+        current = stack.pop()
+        try:
+            it = os.scandir(current)
+        except OSError as exc:
+            logging.debug("Cannot scan %s: %s", current, exc)
+            continue
+        with it:
+            for entry in it:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                        continue
+                    if os.path.splitext(entry.name)[1].lower() not in AUDIO_EXTS:
+                        continue
+                    if entry.is_symlink():
+                        if not entry.is_file():
+                            continue
+                        yield os.path.realpath(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        yield entry.path
+                except OSError:
+                    continue
+
+
+def build_library_from_dir(
+    directory: str,
+    mutagen_enabled: bool = True,
+    workers: int = 0,
+    tag_cache_db: Optional[str] = None,
+) -> pd.DataFrame:
     """
     Recursively scan a directory for audio files and build a library DataFrame.
 
@@ -188,6 +407,10 @@ def build_library_from_dir(directory: str, mutagen_enabled: bool = True) -> pd.D
         directory:       Path to the music folder to scan recursively.
         mutagen_enabled: If False, skip embedded tag extraction (respects
                          MUTAGEN_ENABLED config flag).
+        workers:         Tag-reading threads (MUTAGEN_WORKERS; 0 = auto,
+                         1 = serial).
+        tag_cache_db:    Optional SQLite tag cache (MUTAGEN_CACHE_DB); files
+                         with unchanged (path, size, mtime) are not re-read.
     """
     from .metadata import enrich_dataframe, MUTAGEN_AVAILABLE
 
@@ -195,48 +418,48 @@ def build_library_from_dir(directory: str, mutagen_enabled: bool = True) -> pd.D
     if not dir_path.exists():
         raise FileNotFoundError(f"Library directory not found: {directory}")
 
-    records = []
-    for file in dir_path.rglob("*"):
-        if file.suffix.lower() not in AUDIO_EXTS:
-            continue
-
-        stem = file.stem
+    # Build columns directly — one pass, no per-row dicts
+    names: list = []
+    artists: list = []
+    locations: list = []
+    for location in _scan_audio_files(str(dir_path.resolve())):
+        stem = os.path.splitext(os.path.basename(location))[0]
         artist, name = "Unknown", stem
         if " - " in stem:
             parts = stem.split(" - ", 1)
             if parts[0].strip():
                 artist = parts[0].strip()
                 name = parts[1].strip()
+        names.append(name)
+        artists.append(artist)
+        locations.append(location)
 
-        records.append(
-            {
-                "Name": name,
-                "Artist": artist,
-                "Genre": None,
-                "Location": str(file.resolve()),
-                "Play Count": 0,
-                "Skip Count": 0,
-                "Year": None,
-                "BPM": None,
-                "Duration": None,
-                "Album": None,
-            }
-        )
-
-    if not records:
+    if not locations:
         logging.warning("No audio files found in %s", directory)
         return pd.DataFrame(
             columns=["Name", "Artist", "Genre", "Location",
                      "Play Count", "Skip Count", "Year", "BPM", "Duration", "Album"]
         )
 
-    df = pd.DataFrame(records)
-    df.dropna(subset=["Name", "Artist"], inplace=True)
-    df.reset_index(drop=True, inplace=True)
+    n = len(locations)
+    df = pd.DataFrame(
+        {
+            "Name": names,
+            "Artist": artists,
+            "Genre": [None] * n,
+            "Location": locations,
+            "Play Count": np.zeros(n, dtype=np.int64),
+            "Skip Count": np.zeros(n, dtype=np.int64),
+            "Year": [None] * n,
+            "BPM": [None] * n,
+            "Duration": [None] * n,
+            "Album": [None] * n,
+        }
+    )
 
-    # Enrich with mutagen tags (fills Name from title tag too if available)
+    # Enrich with mutagen tags (concurrent reads, columnar fill)
     if mutagen_enabled and MUTAGEN_AVAILABLE:
-        df = enrich_dataframe(df, enabled=True)
+        df = enrich_dataframe(df, enabled=True, workers=workers, cache_db=tag_cache_db)
     elif not mutagen_enabled:
         logging.info("Mutagen tag extraction disabled (MUTAGEN_ENABLED=false).")
 
@@ -263,3 +486,199 @@ def save_itunes_json(df: pd.DataFrame, path) -> None:
     with open(p, "w", encoding="utf-8") as f:
         json.dump(data, f, ensure_ascii=False, indent=2)
     logging.info("Saved %d tracks to %s", len(df), p)
+
+
+# ---------------------------------------------------------------------------
+# Columnar library snapshot (.npz next to the JSON)
+# ---------------------------------------------------------------------------
+
+_SNAPSHOT_VERSION = 2
+
+# Missing-value codes in a dictionary-encoded column
+_CODE_NONE = -1
+_CODE_NAN = -2
+
+
+def library_snapshot_path(json_path) -> Path:
+    """Return the snapshot path that belongs to a slim library JSON file."""
+    return Path(json_path).with_suffix(".npz")
+
+
+def _source_stamp(json_path) -> np.ndarray:
+    st = os.stat(json_path)
+    return np.array([st.st_mtime_ns, st.st_size], dtype=np.int64)
+
+
+def _pack_bytes(data: bytes) -> np.ndarray:
+    return np.frombuffer(data, dtype=np.uint8)
+
+
+def _encode_strings(series: pd.Series) -> Optional[Dict[str, np.ndarray]]:
+    """
+    Dictionary-encode a column of strings → int32 codes, a UTF-8 blob of the
+    distinct values, and their int64 end offsets in the blob (one per value,
+    so the value count is explicit and values may contain any character).
+    Missing values keep their kind: None → -1, NaN → -2.
+
+    Returns None if the column holds anything besides strings and missing
+    values; the caller stores those columns as JSON instead.
+    """
+    if pd.api.types.infer_dtype(series, skipna=True) not in ("string", "empty"):
+        return None
+    values = series.to_numpy(dtype=object)
+    is_none = np.equal(values, None)
+    is_nan = pd.isna(values) & ~is_none
+    if not all(isinstance(v, float) for v in values[is_nan]):
+        return None  # pd.NA / NaT — not worth a code of their own
+    codes, uniques = pd.factorize(values, use_na_sentinel=True)
+    codes = codes.astype(np.int32)
+    codes[is_nan] = _CODE_NAN
+    encoded = [u.encode("utf-8") for u in uniques]
+    return {
+        "codes": codes,
+        "strings": _pack_bytes(b"".join(encoded)),
+        "ends": np.cumsum([len(b) for b in encoded], dtype=np.int64),
+        "dtype": _pack_bytes(str(series.dtype).encode("utf-8")),
+    }
+
+
+def _decode_strings(
+    codes: np.ndarray, blob: np.ndarray, ends: np.ndarray, dtype: np.ndarray
+) -> pd.Series:
+    raw = blob.tobytes()
+    lookup = np.empty(len(ends) + 2, dtype=object)
+    start = 0
+    for j, end in enumerate(ends.tolist()):
+        lookup[j] = raw[start:end].decode("utf-8")
+        start = end
+    lookup[_CODE_NONE] = None  # negative codes index the two trailing slots
+    lookup[_CODE_NAN] = np.nan
+    return pd.Series(lookup[codes], dtype=dtype.tobytes().decode("utf-8"))
+
+
+def _encode_json(series: pd.Series) -> np.ndarray:
+    """Fallback for mixed object columns: the values as one JSON array."""
+    return _pack_bytes(json.dumps(series.tolist(), ensure_ascii=False).encode("utf-8"))
+
+
+def _decode_json(blob: np.ndarray) -> pd.Series:
+    values = json.loads(blob.tobytes().decode("utf-8"))
+    out = np.empty(len(values), dtype=object)
+    out[:] = values
+    return pd.Series(out, dtype=object)
+
+
+def save_library_snapshot(df: pd.DataFrame, json_path) -> Path:
+    """
+    Write a typed columnar snapshot of a normalised library DataFrame.
+
+    Numeric columns are stored with their dtypes as-is; string columns are
+    dictionary-encoded (int32 codes + one UTF-8 blob of distinct values), so a
+    200k-track library loads in milliseconds with no per-row Python work.
+    Object columns that mix in other values (e.g. a numeric Name) are stored
+    as JSON so they load exactly as the JSON path would.
+    The snapshot records the JSON's mtime/size and is ignored once the JSON
+    changes.  Returns the snapshot path.
+    """
+    snap = library_snapshot_path(json_path)
+    arrays = {
+        "__version__": np.array([_SNAPSHOT_VERSION], dtype=np.int64),
+        "__source__": _source_stamp(json_path),
+        "__columns__": np.frombuffer(
+            "\0".join(df.columns).encode("utf-8"), dtype=np.uint8
+        ),
+    }
+    for i, col in enumerate(df.columns):
+        series = df[col]
+        if isinstance(series.dtype, np.dtype) and series.dtype.kind in "biuf":
+            arrays[f"c{i}"] = series.to_numpy()
+        elif pd.api.types.is_numeric_dtype(series.dtype):
+            # Nullable extension dtypes (Int64, Float32…) → plain float with NaN
+            arrays[f"c{i}"] = series.to_numpy(dtype="float64", na_value=np.nan)
+        else:
+            encoded = _encode_strings(series)
+            if encoded is None:
+                arrays[f"c{i}_json"] = _encode_json(series)
+            else:
+                for part, array in encoded.items():
+                    arrays[f"c{i}_{part}"] = array
+
+    tmp = snap.with_name(snap.name + ".tmp")
+    with open(tmp, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, snap)
+    logging.info("Saved columnar library snapshot (%d tracks) to %s", len(df), snap)
+    return snap
+
+
+def library_snapshot_is_fresh(json_path) -> bool:
+    """True if a current-version snapshot exists and matches the JSON on disk."""
+    snap = library_snapshot_path(json_path)
+    if not snap.exists() or not Path(json_path).exists():
+        return False
+    try:
+        with np.load(snap) as data:
+            return (
+                int(data["__version__"][0]) == _SNAPSHOT_VERSION
+                and np.array_equal(data["__source__"], _source_stamp(json_path))
+            )
+    except Exception:
+        return False
+
+
+def load_library_snapshot(json_path) -> Optional[pd.DataFrame]:
+    """
+    Load the columnar snapshot for json_path.
+
+    Returns None if there is no snapshot, it is stale relative to the JSON,
+    or it cannot be read — callers then fall back to parsing the JSON.
+    """
+    snap = library_snapshot_path(json_path)
+    if not snap.exists() or not Path(json_path).exists():
+        return None
+    try:
+        with np.load(snap) as data:
+            if int(data["__version__"][0]) != _SNAPSHOT_VERSION:
+                return None
+            if not np.array_equal(data["__source__"], _source_stamp(json_path)):
+                return None
+            blob = data["__columns__"]
+            columns = blob.tobytes().decode("utf-8").split("\0") if blob.size else []
+            cols = {}
+            for i, col in enumerate(columns):
+                if f"c{i}" in data.files:
+                    cols[col] = data[f"c{i}"]
+                elif f"c{i}_json" in data.files:
+                    cols[col] = _decode_json(data[f"c{i}_json"])
+                else:
+                    cols[col] = _decode_strings(
+                        data[f"c{i}_codes"],
+                        data[f"c{i}_strings"],
+                        data[f"c{i}_ends"],
+                        data[f"c{i}_dtype"],
+                    )
+    except Exception as exc:
+        logging.warning("Could not read library snapshot %s: %s — using JSON.", snap, exc)
+        return None
+
+    df = pd.DataFrame(cols, columns=columns)
+    logging.info("Loaded %d tracks from snapshot %s", len(df), snap)
+    return df
+
+
+def refresh_library_snapshot(json_path) -> bool:
+    """
+    (Re)build the snapshot for json_path if it is missing or stale.
+
+    Returns True if a snapshot was written.  Never raises — a failure only
+    means load_itunes_json keeps using the JSON.
+    """
+    if not Path(json_path).exists() or library_snapshot_is_fresh(json_path):
+        return False
+    try:
+        df = load_itunes_json(str(json_path), use_snapshot=False)
+        save_library_snapshot(df, json_path)
+        return True
+    except Exception as exc:
+        logging.warning("Could not write library snapshot for %s: %s", json_path, exc)
+        return False
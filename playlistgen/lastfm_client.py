@@ -5,17 +5,41 @@ Supersedes tag_mood_service.py (Last.fm calls) and genre_service.py.
 
 Design:
 - SQLite cache (WAL mode) — no file-locking issues like shelve.
-- Module-level rate limiter: enforces LASTFM_RATE_LIMIT_MS between calls.
+- Shared token-bucket rate limiter: every request in the process draws from
+  one bucket refilled at one token per LASTFM_RATE_LIMIT_MS, so the aggregate
+  rate holds however many threads are fetching.
+- generate_tag_cache() fetches on MOOD_CONCURRENCY threads, each with its own
+  keep-alive requests.Session.  Slow responses and retry back-offs then only
+  stall one thread while the others keep the limiter busy; results are
+  cached in order of completion.
+- Fetched tags go through a background _CacheWriter that upserts them in
+  batched transactions (every _WRITE_BATCH rows or _WRITE_SECONDS), so
+  neither fetch threads nor the result loop ever wait on a commit/fsync.
 - Retry once on HTTP 429 / 5xx with a 2 s sleep before the second attempt.
+- Two tag tiers.  track.getTopTags is called only for tracks the caller
+  selects (by default, tracks with plays); artist.getTopTags is called once
+  per artist that has a track without track-level tags.  TagStore.get()
+  falls back to the artist's tags for those tracks, so deep album cuts cost
+  one shared artist call instead of one empty track call each.
+- Readers get a TagStore: a lazy, read-only mapping over the SQLite cache.
+  Rows are read on demand behind an LRU, and load(keys) bulk-reads the
+  tracks a run scores, so nothing else is decoded.  IDF tag counts are
+  aggregated inside SQLite.  Call close() when done to release the
+  connection.
 - Stores only raw tag lists; mood classification happens at score time via
   mood_map.canonical_mood(), so keyword changes never require a cache rebuild.
 - One-time migration from the old JSON cache format on first run.
 """
 
+import collections
 import json
 import logging
+import queue
 import sqlite3
+import threading
 import time
+from collections.abc import Mapping
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
 from pathlib import Path
 from typing import Dict, List, Optional
 
@@ -27,10 +51,16 @@ except ImportError:
     _REQUESTS_AVAILABLE = False
     logging.warning("requests not installed — Last.fm tag fetching disabled.")
 
-from .utils import progress_bar
+from .utils import progress_bar, sqlite_lookup
 
 _LASTFM_BASE = "https://ws.audioscrobbler.com/2.0/"
-_last_call_time: float = 0.0  # module-level timestamp of last API call
+_RETRY_DELAY_SEC = 2.0
+_WRITE_BATCH = 500  # tag rows per cache transaction…
+_WRITE_SECONDS = 5.0  # …or seconds, whichever comes first
+_TRACK_TABLE = "tag_cache"  # "artist - track" → track.getTopTags
+_ARTIST_TABLE = "artist_tag_cache"  # "artist" → artist.getTopTags
+_VERSION = "tag_cache_version"
+_COUNTS_VERSION = "tag_counts_version"
 
 
 # ---------------------------------------------------------------------------
@@ -46,17 +76,47 @@ def init_cache_db(db_path: str) -> sqlite3.Connection:
     Path(db_path).parent.mkdir(parents=True, exist_ok=True)
     conn = sqlite3.connect(db_path, check_same_thread=False)
     conn.execute("PRAGMA journal_mode=WAL")
-    conn.execute(
-        """
-        CREATE TABLE IF NOT EXISTS tag_cache (
-            key        TEXT PRIMARY KEY,
-            tags_json  TEXT NOT NULL,
-            fetched_at INTEGER NOT NULL
+    _init_schema(conn)
+    return conn
+
+
+def _init_schema(conn: sqlite3.Connection) -> None:
+    for table in (_TRACK_TABLE, _ARTIST_TABLE):
+        conn.execute(
+            f"""
+            CREATE TABLE IF NOT EXISTS {table} (
+                key        TEXT PRIMARY KEY,
+                tags_json  TEXT NOT NULL,
+                fetched_at INTEGER NOT NULL
+            )
+            """
         )
+    # Persisted IDF counts (see TagStore.tag_counts), invalidated by a version
+    # counter that triggers bump on every tag_cache change
+    conn.executescript(
+        f"""
+        CREATE TABLE IF NOT EXISTS cache_meta (
+            name  TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        );
+        INSERT OR IGNORE INTO cache_meta VALUES ('{_VERSION}', 0);
+        CREATE TABLE IF NOT EXISTS tag_counts (
+            tag TEXT PRIMARY KEY,
+            n   INTEGER NOT NULL
+        );
         """
     )
+    for event in ("INSERT", "UPDATE", "DELETE"):
+        conn.execute(
+            f"""
+            CREATE TRIGGER IF NOT EXISTS {_TRACK_TABLE}_{event.lower()}
+            AFTER {event} ON {_TRACK_TABLE}
+            BEGIN
+                UPDATE cache_meta SET value = value + 1 WHERE name = '{_VERSION}';
+            END
+            """
+        )
     conn.commit()
-    return conn
 
 
 def _get_cached(conn: sqlite3.Connection, key: str) -> Optional[List[str]]:
@@ -72,64 +132,188 @@ def _get_cached(conn: sqlite3.Connection, key: str) -> Optional[List[str]]:
     return None
 
 
+def _cached_keys(conn: sqlite3.Connection, keys: List[str]) -> set:
+    """Return the subset of keys already in the cache (one temp-table join)."""
+    return set(sqlite_lookup(conn, "tag_cache", "key", (), keys))
+
+
+def _lastfm_key(artist: str, track: str) -> str:
+    return f"{artist.lower().strip()} - {track.lower().strip()}"
+
+
+def _artist_key(artist: str) -> str:
+    return artist.lower().strip()
+
+
 def _set_cached(conn: sqlite3.Connection, key: str, tags: List[str]) -> None:
     """Upsert a tag list into the cache."""
-    conn.execute(
-        "INSERT OR REPLACE INTO tag_cache (key, tags_json, fetched_at) VALUES (?, ?, ?)",
-        (key, json.dumps(tags), int(time.time())),
-    )
-    conn.commit()
+    _set_cached_batch(conn, [(key, tags)])
+
+
+def _set_cached_batch(
+    conn: sqlite3.Connection, items: List[tuple], table: str = _TRACK_TABLE
+) -> None:
+    """Upsert many (key, tags) pairs into table in one transaction."""
+    now = int(time.time())
+    with conn:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {table} (key, tags_json, fetched_at) VALUES (?, ?, ?)",
+            [(key, json.dumps(tags), now) for key, tags in items],
+        )
+
+
+class _CacheWriter:
+    """
+    Background thread that owns all writes to one cache table during a
+    fetch run.
+
+    put() only enqueues, so callers never wait on SQLite.  The writer
+    commits whatever has queued up every `batch_size` rows or
+    `flush_seconds`, whichever comes first.  close() — also called on
+    leaving a `with` block, including on Ctrl-C — writes the remainder and
+    waits for the thread.  A failed batch is logged and dropped; those
+    tracks are simply fetched again next run.
+    """
+
+    _STOP = object()
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        batch_size: int = _WRITE_BATCH,
+        flush_seconds: float = _WRITE_SECONDS,
+        table: str = _TRACK_TABLE,
+    ):
+        self.written = 0
+        self._conn = conn
+        self._table = table
+        self._batch_size = batch_size
+        self._flush_seconds = flush_seconds
+        self._queue: queue.Queue = queue.Queue()
+        self._thread = threading.Thread(
+            target=self._run, name="lastfm-cache-writer", daemon=True
+        )
+        self._thread.start()
+
+    def put(self, key: str, tags: List[str]) -> None:
+        self._queue.put((key, tags))
+
+    def close(self) -> None:
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def _flush(self, batch: List[tuple]) -> None:
+        if not batch:
+            return
+        try:
+            _set_cached_batch(self._conn, batch, self._table)
+            self.written += len(batch)
+        except Exception as exc:  # any failure must leave the writer thread running
+            logging.warning("Last.fm cache write failed for %d tracks: %s", len(batch), exc)
+        batch.clear()
+
+    def _run(self) -> None:
+        batch: List[tuple] = []
+        deadline = time.monotonic() + self._flush_seconds
+        while True:
+            try:
+                item = self._queue.get(timeout=max(0.0, deadline - time.monotonic()))
+            except queue.Empty:
+                item = None
+            if item is self._STOP:
+                self._flush(batch)
+                return
+            if item is not None:
+                batch.append(item)
+            if len(batch) >= self._batch_size or time.monotonic() >= deadline:
+                self._flush(batch)
+                deadline = time.monotonic() + self._flush_seconds
 
 
 # ---------------------------------------------------------------------------
-# API fetch
+# Rate limiting + sessions
 # ---------------------------------------------------------------------------
 
 
-def fetch_track_tags(
-    artist: str,
-    track: str,
-    api_key: str,
-    conn: sqlite3.Connection,
-    rate_limit_ms: int = 200,
-) -> List[str]:
+class TokenBucket:
     """
-    Fetch Last.fm top tags for (artist, track).
+    Thread-safe token bucket: at most `rate` acquisitions per second on
+    average, with bursts of up to `capacity`.
 
-    - Checks SQLite cache first; returns immediately on hit.
-    - Enforces rate_limit_ms delay between successive API calls.
-    - Retries once on HTTP 429 / 5xx (2 s sleep before retry).
-    - Caches an empty list on second failure so we don't hammer the API.
-
-    Returns a (possibly empty) list of tag name strings.
+    acquire() reserves a token under the lock and sleeps outside it until the
+    token is due, so waiting threads are served in arrival order and none of
+    them holds the lock while asleep.  rate <= 0 means unlimited.
     """
-    global _last_call_time
 
-    if not api_key or not _REQUESTS_AVAILABLE:
-        return []
+    def __init__(self, rate: float, capacity: float = 1.0):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> float:
+        """Take one token, sleeping until it is available.  Returns seconds waited."""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            self._tokens = min(
+                self.capacity, self._tokens + (now - self._updated) * self.rate
+            )
+            self._updated = now
+            self._tokens -= 1.0
+            wait_sec = -self._tokens / self.rate if self._tokens < 0 else 0.0
+        if wait_sec > 0:
+            time.sleep(wait_sec)
+        return wait_sec
+
+
+_limiter: Optional[TokenBucket] = None
+_limiter_lock = threading.Lock()
+_sessions = threading.local()
+
+
+def _shared_limiter(rate_limit_ms: int) -> TokenBucket:
+    """The process-wide limiter, rebuilt only when rate_limit_ms changes."""
+    global _limiter
+    rate = 1000.0 / rate_limit_ms if rate_limit_ms > 0 else 0.0
+    with _limiter_lock:
+        if _limiter is None or _limiter.rate != rate:
+            _limiter = TokenBucket(rate)
+        return _limiter
+
+
+def _session():
+    """This thread's keep-alive requests.Session (Sessions are not thread-safe)."""
+    session = getattr(_sessions, "session", None)
+    if session is None:
+        session = _sessions.session = _requests.Session()
+    return session
+
+
+# ---------------------------------------------------------------------------
+# API fetch
+# ---------------------------------------------------------------------------
 
-    key = f"{artist.lower().strip()} - {track.lower().strip()}"
-    cached = _get_cached(conn, key)
-    if cached is not None:
-        return cached
 
-    # Rate limiting
-    elapsed = time.time() - _last_call_time
-    wait = (rate_limit_ms / 1000.0) - elapsed
-    if wait > 0:
-        time.sleep(wait)
+def _request_top_tags(params: dict, label: str, limiter: TokenBucket) -> List[str]:
+    """
+    Call a Last.fm *.getTopTags method, retrying once on HTTP 429 / 5xx or a
+    network error.  Never raises; returns [] on a second failure.
+    """
 
     def _do_request() -> List[str]:
-        params = {
-            "method": "track.gettoptags",
-            "artist": artist,
-            "track": track,
-            "api_key": api_key,
-            "format": "json",
-            "autocorrect": "1",
-        }
-        resp = _requests.get(_LASTFM_BASE, params=params, timeout=8)
-        _last_call_time = time.time()
+        limiter.acquire()
+        resp = _session().get(_LASTFM_BASE, params=params, timeout=8)
         if resp.status_code == 200:
             data = resp.json()
             return [
@@ -143,16 +327,70 @@ def fetch_track_tags(
         return []
 
     try:
-        tags = _do_request()
+        return _do_request()
     except Exception as exc:
-        logging.debug("Last.fm first attempt failed for %s - %s: %s", artist, track, exc)
-        time.sleep(2.0)
+        logging.debug("Last.fm first attempt failed for %s: %s", label, exc)
+        time.sleep(_RETRY_DELAY_SEC)
         try:
-            tags = _do_request()
+            return _do_request()
         except Exception as exc2:
-            logging.warning("Last.fm failed for %s - %s: %s", artist, track, exc2)
-            tags = []
+            logging.warning("Last.fm failed for %s: %s", label, exc2)
+            return []
+
+
+def _request_tags(
+    artist: str, track: str, api_key: str, limiter: TokenBucket
+) -> List[str]:
+    """track.getTopTags for (artist, track)."""
+    params = {
+        "method": "track.gettoptags",
+        "artist": artist,
+        "track": track,
+        "api_key": api_key,
+        "format": "json",
+        "autocorrect": "1",
+    }
+    return _request_top_tags(params, f"{artist} - {track}", limiter)
+
+
+def _request_artist_tags(artist: str, api_key: str, limiter: TokenBucket) -> List[str]:
+    """artist.getTopTags for artist."""
+    params = {
+        "method": "artist.gettoptags",
+        "artist": artist,
+        "api_key": api_key,
+        "format": "json",
+        "autocorrect": "1",
+    }
+    return _request_top_tags(params, artist, limiter)
+
+
+def fetch_track_tags(
+    artist: str,
+    track: str,
+    api_key: str,
+    conn: sqlite3.Connection,
+    rate_limit_ms: int = 200,
+) -> List[str]:
+    """
+    Fetch Last.fm top tags for (artist, track).
 
+    - Checks SQLite cache first; returns immediately on hit.
+    - Draws from the shared limiter (one call per rate_limit_ms process-wide).
+    - Retries once on HTTP 429 / 5xx (2 s sleep before retry).
+    - Caches an empty list on second failure so we don't hammer the API.
+
+    Returns a (possibly empty) list of tag name strings.
+    """
+    if not api_key or not _REQUESTS_AVAILABLE:
+        return []
+
+    key = _lastfm_key(artist, track)
+    cached = _get_cached(conn, key)
+    if cached is not None:
+        return cached
+
+    tags = _request_tags(artist, track, api_key, _shared_limiter(rate_limit_ms))
     _set_cached(conn, key, tags)
     return tags
 
@@ -182,17 +420,17 @@ def migrate_json_to_sqlite(json_path: str, conn: sqlite3.Connection) -> int:
         logging.warning("Could not read old tag cache %s: %s", json_path, exc)
         return 0
 
-    migrated = 0
+    entries = {}
     for key, val in old_db.items():
         if isinstance(val, list):
-            tags = val
+            entries[key] = val
         elif isinstance(val, dict):
-            tags = val.get("tags", [])
-        else:
-            continue
-        if _get_cached(conn, key) is None:
-            _set_cached(conn, key, tags)
-            migrated += 1
+            entries[key] = val.get("tags", [])
+    existing = _cached_keys(conn, list(entries))
+    new = [(key, tags) for key, tags in entries.items() if key not in existing]
+    if new:
+        _set_cached_batch(conn, new)
+    migrated = len(new)
 
     if migrated:
         logging.info(
@@ -212,21 +450,36 @@ def generate_tag_cache(
     db_path: str,
     json_legacy_path: Optional[str] = None,
     rate_limit_ms: int = 200,
-) -> Dict[str, List[str]]:
+    workers: int = 10,
+    track_lookups: Optional[set] = None,
+) -> "TagStore":
     """
     Fetch Last.fm tags for all (artist, track) pairs in track_list.
 
     - Opens (or creates) the SQLite cache at db_path.
     - Optionally migrates the old JSON cache first.
-    - Skips pairs already cached.
-    - Returns the full tag_db as a dict: {"artist - track" -> [tag, ...]}
+    - Skips pairs and artists already cached.
+    - Calls track.getTopTags for uncached tracks selected by track_lookups,
+      then artist.getTopTags for every artist that still has a track without
+      track-level tags (never looked up, or looked up and empty).
+    - Fetches on `workers` threads sharing one rate limiter.  Results are
+      committed in batches by a background writer, which flushes on exit, so
+      an interrupted run keeps what it fetched.
+    - Returns a TagStore over the refreshed cache: {"artist - track" ->
+      [tag, ...]} with artist-tag fallback in .get(), read on demand rather
+      than loaded into memory.  Close it when done.
 
     Args:
         track_list:       List of (artist, track) tuples.
         api_key:          Last.fm API key.
         db_path:          Path to the SQLite cache file.
         json_legacy_path: Optional path to an old JSON cache to migrate.
-        rate_limit_ms:    Minimum milliseconds between API calls.
+        rate_limit_ms:    Minimum milliseconds between API calls, across all
+                          threads (the aggregate rate is 1000 / rate_limit_ms
+                          calls per second).
+        workers:          Concurrent requests (MOOD_CONCURRENCY).
+        track_lookups:    "artist - track" keys (see select_track_lookups())
+                          that deserve a track-level call.  None = every track.
     """
     conn = init_cache_db(db_path)
 
@@ -236,36 +489,421 @@ def generate_tag_cache(
     unique_tracks = list(
         {(a.strip(), t.strip()) for a, t in track_list if a and t}
     )
+    keys = [_lastfm_key(a, t) for a, t in unique_tracks]
+    cached = _cached_keys(conn, keys)
+    to_fetch = [
+        pair
+        for pair, key in zip(unique_tracks, keys)
+        if key not in cached and (track_lookups is None or key in track_lookups)
+    ]
     logging.info(
-        "Fetching Last.fm tags for %d unique tracks (cached ones skipped)...",
+        "Fetching Last.fm tags for %d of %d unique tracks (%d cached, %d left to "
+        "artist tags)...",
+        len(to_fetch),
         len(unique_tracks),
+        len(cached),
+        len(unique_tracks) - len(cached) - len(to_fetch),
     )
+    fetching = bool(api_key and _REQUESTS_AVAILABLE)
+    limiter = _shared_limiter(rate_limit_ms)
+    workers = max(1, workers)
+
+    if to_fetch and fetching:
+        _fetch_into_cache(
+            conn,
+            to_fetch,
+            lambda pair: _request_tags(*pair, api_key, limiter),
+            lambda pair: _lastfm_key(*pair),
+            _TRACK_TABLE,
+            workers,
+        )
 
-    for artist, track in progress_bar(unique_tracks, desc="Last.fm tags"):
-        fetch_track_tags(artist, track, api_key, conn, rate_limit_ms)
+    if fetching:
+        artists = _artists_needing_tags(conn, unique_tracks, keys)
+        if artists:
+            logging.info("Fetching Last.fm artist tags for %d artists...", len(artists))
+            _fetch_into_cache(
+                conn,
+                artists,
+                lambda artist: _request_artist_tags(artist, api_key, limiter),
+                _artist_key,
+                _ARTIST_TABLE,
+                workers,
+            )
 
     conn.close()
-    return load_tag_db_from_sqlite(db_path)
+    return TagStore(db_path)
+
+
+def select_track_lookups(play_counts: Dict[tuple, int], min_plays: int = 1) -> set:
+    """
+    Priority policy for track-level Last.fm calls.
+
+    Track-level tags matter most for the tracks people actually play; the
+    long tail of unplayed album cuts rarely has any on Last.fm and is served
+    by its artist's tags instead.
+
+    Args:
+        play_counts: {(artist, track) -> plays} (library play counts plus
+                     streaming-history plays).
+        min_plays:   Plays needed for a track-level call.
+
+    Returns:
+        Set of cache keys to pass as generate_tag_cache(track_lookups=...).
+    """
+    return {
+        _lastfm_key(artist, track)
+        for (artist, track), plays in play_counts.items()
+        if plays >= min_plays
+    }
+
+
+def _artists_needing_tags(
+    conn: sqlite3.Connection, tracks: List[tuple], keys: List[str]
+) -> List[str]:
+    """Uncached artists with at least one track lacking track-level tags."""
+    track_rows = sqlite_lookup(conn, _TRACK_TABLE, "key", ("tags_json",), keys)
+    by_artist: Dict[str, str] = {}
+    for (artist, _), key in zip(tracks, keys):
+        row = track_rows.get(key)
+        if row is None or row[0] == "[]":
+            by_artist.setdefault(_artist_key(artist), artist)
+    cached = set(sqlite_lookup(conn, _ARTIST_TABLE, "key", (), by_artist))
+    return [artist for key, artist in by_artist.items() if key not in cached]
+
+
+def _fetch_into_cache(
+    conn: sqlite3.Connection,
+    items: List,
+    fetch,
+    cache_key,
+    table: str,
+    workers: int,
+) -> None:
+    """Run fetch(item) concurrently and hand each result to a _CacheWriter."""
+    started = time.perf_counter()
+    results = _fetch_concurrently(items, fetch, workers)
+    desc = "Last.fm artist tags" if table == _ARTIST_TABLE else "Last.fm tags"
+    try:
+        with _CacheWriter(conn, table=table) as writer:
+            for item, tags in progress_bar(results, desc=desc, total=len(items)):
+                writer.put(cache_key(item), tags)
+    finally:
+        # On interrupt the writer has already flushed; drop the queued requests
+        results.close()
+    elapsed = time.perf_counter() - started
+    logging.info(
+        "%s: fetched %d in %.1f s (%.1f/s, %d workers).",
+        desc,
+        len(items),
+        elapsed,
+        len(items) / elapsed if elapsed > 0 else 0.0,
+        workers,
+    )
+
+
+def _fetch_concurrently(items: List, fetch, workers: int):
+    """
+    Yield (item, fetch(item)) in order of completion, with at most
+    workers * 4 requests queued so memory stays flat for any library size.
+    """
+    pending: dict = {}
+    it = iter(items)
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="lastfm") as executor:
+        try:
+            while True:
+                for item in it:
+                    pending[executor.submit(fetch, item)] = item
+                    if len(pending) >= workers * 4:
+                        break
+                if not pending:
+                    return
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield pending.pop(future), future.result()
+        finally:
+            # Abandoned early (Ctrl-C, closed generator): drop queued requests
+            for future in pending:
+                future.cancel()
+
+
+class TagDB(dict):
+    """
+    {"artist - track" -> [tag, ...]} with an artist-tag fallback.
+
+    Iteration, len() and [] see track-level entries only, exactly like the
+    plain dict this replaces (so IDF counts are unchanged).  .get(key) returns
+    the artist's tags when the track has no track-level tags — it was never
+    looked up, or the lookup came back empty.
+    """
+
+    def __init__(self, tracks=(), artist_tags: Optional[Dict[str, List[str]]] = None):
+        super().__init__(tracks)
+        self.artist_tags: Dict[str, List[str]] = artist_tags or {}
+
+    def get(self, key, default=None):
+        tags = super().get(key)
+        if not tags and self.artist_tags:
+            for artist in _artist_prefixes(key):
+                if artist in self.artist_tags:
+                    tags = _with_fallback(tags, self.artist_tags[artist])
+                    break
+        return default if tags is None else tags
+
+
+def _artist_prefixes(key) -> List[str]:
+    """Candidate artist parts of an "artist - track" key, longest first
+    (artist names may themselves contain " - ")."""
+    if not isinstance(key, str):
+        return []
+    prefixes = []
+    pos = key.find(" - ")
+    while pos != -1:
+        prefixes.append(key[:pos])
+        pos = key.find(" - ", pos + 3)
+    return prefixes[::-1]
+
+
+def _with_fallback(track_tags: Optional[List[str]], artist_tags) -> Optional[List[str]]:
+    """Track tags when there are any, else non-empty artist tags, else track_tags."""
+    return track_tags if track_tags or not artist_tags else artist_tags
+
+
+def _decode(tags_json: str) -> List[str]:
+    try:
+        return json.loads(tags_json)
+    except json.JSONDecodeError:
+        return []
+
+
+class TagStore(Mapping):
+    """
+    Read-through, read-only view of the SQLite tag cache.
+
+    Behaves like the TagDB that load_tag_db_from_sqlite() builds — [] / in /
+    len() / iteration see track-level rows, .get() falls back to artist
+    tags — without decoding the whole cache up front:
+
+    - load(keys) bulk-reads the given keys (one query per table) and pins
+      them; score_tracks() calls it with the library's keys, so a run only
+      materialises the tracks it scores, not every Spotify-history-only row.
+    - Any other .get() is read from SQLite on demand and kept in an LRU of
+      `cache_size` entries.
+    - tag_counts() reads IDF counts persisted next to the cache, recounting
+      (and re-persisting) only after tag_cache has changed, so
+      mood_map.build_tag_counts() never needs every row in Python.
+
+    Safe to share between threads.
+    """
+
+    _MISSING = object()
+
+    def __init__(self, db_path: str, cache_size: int = 50_000):
+        self.db_path = str(db_path)
+        self.cache_size = cache_size
+        self._conn: Optional[sqlite3.Connection] = None
+        self._lock = threading.RLock()
+        self._pinned: Dict[str, Optional[List[str]]] = {}
+        self._lru: "collections.OrderedDict[str, Optional[List[str]]]" = (
+            collections.OrderedDict()
+        )
+        self._has_artists: Optional[bool] = None
+        self._tag_counts: Optional[Dict[str, int]] = None
+
+    def _connection(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+            try:
+                _init_schema(self._conn)  # caches from older versions
+            except sqlite3.Error as exc:
+                logging.debug("Tag cache %s is read-only: %s", self.db_path, exc)
+            self._has_artists = (
+                self._conn.execute(
+                    "SELECT 1 FROM sqlite_master WHERE type='table' AND name=?",
+                    (_ARTIST_TABLE,),
+                ).fetchone()
+                is not None
+            )
+        return self._conn
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+    # --- bulk + single lookups -------------------------------------------
+
+    def _resolve(self, keys: List[str]) -> Dict[str, Optional[List[str]]]:
+        """.get() results for keys (None = no tags anywhere), two queries total."""
+        conn = self._connection()
+        rows = sqlite_lookup(conn, _TRACK_TABLE, "key", ("tags_json",), keys)
+        track_tags = {key: _decode(row[0]) for key, row in rows.items()}
+        need_artist = [key for key in keys if not track_tags.get(key)]
+        artist_tags: Dict[str, List[str]] = {}
+        if need_artist and self._has_artists:
+            candidates = {a for key in need_artist for a in _artist_prefixes(key)}
+            rows = sqlite_lookup(conn, _ARTIST_TABLE, "key", ("tags_json",), candidates)
+            artist_tags = {key: _decode(row[0]) for key, row in rows.items()}
+        result = {}
+        for key in keys:
+            tags = track_tags.get(key)
+            if not tags:
+                artist = next((a for a in _artist_prefixes(key) if a in artist_tags), None)
+                if artist is not None:
+                    tags = _with_fallback(tags, artist_tags[artist])
+            result[key] = tags
+        return result
+
+    def load(self, keys) -> int:
+        """
+        Bulk-read keys and keep them in memory for the life of the store.
+        Returns the number of keys that resolved to tags.
+        """
+        keys = list(dict.fromkeys(keys))
+        with self._lock:
+            wanted = [k for k in keys if k not in self._pinned]
+            if wanted:
+                self._pinned.update(self._resolve(wanted))
+            return sum(1 for k in keys if self._pinned.get(k))
+
+    def get(self, key, default=None):
+        with self._lock:
+            tags = self._pinned.get(key, self._MISSING)
+            if tags is self._MISSING:
+                tags = self._lru.get(key, self._MISSING)
+                if tags is self._MISSING:
+                    tags = self._resolve([key])[key]
+                    self._lru[key] = tags
+                    if len(self._lru) > self.cache_size:
+                        self._lru.popitem(last=False)
+                else:
+                    self._lru.move_to_end(key)
+        return default if tags is None else tags
+
+    # --- Mapping over track-level rows -----------------------------------
+
+    def __getitem__(self, key):
+        with self._lock:
+            row = self._connection().execute(
+                f"SELECT tags_json FROM {_TRACK_TABLE} WHERE key = ?", (key,)
+            ).fetchone()
+        if row is None:
+            raise KeyError(key)
+        return _decode(row[0])
+
+    def __contains__(self, key) -> bool:
+        with self._lock:
+            return (
+                self._connection().execute(
+                    f"SELECT 1 FROM {_TRACK_TABLE} WHERE key = ?", (key,)
+                ).fetchone()
+                is not None
+            )
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._connection().execute(
+                f"SELECT COUNT(*) FROM {_TRACK_TABLE}"
+            ).fetchone()[0]
+
+    def __iter__(self):
+        with self._lock:
+            keys = [r[0] for r in self._connection().execute(f"SELECT key FROM {_TRACK_TABLE}")]
+        return iter(keys)
+
+    def tag_counts(self) -> Dict[str, int]:
+        """
+        Lower-cased tag -> number of occurrences across track-level rows
+        (identical to mood_map.build_tag_counts() over the full dict).
+        """
+        with self._lock:
+            if self._tag_counts is None:
+                self._tag_counts = self._stored_tag_counts()
+            if self._tag_counts is None:
+                # Version read before counting: a write that lands mid-count
+                # leaves the stored counts stale, so they are redone next time
+                version = self._cache_version()
+                self._tag_counts = self._count_tags()
+                if version is not None:
+                    self._store_tag_counts(self._tag_counts, version)
+            return self._tag_counts
+
+    def _cache_version(self) -> Optional[int]:
+        try:
+            row = self._connection().execute(
+                "SELECT value FROM cache_meta WHERE name = ?", (_VERSION,)
+            ).fetchone()
+        except sqlite3.OperationalError:  # cache written before persisted counts
+            return None
+        return row[0] if row else None
+
+    def _stored_tag_counts(self) -> Optional[Dict[str, int]]:
+        """Persisted counts if they match the current tag_cache version."""
+        conn = self._connection()
+        try:
+            versions = dict(conn.execute(
+                "SELECT name, value FROM cache_meta WHERE name IN (?, ?)",
+                (_VERSION, _COUNTS_VERSION),
+            ).fetchall())
+            if _VERSION not in versions or versions.get(_COUNTS_VERSION) != versions[_VERSION]:
+                return None
+            return dict(conn.execute("SELECT tag, n FROM tag_counts").fetchall())
+        except sqlite3.OperationalError:  # cache written before persisted counts
+            return None
+
+    def _count_tags(self) -> Dict[str, int]:
+        """Stream every row once; only the tag vocabulary is kept."""
+        raw: Dict[str, int] = collections.Counter()
+        for (tags_json,) in self._connection().execute(
+            f"SELECT tags_json FROM {_TRACK_TABLE}"
+        ):
+            tags = _decode(tags_json)
+            if isinstance(tags, list):
+                raw.update(tags)
+        counts: Dict[str, int] = {}
+        for tag, n in raw.items():
+            lowered = tag.lower()
+            counts[lowered] = counts.get(lowered, 0) + n
+        return counts
+
+    def _store_tag_counts(self, counts: Dict[str, int], version: int) -> None:
+        conn = self._connection()
+        try:
+            with conn:
+                conn.execute("DELETE FROM tag_counts")
+                conn.executemany("INSERT INTO tag_counts VALUES (?, ?)", counts.items())
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_meta VALUES (?, ?)",
+                    (_COUNTS_VERSION, version),
+                )
+        except sqlite3.Error as exc:  # read-only or busy cache: count again next time
+            logging.debug("Could not persist tag counts to %s: %s", self.db_path, exc)
+
+
+def _decode_rows(rows) -> Dict[str, List[str]]:
+    return {key: _decode(tags_json) for key, tags_json in rows}
 
 
 def load_tag_db_from_sqlite(db_path: str) -> Dict[str, List[str]]:
     """
-    Load all cached tag entries from SQLite into a plain dict.
+    Load all cached tag entries from SQLite into a TagDB.
 
-    Returns: {"artist - track" -> [tag, ...]}
+    Returns: {"artist - track" -> [tag, ...]}, falling back to artist tags
+    in .get() (see TagDB).
     """
     p = Path(db_path)
     if not p.exists():
-        return {}
+        return TagDB()
     conn = sqlite3.connect(db_path)
     try:
-        rows = conn.execute("SELECT key, tags_json FROM tag_cache").fetchall()
+        rows = conn.execute(f"SELECT key, tags_json FROM {_TRACK_TABLE}").fetchall()
+        try:
+            artist_rows = conn.execute(
+                f"SELECT key, tags_json FROM {_ARTIST_TABLE}"
+            ).fetchall()
+        except sqlite3.OperationalError:  # cache written before the artist tier
+            artist_rows = []
     finally:
         conn.close()
-    result: Dict[str, List[str]] = {}
-    for key, tags_json in rows:
-        try:
-            result[key] = json.loads(tags_json)
-        except json.JSONDecodeError:
-            result[key] = []
-    return result
+    return TagDB(_decode_rows(rows), _decode_rows(artist_rows))
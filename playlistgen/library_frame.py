@@ -0,0 +1,133 @@
+"""
+Memory-lean library DataFrame helpers for PlaylistGen.
+
+The library frame is mostly a handful of low-cardinality strings (Artist,
+Genre, Album, Mood, Kind) stored once per track as Python objects, plus
+float64 numerics that never need more than float32 precision.  With
+COMPACT_LIBRARY enabled the pipeline converts it once after loading, again
+before scoring (Mood, which the enrichers write cell by cell, waits until
+then) and once more after scoring, when Mood is filled in:
+
+  Artist/Genre/Album/Mood/Kind   object   → category
+  Year/BPM/Duration/audio feats  float64  → float32
+  integer counts                 int64    → smallest int (usually int16/int32)
+
+Stages copy the frame before modifying it.  working_copy() makes that copy
+shallow whenever pandas copy-on-write is active (always on pandas >= 3; the
+pipeline turns it on for the length of a compact run on pandas 2), so a stage
+only pays for the columns it actually writes.
+
+See "Large libraries" in the README for the end-to-end memory budget.
+"""
+
+import contextlib
+import logging
+from typing import Iterable, Iterator
+
+import numpy as np
+import pandas as pd
+
+CATEGORY_COLS = ("Artist", "Genre", "Album", "Mood", "Kind")
+
+# Written one cell at a time by the batch enrichers (df.at[...] = "<mood>").
+# A categorical column rejects values outside its categories, so these stay
+# object until enrichment is over.
+ENRICHED_COLS = ("Mood",)
+
+# Descriptive numerics only — Score and ranking columns keep float64 so
+# playlist ordering never changes under compaction.
+FLOAT32_COLS = (
+    "Year",
+    "BPM",
+    "Duration",
+    "Energy",
+    "Valence",
+    "SpectralBrightness",
+    "ZCR",
+)
+
+INT_COLS = ("Play Count", "Skip Count")
+
+
+def copy_on_write_active() -> bool:
+    """True when a shallow DataFrame copy is safe to modify independently."""
+    if int(pd.__version__.split(".", 1)[0]) >= 3:
+        return True
+    try:
+        return pd.get_option("mode.copy_on_write") is True
+    except (AttributeError, KeyError):  # OptionError subclasses both
+        return False
+
+
+@contextlib.contextmanager
+def copy_on_write(enabled: bool = True) -> Iterator[None]:
+    """
+    Turn pandas copy-on-write on for the duration of the block (pandas 2.x).
+
+    The option is process-global, so the previous value is restored on exit.
+    No-op when enabled is False or copy-on-write is always on or unsupported.
+    """
+    previous = None
+    if enabled and not copy_on_write_active():
+        try:
+            previous = pd.get_option("mode.copy_on_write")
+            pd.set_option("mode.copy_on_write", True)
+        except (AttributeError, KeyError):  # OptionError subclasses both
+            logging.debug("pandas %s has no copy-on-write mode.", pd.__version__)
+    try:
+        yield
+    finally:
+        if previous is not None:
+            pd.set_option("mode.copy_on_write", previous)
+
+
+def working_copy(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Copy of df for a stage to modify without touching the caller's frame.
+
+    Shallow under copy-on-write (columns are only duplicated when written),
+    deep otherwise.
+    """
+    return df.copy(deep=not copy_on_write_active())
+
+
+def frame_memory_mb(df: pd.DataFrame) -> float:
+    """Deep memory usage of df in MiB."""
+    return df.memory_usage(deep=True).sum() / (1 << 20)
+
+
+def compact_library(df: pd.DataFrame, keep_object: Iterable[str] = ()) -> pd.DataFrame:
+    """
+    Convert the library frame to its compact dtypes in place and return it.
+
+    Columns in keep_object are not made categorical (pass ENRICHED_COLS while
+    the enrichers may still write them).  Safe to call repeatedly — columns
+    already compact are left alone.
+    """
+    if df.empty:
+        return df
+    before = frame_memory_mb(df)
+
+    for col in CATEGORY_COLS:
+        if col in keep_object:
+            continue
+        if col in df.columns and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+
+    for col in FLOAT32_COLS:
+        if col not in df.columns or df[col].dtype == np.float32:
+            continue
+        values = pd.to_numeric(df[col], errors="coerce")
+        df[col] = values.astype(np.float32)
+
+    for col in INT_COLS:
+        if col in df.columns and pd.api.types.is_integer_dtype(df[col].dtype):
+            df[col] = pd.to_numeric(df[col], downcast="integer")
+
+    logging.info(
+        "Compact library frame: %.1f MiB → %.1f MiB (%d tracks).",
+        before,
+        frame_memory_mb(df),
+        len(df),
+    )
+    return df
@@ -0,0 +1,220 @@
+"""
+Incremental iTunes library sync for PlaylistGen.
+
+Music.app rewrites the whole library XML every time a play count moves, so
+the XML mtime alone says nothing about *what* changed.  While
+convert_itunes_xml() streams tracks it fingerprints each one here, diffs the
+result against the previous export and stores both next to the slim JSON:
+
+  <ITUNES_JSON stem>.sync.json
+      {"version": 1,
+       "tracks":  {sync_key: "<meta hash>:<play hash>", ...},
+       "changes": {"added": [...], "removed": [...], "metadata": [...],
+                   "play_count": [...], "changed_locations": [...]} | null}
+
+Tracks are keyed by Persistent ID (falling back to Track ID) and classified as
+added, removed, metadata-changed, or play-count-only.  "changes" is null after
+the first conversion (nothing to diff against — treat everything as changed).
+
+"changes" accumulates: each conversion merges its diff into the change set
+still pending, so converting twice before a run loses nothing.  Downstream
+stages read it with load_library_changes() and, once they have acted on it,
+call consume_library_changes(); audio analysis uses changed_locations to
+batch its cache lookups for untouched files.  It is the only consumer —
+enrichment and scoring still run over the whole library.  A null change set
+stays null until consumed.
+"""
+
+import hashlib
+import json
+import logging
+import os
+from pathlib import Path
+from typing import Dict, List, Optional
+
+_SYNC_VERSION = 1
+
+_CHANGE_KINDS = ("added", "removed", "metadata", "play_count", "changed_locations")
+
+# Fields Music.app bumps on playback — a change confined to these is "play_count"
+PLAY_FIELDS = frozenset(
+    {"Play Count", "Play Date", "Play Date UTC", "Skip Count", "Skip Date"}
+)
+
+
+def sync_state_path(json_path) -> Path:
+    """Return the sync-state sidecar path for a slim library JSON file."""
+    return Path(json_path).with_suffix(".sync.json")
+
+
+def track_sync_key(track: dict) -> Optional[str]:
+    """Stable identity for a track: Persistent ID, else Track ID, else None."""
+    pid = track.get("Persistent ID")
+    if pid:
+        return str(pid)
+    tid = track.get("Track ID")
+    if tid is not None:
+        return f"id:{tid}"
+    return None
+
+
+def _digest(items: list) -> str:
+    raw = json.dumps(items, ensure_ascii=False, sort_keys=True, default=str)
+    return hashlib.blake2b(raw.encode("utf-8"), digest_size=8).hexdigest()
+
+
+def track_fingerprint(track: dict) -> str:
+    """Return "<meta hash>:<play hash>" for a track dict."""
+    meta = [(k, v) for k, v in track.items() if k not in PLAY_FIELDS]
+    play = [(k, v) for k, v in track.items() if k in PLAY_FIELDS]
+    return f"{_digest(meta)}:{_digest(play)}"
+
+
+def _load_state(json_path) -> Optional[dict]:
+    p = sync_state_path(json_path)
+    if not p.exists():
+        return None
+    try:
+        with open(p, "r", encoding="utf-8") as f:
+            state = json.load(f)
+    except Exception as exc:
+        logging.warning("Could not read library sync state %s: %s", p, exc)
+        return None
+    if state.get("version") != _SYNC_VERSION:
+        return None
+    return state
+
+
+def start_sync(json_path) -> dict:
+    """
+    Begin a sync pass for the library JSON about to be (re)written.
+
+    Returns a mutable state dict to pass to record_track() and finish_sync().
+    """
+    previous = _load_state(json_path)
+    return {
+        "previous": previous.get("tracks", {}) if previous else None,
+        "pending": previous.get("changes") if previous else None,
+        "index": {},
+        "changes": _empty_changes(),
+    }
+
+
+def _empty_changes() -> Dict[str, List[str]]:
+    return {kind: [] for kind in _CHANGE_KINDS}
+
+
+def record_track(state: dict, track: dict) -> None:
+    """Fingerprint one track and classify it against the previous export."""
+    key = track_sync_key(track)
+    if key is None:
+        return
+    fp = track_fingerprint(track)
+    state["index"][key] = fp
+
+    previous = state["previous"]
+    if previous is None:
+        return
+    changes = state["changes"]
+    old = previous.get(key)
+    if old == fp:
+        return
+    if old is None:
+        kind = "added"
+    elif old.split(":", 1)[0] != fp.split(":", 1)[0]:
+        kind = "metadata"
+    else:
+        changes["play_count"].append(key)
+        return
+    changes[kind].append(key)
+    location = track.get("Location")
+    if isinstance(location, str) and location:
+        changes["changed_locations"].append(location)
+
+
+def _merge_changes(pending: dict, diff: dict, index: dict) -> Dict[str, List[str]]:
+    """
+    Fold one conversion's diff into the pending change set.  Each track keeps
+    its strongest classification (added > metadata > play_count) and ends up
+    in either "removed" or one of the live lists, by whether it is in index.
+    """
+    merged = {
+        kind: list(dict.fromkeys(pending.get(kind, []) + diff[kind])) for kind in _CHANGE_KINDS
+    }
+    merged["removed"] = [k for k in merged["removed"] if k not in index]
+    seen: set = set()
+    for kind in ("added", "metadata", "play_count"):
+        merged[kind] = [k for k in merged[kind] if k in index and k not in seen]
+        seen.update(merged[kind])
+    return merged
+
+
+def _write_state(json_path, tracks: dict, changes: Optional[dict]) -> None:
+    p = sync_state_path(json_path)
+    tmp = p.with_name(p.name + ".tmp")
+    try:
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(
+                {"version": _SYNC_VERSION, "tracks": tracks, "changes": changes},
+                f,
+                ensure_ascii=False,
+            )
+        os.replace(tmp, p)
+    except OSError as exc:
+        logging.warning("Could not write library sync state %s: %s", p, exc)
+
+
+def finish_sync(state: dict, json_path) -> Optional[dict]:
+    """
+    Compute removed tracks, merge this conversion's diff into the pending
+    change set, persist the new index + change set, and return the pending
+    change set (None if it is unknown: no previous export to diff against,
+    or an unknown change set not yet consumed).
+    """
+    previous = state["previous"]
+    changes = None
+    if previous is not None:
+        diff = state["changes"]
+        diff["removed"] = sorted(set(previous) - set(state["index"]))
+        logging.info(
+            "Library sync: %d added, %d removed, %d metadata changed, "
+            "%d play-count only.",
+            len(diff["added"]),
+            len(diff["removed"]),
+            len(diff["metadata"]),
+            len(diff["play_count"]),
+        )
+        if state["pending"] is not None:
+            changes = _merge_changes(state["pending"], diff, state["index"])
+
+    _write_state(json_path, state["index"], changes)
+    return changes
+
+
+def load_library_changes(json_path) -> Optional[dict]:
+    """
+    Return the change set accumulated by XML → JSON conversions since it was
+    last consumed.
+
+    None means "unknown" (first conversion, or no sync state) — callers must
+    then treat every track as changed.
+    """
+    state = _load_state(json_path)
+    if state is None:
+        return None
+    return state.get("changes")
+
+
+def consume_library_changes(json_path, changes: Optional[dict]) -> None:
+    """
+    Mark a change set returned by load_library_changes() as handled, leaving
+    an empty one pending.
+
+    If a conversion has changed the pending set since it was loaded, nothing
+    is cleared: it still holds everything that was handled plus what came
+    after, and handling a track twice is harmless where losing one is not.
+    """
+    state = _load_state(json_path)
+    if state is None or state.get("changes") != changes:
+        return
+    _write_state(json_path, state.get("tracks", {}), _empty_changes())
@@ -5,16 +5,39 @@ Reads embedded tags (year, BPM, genre, duration, album) from local audio files
 so the library DataFrame has accurate data without relying on path parsing.
 Supports MP3 (ID3), MP4/M4A, FLAC, OGG, and most other common formats via
 mutagen's easy-interface.
+
+MP3, FLAC and MP4/M4A files are read header-only: the tag structure is walked
+with seeks, only the date/bpm/genre/album frames are loaded, and embedded
+artwork is never read off disk.  Anything unusual falls back to the full
+mutagen read.
+
+Parsed tags can be cached in SQLite keyed by (path, size, mtime), so a rescan
+of an unchanged library only stats files and never opens them.
 """
 
+import collections
+import io
 import logging
+import os
+import re
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
+from typing import Iterable, Iterator, Optional
 from urllib.parse import unquote
 
 import pandas as pd
 
+from .library_frame import working_copy
+from .utils import progress_bar, sqlite_lookup
+
 try:
     from mutagen import File as MutaFile
+    from mutagen.easyid3 import EasyID3
+    from mutagen.flac import StreamInfo, VCFLACDict
+    from mutagen.mp3 import MPEGInfo
+    from mutagen.mp4 import GENRES, Atoms, MP4Info
 
     MUTAGEN_AVAILABLE = True
 except ImportError:
@@ -34,9 +57,258 @@ def _strip_file_url(path: str) -> str:
     return path
 
 
+# ---------------------------------------------------------------------------
+# Header-only readers
+#
+# Each returns (easy-style tags or None, length in seconds), or None to make
+# read_audio_tags() fall back to MutaFile.  Only the wanted frames/atoms/blocks
+# are read; values go through mutagen's own parsers (or an exact copy of their
+# rules) so results match the easy interface.
+# ---------------------------------------------------------------------------
+
+# ID3 frames behind EasyID3's date/originaldate/bpm/genre/album keys.  The
+# v2.2/v2.3 date frames are upgraded to TDRC/TDOR by mutagen on load.
+_ID3_WANTED = {
+    2: {b"TYE", b"TDA", b"TIM", b"TOR", b"TBP", b"TCO", b"TAL"},
+    3: {b"TDRC", b"TYER", b"TDAT", b"TIME", b"TDOR", b"TORY", b"TBPM", b"TCON", b"TALB"},
+}
+_ID3_FRAME_ID = re.compile(rb"[A-Z0-9]+")
+
+# ilst item atom → EasyMP4 key
+_MP4_WANTED = {
+    b"\xa9day": "date",
+    b"tmpo": "bpm",
+    b"\xa9gen": "genre",
+    b"gnre": "genre",
+    b"\xa9alb": "album",
+}
+
+
+def _synchsafe(data: bytes) -> int:
+    return (data[0] << 21) | (data[1] << 14) | (data[2] << 7) | data[3]
+
+
+def _read_mp3_light(f) -> Optional[tuple]:
+    header = f.read(10)
+    if len(header) < 10 or header[:3] != b"ID3":
+        return None
+    major, flags = header[3], header[5]
+    # Unsynchronised tags, extended headers and v2.2 compression are rare —
+    # leave them to mutagen.
+    if major not in (2, 3, 4) or flags & 0xC0 or any(b & 0x80 for b in header[6:10]):
+        return None
+    end = 10 + _synchsafe(header[6:10])
+
+    id_len, head_len = (3, 6) if major == 2 else (4, 10)
+    wanted = _ID3_WANTED[2 if major == 2 else 3]
+    frames = []
+    while f.tell() + head_len <= end:
+        head = f.read(head_len)
+        fid = head[:id_len]
+        if not fid.strip(b"\x00"):
+            break  # padding
+        if not _ID3_FRAME_ID.fullmatch(fid):
+            return None
+        if major == 2:
+            size = int.from_bytes(head[3:6], "big")
+        elif major == 3:
+            size = int.from_bytes(head[4:8], "big")
+        else:
+            if any(b & 0x80 for b in head[4:8]):
+                return None
+            size = _synchsafe(head[4:8])
+        if f.tell() + size > end:
+            return None
+        if fid in wanted:
+            frames.append(head + f.read(size))
+        else:
+            f.seek(size, 1)
+
+    # EasyID3 also merges an ID3v1 tag from the last 128 bytes
+    f.seek(0, 2)
+    tail = b""
+    if f.tell() >= end + 128:
+        f.seek(-128, 2)
+        tail = f.read(128)
+        if tail[:3] != b"TAG":
+            tail = b""
+
+    body = b"".join(frames)
+    size = len(body)
+    tag = (
+        header[:5]
+        + bytes([flags & 0x20])
+        + bytes([(size >> 21) & 0x7F, (size >> 14) & 0x7F, (size >> 7) & 0x7F, size & 0x7F])
+        + body
+        + tail
+    )
+    tags = EasyID3(io.BytesIO(tag))
+    return tags, MPEGInfo(f, end).length
+
+
+def _read_flac_light(f) -> Optional[tuple]:
+    if f.read(4) != b"fLaC":
+        return None
+    info = tags = None
+    while True:
+        head = f.read(4)
+        if len(head) < 4:
+            return None
+        code = head[0] & 0x7F
+        size = int.from_bytes(head[1:4], "big")
+        if code == 0:
+            info = StreamInfo(f.read(size))
+        elif code == 4 and tags is None:
+            tags = VCFLACDict(f.read(size))
+        elif code == 127:
+            return None
+        else:
+            f.seek(size, 1)  # PICTURE, PADDING, SEEKTABLE, ...
+        if head[0] & 0x80:
+            break
+    if info is None:
+        return None
+    return tags, info.length
+
+
+def _parse_mp4_item(name: bytes, data: bytes) -> Optional[list]:
+    """Decode an ilst item the way MP4Tags does; None if mutagen would reject it."""
+    values = []
+    pos = 0
+    while pos < len(data):
+        head = data[pos : pos + 12]
+        if len(head) != 12:
+            return None
+        length = int.from_bytes(head[:4], "big")
+        if length < 1 or head[4:8] != b"data":
+            return None
+        version = head[8]
+        atom_type = int.from_bytes(head[9:12], "big")
+        chunk = data[pos + 16 : pos + length]
+        if len(chunk) != length - 16:
+            return None
+        pos += length
+
+        if name == b"gnre":
+            if len(chunk) != 2:
+                return None
+            try:
+                values.append(GENRES[int.from_bytes(chunk, "big", signed=True) - 1])
+            except IndexError:
+                return None
+        elif name == b"tmpo":
+            if version != 0 or atom_type not in (0, 21) or len(chunk) not in (1, 2, 3, 4, 8):
+                return None
+            if len(chunk) == 3:
+                values.append(str(int.from_bytes(chunk + b"\x00", "big", signed=True) >> 8))
+            else:
+                values.append(str(int.from_bytes(chunk, "big", signed=True)))
+        else:
+            if atom_type not in (0, 1):
+                return None
+            try:
+                values.append(chunk.decode("utf-8"))
+            except UnicodeDecodeError:
+                return None
+    return values
+
+
+def _read_mp4_light(f) -> Optional[tuple]:
+    # Atoms() only reads atom headers; leaf payloads (covr, mdat) are skipped
+    atoms = Atoms(f)
+    if b"moov" not in atoms:
+        return None
+    length = MP4Info(atoms, f).length
+    try:
+        ilst = atoms.path(b"moov", b"udta", b"meta", b"ilst")[-1]
+    except KeyError:
+        return None, length
+
+    tags: dict = {}
+    for atom in ilst.children:
+        key = _MP4_WANTED.get(atom.name)
+        if key is None:
+            continue
+        ok, data = atom.read(f)
+        if not ok:
+            return None
+        values = _parse_mp4_item(atom.name, data)
+        if values is not None:
+            tags.setdefault(key, []).extend(values)
+    return tags, length
+
+
+_LIGHT_READERS = {
+    ".mp3": _read_mp3_light,
+    ".flac": _read_flac_light,
+    ".m4a": _read_mp4_light,
+    ".m4b": _read_mp4_light,
+    ".mp4": _read_mp4_light,
+}
+
+
+def _read_tags_light(resolved: str) -> Optional[tuple]:
+    """Header-only read; None means "use the full mutagen read instead"."""
+    reader = _LIGHT_READERS.get(os.path.splitext(resolved)[1].lower())
+    if reader is None:
+        return None
+    try:
+        with open(resolved, "rb") as f:
+            return reader(f)
+    except Exception as exc:
+        logging.debug("Header-only tag read failed for %s: %s", resolved, exc)
+        return None
+
+
+def _apply_tags(tags, result: dict) -> None:
+    """Fill result from an easy-interface style tags mapping."""
+    # Year — try 'date' first (standard EasyID3/EasyMP4/FLAC key), then 'year'
+    for key in ("date", "year", "originaldate"):
+        val = tags.get(key)
+        if val:
+            raw = str(val[0]) if isinstance(val, list) else str(val)
+            year_str = raw[:4]
+            if year_str.isdigit() and 1900 < int(year_str) < 2100:
+                result["year"] = int(year_str)
+                break
+
+    # BPM — 'bpm' is the EasyID3/EasyMP4 key; some files use 'tempo'
+    for key in ("bpm", "tempo"):
+        val = tags.get(key)
+        if val:
+            raw = str(val[0]) if isinstance(val, list) else str(val)
+            try:
+                bpm = float(raw.replace(",", ".").split(".")[0])
+                if 40 < bpm < 300:
+                    result["bpm"] = int(bpm)
+                break
+            except (ValueError, TypeError):
+                pass
+
+    # Genre
+    val = tags.get("genre")
+    if val:
+        raw = str(val[0]) if isinstance(val, list) else str(val)
+        raw = raw.strip()
+        # ID3 genre tags can be numeric codes like "(17)" — skip those
+        if raw and not raw.startswith("("):
+            result["genre"] = raw
+
+    # Album
+    val = tags.get("album")
+    if val:
+        raw = str(val[0]) if isinstance(val, list) else str(val)
+        if raw.strip():
+            result["album"] = raw.strip()
+
+
 def read_audio_tags(file_path: str) -> dict:
     """
-    Read embedded audio tags from a file using mutagen's easy interface.
+    Read embedded audio tags from a file.
+
+    MP3/FLAC/MP4 files go through a header-only reader that never loads
+    artwork; everything else (and anything that reader can't handle) uses
+    mutagen's easy interface.
 
     Returns a dict with keys: year, bpm, genre, duration_sec, album.
     Any field may be None. Never raises — errors are logged at DEBUG level.
@@ -56,56 +328,21 @@ def read_audio_tags(file_path: str) -> dict:
         return result
 
     try:
-        audio = MutaFile(resolved, easy=True)
-        if audio is None:
-            return result
-
-        # Duration is on audio.info for all formats
-        if hasattr(audio, "info") and hasattr(audio.info, "length"):
-            result["duration_sec"] = max(0, int(audio.info.length))
-
-        tags = audio.tags
-        if tags is None:
-            return result
-
-        # Year — try 'date' first (standard EasyID3/EasyMP4/FLAC key), then 'year'
-        for key in ("date", "year", "originaldate"):
-            val = tags.get(key)
-            if val:
-                raw = str(val[0]) if isinstance(val, list) else str(val)
-                year_str = raw[:4]
-                if year_str.isdigit() and 1900 < int(year_str) < 2100:
-                    result["year"] = int(year_str)
-                    break
-
-        # BPM — 'bpm' is the EasyID3/EasyMP4 key; some files use 'tempo'
-        for key in ("bpm", "tempo"):
-            val = tags.get(key)
-            if val:
-                raw = str(val[0]) if isinstance(val, list) else str(val)
-                try:
-                    bpm = float(raw.replace(",", ".").split(".")[0])
-                    if 40 < bpm < 300:
-                        result["bpm"] = int(bpm)
-                    break
-                except (ValueError, TypeError):
-                    pass
-
-        # Genre
-        val = tags.get("genre")
-        if val:
-            raw = str(val[0]) if isinstance(val, list) else str(val)
-            raw = raw.strip()
-            # ID3 genre tags can be numeric codes like "(17)" — skip those
-            if raw and not raw.startswith("("):
-                result["genre"] = raw
-
-        # Album
-        val = tags.get("album")
-        if val:
-            raw = str(val[0]) if isinstance(val, list) else str(val)
-            if raw.strip():
-                result["album"] = raw.strip()
+        light = _read_tags_light(resolved)
+        if light is not None:
+            tags, length = light
+        else:
+            audio = MutaFile(resolved, easy=True)
+            if audio is None:
+                return result
+            tags = audio.tags
+            # Duration is on audio.info for all formats
+            length = getattr(getattr(audio, "info", None), "length", None)
+
+        if length is not None:
+            result["duration_sec"] = max(0, int(length))
+        if tags is not None:
+            _apply_tags(tags, result)
 
     except Exception as exc:
         logging.debug("mutagen tag read failed for %s: %s", file_path, exc)
@@ -113,7 +350,174 @@ def read_audio_tags(file_path: str) -> dict:
     return result
 
 
-def enrich_dataframe(df: pd.DataFrame, enabled: bool = True) -> pd.DataFrame:
+def _resolve_workers(workers: int) -> int:
+    """0 or less → ThreadPoolExecutor's default sizing for I/O-bound work."""
+    if workers > 0:
+        return workers
+    return min(32, (os.cpu_count() or 1) + 4)
+
+
+def _bounded_map(fn, items: Iterable, workers: int) -> Iterator:
+    """
+    Ordered map over a thread pool with a bounded number of in-flight calls,
+    so memory stays flat no matter how many items there are.
+    """
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        pending: collections.deque = collections.deque()
+        for item in items:
+            pending.append(executor.submit(fn, item))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+_TAG_FIELDS = ("year", "bpm", "genre", "duration_sec", "album")
+
+_TAG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS embedded_tags (
+    path         TEXT PRIMARY KEY,
+    size         INTEGER,
+    mtime        REAL,
+    year         INTEGER,
+    bpm          INTEGER,
+    genre        TEXT,
+    duration_sec INTEGER,
+    album        TEXT,
+    read_at      INTEGER
+);
+"""
+
+
+def _init_tag_db(db_path: str) -> sqlite3.Connection:
+    Path(db_path).parent.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(db_path, check_same_thread=False)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute(_TAG_SCHEMA)
+    conn.commit()
+    return conn
+
+
+def _stat_file(file_path: str) -> Optional[tuple[str, int, float]]:
+    """Return (resolved path, size, mtime) or None if the file is missing."""
+    resolved = _strip_file_url(file_path)
+    try:
+        st = os.stat(resolved)
+    except OSError:
+        return None
+    return resolved, st.st_size, st.st_mtime
+
+
+def _map(fn, items: list, workers: int) -> Iterator:
+    if workers == 1 or len(items) < 2:
+        return map(fn, items)
+    return _bounded_map(fn, items, _resolve_workers(workers))
+
+
+def _read_tags_cached(paths: list[str], workers: int, cache_db: str) -> list[dict]:
+    """read_audio_tags_many() through the (path, size, mtime) SQLite cache."""
+    try:
+        conn = _init_tag_db(str(Path(cache_db).expanduser()))
+    except Exception as exc:
+        logging.warning("Tag cache DB init failed (%s) — reading all files.", exc)
+        return read_audio_tags_many(paths, workers=workers)
+
+    try:
+        # Stat every file (threaded), then one lookup for just those paths
+        stats = list(
+            progress_bar(
+                _map(_stat_file, paths, workers), desc="Checking tags", total=len(paths)
+            )
+        )
+        cached = sqlite_lookup(
+            conn,
+            "embedded_tags",
+            "path",
+            ("size", "mtime") + _TAG_FIELDS,
+            {st[0] for st in stats if st is not None},
+        )
+
+        results: list = [None] * len(paths)
+        misses: list[int] = []
+        for i, st in enumerate(stats):
+            if st is None:
+                results[i] = dict.fromkeys(_TAG_FIELDS)
+                continue
+            row = cached.get(st[0])
+            if row is not None and row[0] == st[1] and row[1] == st[2]:
+                results[i] = dict(zip(_TAG_FIELDS, row[2:]))
+            else:
+                misses.append(i)
+
+        if misses:
+            logging.info(
+                "Tag cache: %d hits, %d files to read.",
+                len(paths) - len(misses), len(misses),
+            )
+            fresh = read_audio_tags_many([paths[i] for i in misses], workers=workers)
+            now = int(time.time())
+            rows = []
+            for i, tags in zip(misses, fresh):
+                results[i] = tags
+                if not any(tags.values()):
+                    continue  # failed read: try again next time, not at next mtime
+                resolved, size, mtime = stats[i]
+                rows.append(
+                    (resolved, size, mtime, *(tags[f] for f in _TAG_FIELDS), now)
+                )
+            conn.executemany(
+                "INSERT OR REPLACE INTO embedded_tags "
+                "(path, size, mtime, year, bpm, genre, duration_sec, album, read_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                rows,
+            )
+            conn.commit()
+        else:
+            logging.info("Tag cache: all %d files unchanged.", len(paths))
+    finally:
+        conn.close()
+    return results
+
+
+def read_audio_tags_many(
+    paths: list[str], workers: int = 0, cache_db: Optional[str] = None
+) -> list[dict]:
+    """
+    Read embedded tags for many files, returning results in input order.
+
+    Tag reads are I/O-latency bound (especially on network mounts), so they
+    run on a bounded thread pool of `workers` threads (0 = auto, 1 = serial).
+    With cache_db set, files whose (path, size, mtime) match the SQLite tag
+    cache are not opened at all.
+    """
+    if cache_db:
+        return _read_tags_cached(paths, workers, cache_db)
+    results = _map(read_audio_tags, paths, workers)
+    return list(progress_bar(results, desc="Reading tags", total=len(paths)))
+
+
+# DataFrame column → read_audio_tags() key
+_TAG_COLUMNS = {
+    "Year": "year",
+    "BPM": "bpm",
+    "Genre": "genre",
+    "Duration": "duration_sec",
+    "Album": "album",
+}
+
+
+def _is_missing(col: pd.Series) -> pd.Series:
+    """Cells that are effectively empty: null, or "", "none", "nan" strings."""
+    text = col.astype(object).where(col.notna(), "").astype(str)
+    return col.isna() | text.str.strip().str.lower().isin(("", "none", "nan"))
+
+
+def enrich_dataframe(
+    df: pd.DataFrame,
+    enabled: bool = True,
+    workers: int = 1,
+    cache_db: Optional[str] = None,
+) -> pd.DataFrame:
     """
     Add/fill Year, BPM, Genre, Duration, Album columns from embedded audio tags.
 
@@ -123,6 +527,8 @@ def enrich_dataframe(df: pd.DataFrame, enabled: bool = True) -> pd.DataFrame:
     Args:
         df:      Library DataFrame. Must have a 'Location' column.
         enabled: If False (or mutagen unavailable), returns df unchanged.
+        workers: Tag-reading threads (1 = serial, 0 = auto).
+        cache_db: Optional SQLite tag cache path (MUTAGEN_CACHE_DB).
 
     Returns:
         DataFrame with Year, BPM, Duration, Album columns added where missing.
@@ -130,10 +536,10 @@ def enrich_dataframe(df: pd.DataFrame, enabled: bool = True) -> pd.DataFrame:
     if not enabled or not MUTAGEN_AVAILABLE:
         return df
 
-    df = df.copy()
+    df = working_copy(df)
 
     # Ensure target columns exist
-    for col in ("Year", "BPM", "Duration", "Album"):
+    for col in _TAG_COLUMNS:
         if col not in df.columns:
             df[col] = None
 
@@ -150,31 +556,27 @@ def enrich_dataframe(df: pd.DataFrame, enabled: bool = True) -> pd.DataFrame:
         "Enriching %d tracks with embedded audio tags...", len(rows_to_enrich)
     )
 
-    def _is_missing(val) -> bool:
-        """Check if a DataFrame cell value is effectively empty."""
-        if val is None:
-            return True
-        try:
-            return pd.isna(val)
-        except (TypeError, ValueError):
-            return str(val).strip().lower() in ("", "none", "nan")
-
-    tag_failures = 0
-    for idx, row in rows_to_enrich.iterrows():
-        tags = read_audio_tags(str(row["Location"]))
-        if not any(tags.values()):
-            tag_failures += 1
-
-        if tags["year"] and _is_missing(df.at[idx, "Year"]):
-            df.at[idx, "Year"] = tags["year"]
-        if tags["bpm"] and _is_missing(df.at[idx, "BPM"]):
-            df.at[idx, "BPM"] = tags["bpm"]
-        if tags["genre"] and _is_missing(df.at[idx, "Genre"]):
-            df.at[idx, "Genre"] = tags["genre"]
-        if tags["duration_sec"] and _is_missing(df.at[idx, "Duration"]):
-            df.at[idx, "Duration"] = tags["duration_sec"]
-        if tags["album"] and _is_missing(df.at[idx, "Album"]):
-            df.at[idx, "Album"] = tags["album"]
+    tag_rows = read_audio_tags_many(
+        rows_to_enrich["Location"].astype(str).tolist(),
+        workers=workers,
+        cache_db=cache_db,
+    )
+    tag_failures = sum(1 for tags in tag_rows if not any(tags.values()))
+
+    # Fill each column in one vectorised assignment: only where the tag has a
+    # value and the existing cell is empty
+    index = rows_to_enrich.index
+    for col, key in _TAG_COLUMNS.items():
+        values = pd.Series([tags[key] for tags in tag_rows], index=index, dtype=object)
+        fill = values.map(bool) & _is_missing(df.loc[index, col])
+        if fill.any():
+            new = values[fill].infer_objects()
+            try:
+                df.loc[new.index, col] = new
+            except (TypeError, ValueError):
+                # e.g. genre strings into an all-NaN float column
+                df[col] = df[col].astype(object)
+                df.loc[new.index, col] = new
 
     # Coerce numeric columns
     df["Year"] = pd.to_numeric(df["Year"], errors="coerce")
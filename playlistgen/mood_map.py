@@ -8,12 +8,18 @@ GENRE_NORMALIZE     Maps Last.fm tag strings to canonical iTunes-style genre nam
 canonical_mood()    Convert a tag list + optional genre → one of the 10 canonical moods.
 canonical_genre()   Convert a Last.fm tag string → a normalized genre name.
 build_tag_counts()  Global tag frequency counter used for IDF weighting.
+
+canonical_mood() runs on every track, so the keyword tables are compiled
+once (one alternation regex per mood), each distinct tag's cleaned form and
+mood hits are memoised, and IDF weights are tabulated per tag_counts dict.
+MOODS and GENRE_MOOD_FALLBACK are treated as constants.
 """
 
 import collections
+import functools
 import math
 import re
-from typing import Dict, List, Optional
+from typing import Dict, List, Optional, Tuple
 
 
 # ---------------------------------------------------------------------------
@@ -401,7 +407,10 @@ def build_tag_counts(tag_db: dict) -> Dict[str, int]:
     Used for IDF (inverse document frequency) weighting in canonical_mood().
 
     tag_db format: {"artist - track" -> List[str]} or legacy {"artist - track" -> {"tags": [...]}}
+    A lastfm_client.TagStore counts inside SQLite instead of reading every row.
     """
+    if callable(getattr(tag_db, "tag_counts", None)):
+        return dict(tag_db.tag_counts())
     counts: Dict[str, int] = collections.Counter()
     for val in tag_db.values():
         if isinstance(val, list):
@@ -415,6 +424,83 @@ def build_tag_counts(tag_db: dict) -> Dict[str, int]:
     return dict(counts)
 
 
+_CLEAN_RE = re.compile(r"[^\w\s-]")
+
+# One alternation per mood: pattern.search(s) is true exactly when some
+# keyword is a substring of s
+_MOOD_PATTERNS: List[Tuple[str, Optional["re.Pattern[str]"]]] = [
+    (mood, re.compile("|".join(map(re.escape, keywords))) if keywords else None)
+    for mood, keywords in MOODS.items()
+]
+
+
+@functools.lru_cache(maxsize=1 << 16)
+def _tag_hits(raw_tag: str) -> Tuple[str, Tuple[str, ...]]:
+    """(cleaned tag, moods with a keyword in it) for one raw Last.fm tag."""
+    cleaned = _CLEAN_RE.sub(" ", raw_tag.lower()).strip()
+    hits = tuple(
+        mood for mood, pattern in _MOOD_PATTERNS if pattern is not None and pattern.search(cleaned)
+    )
+    return cleaned, hits
+
+
+class _IdfTable:
+    """
+    Per-tag weights for one tag_counts dict: raw tag → (moods hit, IDF), or
+    None when the tag hits no mood.  Filled on demand, one entry per distinct tag.
+    """
+
+    def __init__(self, tag_counts: Optional[Dict[str, int]]):
+        self.tag_counts = tag_counts
+        self.size = len(tag_counts) if tag_counts else 0
+        self.total = max(sum(tag_counts.values()) if tag_counts else 0, 1)
+        self._counts = tag_counts or {}
+        self.weights: Dict[str, Optional[Tuple[Tuple[str, ...], float]]] = {}
+
+    def matches(self, tag_counts) -> bool:
+        return self.tag_counts is tag_counts and self.size == (
+            len(tag_counts) if tag_counts else 0
+        )
+
+    def weigh(self, raw_tag: str) -> Optional[Tuple[Tuple[str, ...], float]]:
+        cleaned, hits = _tag_hits(raw_tag)
+        entry = None
+        if hits:
+            freq = self._counts.get(cleaned, 0)
+            entry = (hits, 1.0 / math.log1p(freq / self.total * 100 + 1))
+        self.weights[raw_tag] = entry
+        return entry
+
+
+_last_idf_table: Optional[_IdfTable] = None
+_UNSEEN = object()
+_TIE_ORDER: List[str] = [m for m in PRIORITY if m in MOODS] + [
+    m for m in MOODS if m not in PRIORITY
+]
+
+
+def _idf_table(tag_counts: Optional[Dict[str, int]]) -> _IdfTable:
+    """The IDF table for tag_counts — rebuilt only when a different dict is passed."""
+    global _last_idf_table
+    table = _last_idf_table
+    if table is None or not table.matches(tag_counts):
+        table = _last_idf_table = _IdfTable(tag_counts)
+    return table
+
+
+@functools.lru_cache(maxsize=4096)
+def _genre_mood(genre: str) -> Optional[str]:
+    """GENRE_MOOD_FALLBACK lookup: exact key first, then the first partial match."""
+    genre_key = genre.lower().strip()
+    if genre_key in GENRE_MOOD_FALLBACK:
+        return GENRE_MOOD_FALLBACK[genre_key]
+    # Partial match (e.g. "Indie Rock" → "indie rock")
+    for gk, mood in GENRE_MOOD_FALLBACK.items():
+        if gk in genre_key or genre_key in gk:
+            return mood
+    return None
+
+
 def canonical_mood(
     tags,
     genre: Optional[str] = None,
@@ -432,40 +518,36 @@ def canonical_mood(
     Args:
         tags:        List of Last.fm tag strings (may be empty or None).
         genre:       iTunes-style genre string for fallback (may be None).
-        tag_counts:  Global tag frequency dict from build_tag_counts().
+        tag_counts:  Global tag frequency dict from build_tag_counts().  Its
+                     IDF table is cached, so pass the same (unmodified) dict
+                     for every track.
     """
-    scores: Dict[str, float] = {m: 0.0 for m in MOODS}
-    total = max(sum(tag_counts.values()) if tag_counts else 0, 1)
-
-    for raw_tag in (tags or []):
-        cleaned = re.sub(r"[^\w\s-]", " ", raw_tag.lower()).strip()
-        # IDF: common tags (like "seen live") carry almost no signal
-        freq = (tag_counts or {}).get(cleaned, 0)
-        idf = 1.0 / math.log1p(freq / total * 100 + 1)
-
-        for mood, keywords in MOODS.items():
-            for kw in keywords:
-                if kw in cleaned:
-                    scores[mood] += idf
-                    break  # only count once per (tag, mood) pair
-
-    best_score = max(scores.values())
-    if best_score > 0:
-        best_moods = [m for m, s in scores.items() if s == best_score]
-        for m in PRIORITY:
-            if m in best_moods:
-                return m
-        return best_moods[0]
+    if tags:
+        table = _idf_table(tag_counts)
+        lookup = table.weights.get
+        scores: Dict[str, float] = {}  # moods with at least one hit
+        for raw_tag in tags:
+            entry = lookup(raw_tag, _UNSEEN)
+            if entry is _UNSEEN:
+                entry = table.weigh(raw_tag)
+            if entry is None:
+                continue
+            # IDF: common tags (like "seen live") carry almost no signal
+            hits, idf = entry
+            for mood in hits:  # each (tag, mood) pair counts once
+                scores[mood] = scores.get(mood, 0.0) + idf
+
+        # Any hit has a positive IDF, so a hit always decides the mood;
+        # ties go to PRIORITY order, then MOODS order
+        if scores:
+            best_score = max(scores.values())
+            for m in _TIE_ORDER:
+                if scores.get(m) == best_score:
+                    return m
 
     # Fallback: derive mood from genre string
     if genre:
-        genre_key = genre.lower().strip()
-        if genre_key in GENRE_MOOD_FALLBACK:
-            return GENRE_MOOD_FALLBACK[genre_key]
-        # Partial match (e.g. "Indie Rock" → "indie rock")
-        for gk, mood in GENRE_MOOD_FALLBACK.items():
-            if gk in genre_key or genre_key in gk:
-                return mood
+        return _genre_mood(genre)
 
     return None
 
@@ -19,14 +19,24 @@ import random
 from pathlib import Path
 
 from .config import load_config
-from .itunes import convert_itunes_xml, load_itunes_json, build_library_from_dir, save_itunes_json
+from .itunes import (
+    convert_itunes_xml,
+    load_itunes_json,
+    build_library_from_dir,
+    save_itunes_json,
+    refresh_library_snapshot,
+)
 from .tag_mood_service import generate_tag_mood_cache, load_tag_mood_db
 from .spotify_profile import build_profile, load_profile
 from .scoring import score_tracks
 from .clustering import cluster_tracks, name_cluster, humanize_label
 from .playlist_builder import build_playlists
 from .feedback import load_feedback, save_feedback, update_feedback
+from .library_frame import ENRICHED_COLS, compact_library, copy_on_write
+from .lastfm_client import TagStore
+from .library_sync import consume_library_changes, load_library_changes
 from .mood_map import build_tag_counts
+from .track_index import assign_track_ids, reset_registry
 
 
 # ---------------------------------------------------------------------------
@@ -36,7 +46,9 @@ from .mood_map import build_tag_counts
 
 def ensure_itunes_json(cfg: dict) -> Path:
     """
-    Convert iTunes XML → JSON if the JSON is missing or older than the XML.
+    Convert iTunes XML → JSON if the JSON is missing or older than the XML,
+    then make sure the columnar snapshot next to it is current so
+    load_itunes_json() can skip the JSON parse.
     Returns the path to the (now-current) JSON file.
     """
     itunes_json = Path(cfg["ITUNES_JSON"])
@@ -47,6 +59,7 @@ def ensure_itunes_json(cfg: dict) -> Path:
     ):
         logging.info("Converting iTunes XML → JSON: %s → %s", itunes_xml, itunes_json)
         convert_itunes_xml(str(itunes_xml), str(itunes_json))
+    refresh_library_snapshot(itunes_json)
     return itunes_json
 
 
@@ -98,15 +111,36 @@ def run_pipeline(
     if cfg is None:
         cfg = load_config()
 
+    # Compact mode relies on shallow stage copies; scope the (process-global)
+    # pandas 2 copy-on-write option to this run.
+    with copy_on_write(bool(cfg.get("COMPACT_LIBRARY", False))):
+        return _run_stages(cfg, genre, mood, library_dir, no_ai)
+
+
+def _run_stages(
+    cfg: dict,
+    genre: str,
+    mood: str,
+    library_dir: str,
+    no_ai: bool,
+) -> list:
+    """Stages of run_pipeline(); arguments and return value as there."""
     logging.info("=== PlaylistGen pipeline starting ===")
+    reset_registry()
 
     # ------------------------------------------------------------------
     # Stage 1: Library loading
     # ------------------------------------------------------------------
+    library_changes = None  # change set pending since the last run (None = unknown)
     if library_dir:
         logging.info("Scanning local library: %s", library_dir)
         mutagen_enabled = bool(cfg.get("MUTAGEN_ENABLED", True))
-        df = build_library_from_dir(library_dir, mutagen_enabled=mutagen_enabled)
+        df = build_library_from_dir(
+            library_dir,
+            mutagen_enabled=mutagen_enabled,
+            workers=int(cfg.get("MUTAGEN_WORKERS", 0)),
+            tag_cache_db=cfg.get("MUTAGEN_CACHE_DB"),
+        )
         if df.empty:
             logging.error("No audio files found in %s — aborting.", library_dir)
             return []
@@ -118,7 +152,14 @@ def run_pipeline(
         if df.empty:
             logging.error("Library is empty — aborting.")
             return []
+        library_changes = load_library_changes(itunes_json)
 
+    compact = bool(cfg.get("COMPACT_LIBRARY", False))
+    if compact:
+        compact_library(df, keep_object=ENRICHED_COLS)
+
+    # Intern "artist - name" once; later stages join on the integer IDs
+    assign_track_ids(df)
     logging.info("Library loaded: %d tracks.", len(df))
 
     # ------------------------------------------------------------------
@@ -128,6 +169,7 @@ def run_pipeline(
     if librosa_enabled:
         try:
             from .audio_analysis import analyze_library
+            from .utils import parse_budget
 
             audio_cache = str(
                 Path(
@@ -138,6 +180,7 @@ def run_pipeline(
                 ).expanduser()
             )
             workers = int(cfg.get("AUDIO_ANALYSIS_WORKERS", 0))
+            budget_seconds, budget_tracks = parse_budget(cfg.get("AUDIO_ANALYSIS_BUDGET"))
             duration = int(cfg.get("AUDIO_ANALYSIS_DURATION", 120))
             df = analyze_library(
                 df,
@@ -145,7 +188,27 @@ def run_pipeline(
                 enabled=librosa_enabled,
                 workers=workers,
                 duration=duration,
+                changed_locations=(
+                    library_changes["changed_locations"] if library_changes else None
+                ),
+                mode=cfg.get("AUDIO_ANALYSIS_MODE", "full"),
+                sample_windows=int(cfg.get("AUDIO_SAMPLE_WINDOWS", 3)),
+                sample_seconds=float(cfg.get("AUDIO_SAMPLE_SECONDS", 10)),
+                checkpoint_tracks=int(cfg.get("AUDIO_CHECKPOINT_TRACKS", 200)),
+                checkpoint_seconds=float(cfg.get("AUDIO_CHECKPOINT_SECONDS", 30)),
+                prefetch_depth=int(cfg.get("AUDIO_PREFETCH_DEPTH", 0)),
+                io_workers=int(cfg.get("AUDIO_IO_WORKERS", 4)),
+                budget_seconds=budget_seconds,
+                budget_tracks=budget_tracks,
+                extended=bool(cfg.get("AUDIO_EXTENDED_FEATURES", False)),
+                service_socket=(
+                    cfg.get("AUDIO_WORKER_SOCKET")
+                    if cfg.get("AUDIO_WORKER_SERVICE")
+                    else None
+                ),
             )
+            if not library_dir:
+                consume_library_changes(itunes_json, library_changes)
         except Exception as exc:
             logging.warning("Audio analysis stage failed: %s — continuing.", exc)
 
@@ -253,12 +316,20 @@ def run_pipeline(
     # Stage 6: Scoring
     # ------------------------------------------------------------------
     logging.info("Scoring tracks…")
-    scored_df = score_tracks(
-        df,
-        config=profile,
-        tag_mood_db=tag_db,
-        session_model=session_model,
-    )
+    if compact:
+        compact_library(df)  # audio features and enriched Mood added above
+    try:
+        scored_df = score_tracks(
+            df,
+            config=profile,
+            tag_mood_db=tag_db,
+            session_model=session_model,
+        )
+    finally:
+        if isinstance(tag_db, TagStore):
+            tag_db.close()  # scoring is its last reader; release the SQLite handle
+    if compact:
+        compact_library(scored_df)  # Mood is filled in by scoring
 
     # ------------------------------------------------------------------
     # Stage 6b: Genre / Mood filter (single playlist mode)
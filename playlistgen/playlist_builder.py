@@ -32,7 +32,7 @@ from .utils import sanitize_label
 
 def cap_artist(df: pd.DataFrame, max_per_artist: int) -> pd.DataFrame:
     """Keep at most max_per_artist tracks per artist."""
-    return df.groupby("Artist", group_keys=False).head(max_per_artist)
+    return df.groupby("Artist", group_keys=False, observed=True).head(max_per_artist)
 
 
 def fill_short_pool(
@@ -55,7 +55,8 @@ def fill_short_pool(
         .drop_duplicates(subset=["Artist", "Name"])
         .copy()
     )
-    pool = pool[pool["Artist"].map(lambda a: counts.get(a, 0) < max_per_artist)]
+    full = [a for a, c in counts.items() if c >= max_per_artist]
+    pool = pool[~pool["Artist"].isin(full)]
 
     if pool.empty:
         return df
@@ -32,6 +32,8 @@ from typing import List, Optional, Tuple
 
 import pandas as pd
 
+from .library_frame import working_copy
+
 logger = logging.getLogger(__name__)
 
 # ---------------------------------------------------------------------------
@@ -627,7 +629,7 @@ def import_enrichment_result(
     except Exception as exc:
         logger.warning("Could not open enrichment cache: %s — continuing without cache.", exc)
 
-    df = df.copy()
+    df = working_copy(df)
     for col in ("Mood", "Energy", "Valence"):
         if col not in df.columns:
             df[col] = None
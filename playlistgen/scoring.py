@@ -17,10 +17,13 @@ Also populates a "Mood" column on the DataFrame for use in clustering.
 
 import logging
 
+import numpy as np
 import pandas as pd
 
 from .config import load_config
+from .library_frame import working_copy
 from .mood_map import canonical_mood, build_tag_counts
+from .track_index import frame_track_ids, get_registry
 
 logging.basicConfig(level=logging.INFO)
 
@@ -34,6 +37,22 @@ _DEFAULT_WEIGHTS = {
 }
 
 
+def _map_scores(col: pd.Series, scores: dict, lower: bool = False) -> pd.Series:
+    """
+    col.map(scores) with 0 for misses.  Categorical columns (compact library
+    frames) are mapped once per category and gathered by code.
+    """
+    if isinstance(col.dtype, pd.CategoricalDtype):
+        cats = pd.Series(col.cat.categories.astype(str))
+        if lower:
+            cats = cats.str.lower()
+        per_cat = np.append(cats.map(scores).fillna(0).to_numpy(dtype=np.float64), 0.0)
+        return pd.Series(per_cat[col.cat.codes.to_numpy()], index=col.index)
+    if lower:
+        col = col.fillna("").str.lower()
+    return col.map(scores).fillna(0)
+
+
 def score_tracks(
     itunes_df: pd.DataFrame,
     config=None,
@@ -96,7 +115,7 @@ def score_tracks(
         top_played = sorted(play_counts, key=play_counts.get, reverse=True)[:50]
 
     # --- Score each track ---
-    df = itunes_df.copy()
+    df = working_copy(itunes_df)
 
     artist_scores = profile.get("artist_scores", {})
     genre_scores = profile.get("genre_scores", {})  # now correctly populated
@@ -110,28 +129,38 @@ def score_tracks(
     track_play_counts = profile.get("track_play_counts", {})
     track_skip_counts = profile.get("track_skip_counts", {})
 
-    # --- Compute track IDs vectorized ---
-    df["_track_id"] = (df["Artist"].astype(str) + " - " + df["Name"].astype(str)).str.strip().str.lower()
+    # --- Track IDs: every per-track join below is an int-array gather ---
+    registry = get_registry()
+    track_ids = frame_track_ids(df, registry=registry)
+    df["_track_id"] = registry.keys(track_ids)
+
+    # A lazy TagStore reads just this library's rows, in one bulk query
+    if callable(getattr(tag_mood_db, "load", None)):
+        tag_mood_db.load(registry.keys(np.unique(track_ids)))
 
-    # --- Compute moods (requires per-row tag lookup, but avoid iterrows) ---
-    def _resolve_mood(row):
-        existing = row.get("Mood")
+    # --- Compute moods (per-row tag lookup over plain column lists) ---
+    def _resolve_mood(existing, tid, genre):
         if existing and existing not in ("Unknown", ""):
             return existing
-        tid = row["_track_id"]
         tags = tag_mood_db.get(tid, [])
         if isinstance(tags, dict):
             tags = tags.get("tags", [])
-        genre = str(row.get("Genre", "") or "")
+        genre = str(genre or "")
         mood = canonical_mood(tags, genre=genre if genre else None, tag_counts=tag_counts)
         return mood if mood else "Unknown"
 
-    df["Mood"] = df.apply(_resolve_mood, axis=1)
+    n = len(df)
+    existing_moods = df["Mood"].tolist() if "Mood" in df.columns else [None] * n
+    genres = df["Genre"].tolist() if "Genre" in df.columns else [""] * n
+    df["Mood"] = [
+        _resolve_mood(existing, tid, genre)
+        for existing, tid, genre in zip(existing_moods, df["_track_id"].tolist(), genres)
+    ]
 
     # --- Vectorized score computation ---
-    df["_artist_score"] = df["Artist"].map(artist_scores).fillna(0)
-    df["_genre_score"] = df["Genre"].fillna("").str.lower().map(genre_scores).fillna(0)
-    df["_mood_score"] = df["Mood"].map(mood_scores).fillna(0)
+    df["_artist_score"] = _map_scores(df["Artist"], artist_scores)
+    df["_genre_score"] = _map_scores(df["Genre"], genre_scores, lower=True)
+    df["_mood_score"] = _map_scores(df["Mood"], mood_scores)
 
     # Year score — vectorized
     df["_year_int"] = pd.to_numeric(df.get("Year"), errors="coerce")
@@ -142,8 +171,8 @@ def score_tracks(
     # Play/skip counts
     play_col = pd.to_numeric(df.get("Play Count"), errors="coerce").fillna(0)
     skip_col = pd.to_numeric(df.get("Skip Count"), errors="coerce").fillna(0)
-    spotify_play_col = df["_track_id"].map(track_play_counts).fillna(0)
-    spotify_skip_col = df["_track_id"].map(track_skip_counts).fillna(0)
+    spotify_play_col = registry.dense(track_play_counts)[track_ids]
+    spotify_skip_col = registry.dense(track_skip_counts)[track_ids]
 
     df["Score"] = (
         w["artist"] * df["_artist_score"]
@@ -157,17 +186,22 @@ def score_tracks(
     # --- Session model bonus (vectorized where possible) ---
     if session_model:
         # 1. Recency multiplier
-        recency_col = df["_track_id"].map(recency_map).fillna(0)
+        recency_col = registry.dense(recency_map)[track_ids]
         df["Score"] = df["Score"] * (1.0 + 0.5 * recency_col)
 
-        # 2. Co-occurrence boost
+        # 2. Co-occurrence boost — scatter each favourite's counter into one
+        # dense array, then gather
         if top_played and cooccurrence_map:
-            def _co_boost(tid):
-                return sum(
-                    cooccurrence_map.get(fav, {}).get(tid, 0)
-                    for fav in top_played
-                )
-            co_col = df["_track_id"].map(_co_boost)
+            co_total = np.zeros(len(registry), dtype=np.float64)
+            for fav in top_played:
+                counts = cooccurrence_map.get(fav)
+                if not counts:
+                    continue
+                ids = registry.lookup(counts.keys())
+                values = np.fromiter(counts.values(), dtype=np.float64, count=len(counts))
+                hit = ids >= 0
+                co_total[ids[hit]] += values[hit]
+            co_col = pd.Series(co_total[track_ids], index=df.index)
             df["Score"] = df["Score"] + 0.05 * (co_col / 50.0).clip(upper=1.0)
 
         # 3. Energy preference match
@@ -182,9 +216,7 @@ def score_tracks(
 
     # Compute energy_preference lazily after scoring if session_model present
     if session_model and "Energy" in df.columns and top_played:
-        track_ids = (df["Artist"].astype(str) + " - " + df["Name"].astype(str)).str.lower()
-        top_set = set(top_played)
-        top_played_mask = track_ids.isin(top_set)
+        top_played_mask = np.isin(track_ids, registry.lookup(top_played))
         energy_vals = pd.to_numeric(
             df.loc[top_played_mask, "Energy"], errors="coerce"
         ).dropna()
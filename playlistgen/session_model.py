@@ -28,6 +28,8 @@ from typing import Dict, List, Optional, Union
 
 import pandas as pd
 
+from .track_index import track_keys
+
 
 def load_streaming_history(
     json_paths: Union[str, List[str], Path],
@@ -103,9 +105,7 @@ def load_streaming_history(
     df = df.dropna(subset=["timestamp"])
     df = df[df["artist"].str.strip() != ""]
     df = df[df["track"].str.strip() != ""]
-    df["track_id"] = (
-        (df["artist"] + " - " + df["track"]).str.lower().str.strip()
-    )
+    df["track_id"] = track_keys(df["artist"], df["track"])
     df = df.sort_values("timestamp").reset_index(drop=True)
 
     logging.info(
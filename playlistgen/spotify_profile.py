@@ -22,13 +22,14 @@ from pathlib import Path
 
 from .config import load_config
 from .mood_map import canonical_genre
+from .track_index import track_key
 from .utils import progress_bar
 
 logging.basicConfig(level=logging.INFO)
 
 
 def _get_track_id(artist: str, track: str) -> str:
-    return f"{artist} - {track}".strip().lower()
+    return track_key(artist, track)
 
 
 def build_profile(
@@ -10,16 +10,18 @@ Existing call sites continue to work unchanged.
 
 import json
 import logging
+from collections import Counter
 from pathlib import Path
 from typing import Optional
 
 from .config import load_config
 from .lastfm_client import (
+    TagStore,
     generate_tag_cache,
-    load_tag_db_from_sqlite,
     init_cache_db,
     fetch_track_tags,
     migrate_json_to_sqlite,
+    select_track_lookups,
 )
 from .mood_map import MOODS, PRIORITY, canonical_mood, build_tag_counts
 
@@ -38,6 +40,9 @@ _cfg = load_config()
 _API_KEY = _cfg.get("LASTFM_API_KEY")
 _CACHE_DB = _cfg.get("LASTFM_CACHE_DB") or _cfg.get("CACHE_DB")
 _TAG_MOOD_CACHE = _cfg.get("TAG_MOOD_CACHE")
+_RATE_LIMIT_MS = int(_cfg.get("LASTFM_RATE_LIMIT_MS") or 0)
+_CONCURRENCY = int(_cfg.get("MOOD_CONCURRENCY") or 1)
+_TRACK_MIN_PLAYS = int(_cfg.get("LASTFM_TRACK_MIN_PLAYS") or 0)
 
 
 def fetch_lastfm_tags(
@@ -55,7 +60,7 @@ def fetch_lastfm_tags(
         return []
     db_path = _CACHE_DB or str(Path.home() / ".playlistgen" / "lastfm.sqlite")
     conn = init_cache_db(db_path)
-    tags = fetch_track_tags(artist, track, key, conn)
+    tags = fetch_track_tags(artist, track, key, conn, _RATE_LIMIT_MS)
     conn.close()
     return tags
 
@@ -80,22 +85,29 @@ def batch_tag_and_mood(
         api_key=key or "",
         db_path=db_path,
         json_legacy_path=legacy,
+        rate_limit_ms=_RATE_LIMIT_MS,
+        workers=_CONCURRENCY,
     )
-    return len(tag_db), 0
+    try:
+        return len(tag_db), 0
+    finally:
+        tag_db.close()
 
 
-def load_tag_mood_db(path=None) -> dict:
+def load_tag_mood_db(path=None):
     """
-    Load the tag/mood database.
+    Open the tag/mood database.
 
-    Tries the SQLite cache first; falls back to the legacy JSON file.
-    Returns a dict mapping "artist - track" → List[str] of tags.
+    Tries the SQLite cache first; falls back to the legacy JSON file (migrated
+    into SQLite on first use).  Returns a TagStore — a lazy read-only mapping
+    of "artist - track" → List[str] of tags whose rows are read on demand —
+    or an empty dict when there is no cache at all.
     """
     db_path = _CACHE_DB or str(Path.home() / ".playlistgen" / "lastfm.sqlite")
 
     # Prefer SQLite
     if Path(db_path).exists():
-        return load_tag_db_from_sqlite(db_path)
+        return TagStore(db_path)
 
     # Fall back to old JSON cache and migrate it
     json_path = path or _TAG_MOOD_CACHE
@@ -103,7 +115,7 @@ def load_tag_mood_db(path=None) -> dict:
         conn = init_cache_db(db_path)
         migrate_json_to_sqlite(str(json_path), conn)
         conn.close()
-        return load_tag_db_from_sqlite(db_path)
+        return TagStore(db_path)
 
     return {}
 
@@ -114,11 +126,16 @@ def generate_tag_mood_cache(
     """
     Scan iTunes JSON + Spotify history, fetch Last.fm tags for all unique tracks.
     Shim over lastfm_client.generate_tag_cache().
+
+    Tracks with at least LASTFM_TRACK_MIN_PLAYS plays (iTunes play count plus
+    Spotify streams) get a track-level lookup; the rest use their artist's
+    tags.  LASTFM_TRACK_MIN_PLAYS: 0 looks up every track.
     """
     import os
     from glob import glob
 
     tracks = []
+    plays: Counter = Counter()
 
     if itunes_json_path and Path(itunes_json_path).exists():
         with open(itunes_json_path, "r", encoding="utf-8") as f:
@@ -128,6 +145,10 @@ def generate_tag_mood_cache(
             n = t.get("Name")
             if a and n:
                 tracks.append((a, n))
+                try:
+                    plays[(a, n)] += int(t.get("Play Count") or 0)
+                except (TypeError, ValueError):
+                    pass
 
     if spotify_dir:
         for file in glob(os.path.join(str(spotify_dir), "*.json")):
@@ -138,6 +159,7 @@ def generate_tag_mood_cache(
                         n = entry.get("master_metadata_track_name")
                         if a and n:
                             tracks.append((a, n))
+                            plays[(a, n)] += 1
             except Exception as exc:
                 logging.warning("Could not read Spotify file %s: %s", file, exc)
 
@@ -158,4 +180,9 @@ def generate_tag_mood_cache(
         api_key=key,
         db_path=db_path,
         json_legacy_path=legacy,
+        rate_limit_ms=_RATE_LIMIT_MS,
+        workers=_CONCURRENCY,
+        track_lookups=(
+            select_track_lookups(plays, _TRACK_MIN_PLAYS) if _TRACK_MIN_PLAYS > 0 else None
+        ),
     )
@@ -0,0 +1,163 @@
+"""
+Canonical track identity for PlaylistGen.
+
+Every stage that joins library rows against per-track data — Last.fm tags,
+Spotify play/skip counts, session recency and co-occurrence, the Claude and
+Ollama enrichment caches — keys it by the same normalised string:
+
+    "<artist> - <name>", stripped and lower-cased
+
+track_key() / track_keys() build that string in exactly one place.
+TrackRegistry interns each key to a dense integer ID once per run, so stages
+can join on int arrays instead of hashing the same strings over and over:
+
+    reg = get_registry()
+    ids = frame_track_ids(df)               # int32[len(df)], interned once
+    plays = reg.dense(track_play_counts)    # float64[len(reg)]
+    df["plays"] = plays[ids]
+
+run_pipeline() calls reset_registry() at the start of a run and stores the
+library's IDs in the TRACK_ID column, which later stages reuse.  The column
+is stamped (in df.attrs) with the token of the registry that assigned it, so
+a frame from another run, or one built outside the pipeline, is re-interned
+rather than read against the wrong registry.
+"""
+
+import itertools
+from typing import Iterable, Optional
+
+import numpy as np
+import pandas as pd
+
+# Library DataFrame column holding the registry ID of each row
+TRACK_ID = "TrackIdx"
+
+
+def track_key(artist, name) -> str:
+    """Return the canonical "artist - name" key for one track."""
+    return f"{artist} - {name}".strip().lower()
+
+
+def track_keys(artist: pd.Series, name: pd.Series) -> pd.Series:
+    """Vectorised track_key(); missing values are treated as empty strings."""
+    return (
+        (artist.fillna("").astype(str) + " - " + name.fillna("").astype(str))
+        .str.strip()
+        .str.lower()
+    )
+
+
+class TrackRegistry:
+    """Interns canonical track keys to dense int32 IDs (0, 1, 2, ...)."""
+
+    _tokens = itertools.count(1)
+
+    def __init__(self):
+        self._ids: dict = {}
+        self._keys: list = []
+        self.token = next(self._tokens)  # identifies this registry's IDs
+
+    def __len__(self) -> int:
+        return len(self._keys)
+
+    def _resolve(self, keys: Iterable, add: bool) -> np.ndarray:
+        if not isinstance(keys, (pd.Series, np.ndarray)):
+            keys = np.asarray(list(keys), dtype=object)
+        # factorize hashes every key once in C; only the uniques touch Python
+        codes, uniques = pd.factorize(keys)
+        ids = self._ids
+        unique_ids = np.empty(len(uniques) + 1, dtype=np.int32)
+        unique_ids[-1] = -1  # factorize marks missing values with code -1
+        for i, key in enumerate(uniques):
+            tid = ids.get(key)
+            if tid is None:
+                if not add:
+                    tid = -1
+                else:
+                    tid = ids[key] = len(self._keys)
+                    self._keys.append(key)
+            unique_ids[i] = tid
+        return unique_ids[codes]
+
+    def intern(self, keys: Iterable) -> np.ndarray:
+        """Return the ID of each key, assigning new IDs to unseen keys."""
+        return self._resolve(keys, add=True)
+
+    def lookup(self, keys: Iterable) -> np.ndarray:
+        """Return the ID of each key, or -1 for keys never interned."""
+        return self._resolve(keys, add=False)
+
+    def keys(self, ids: np.ndarray) -> np.ndarray:
+        """Return the key string for each ID (object array)."""
+        return np.asarray(self._keys, dtype=object)[ids]
+
+    def dense(self, mapping: dict, fill: float = 0.0) -> np.ndarray:
+        """
+        Scatter a {track_key: value} dict into a float64 array indexed by ID.
+
+        Keys that are not in the registry (e.g. tracks outside the library)
+        are dropped; IDs without a value get fill.
+        """
+        out = np.full(len(self), fill, dtype=np.float64)
+        if mapping:
+            ids = self.lookup(mapping.keys())
+            values = np.fromiter(mapping.values(), dtype=np.float64, count=len(mapping))
+            hit = ids >= 0
+            out[ids[hit]] = values[hit]
+        return out
+
+
+_registry = TrackRegistry()
+
+
+def get_registry() -> TrackRegistry:
+    """Return the registry for the current run."""
+    return _registry
+
+
+def reset_registry() -> TrackRegistry:
+    """Start a fresh registry (called once per pipeline run)."""
+    global _registry
+    _registry = TrackRegistry()
+    return _registry
+
+
+def _intern_frame(df, registry, artist_col="Artist", name_col="Name") -> np.ndarray:
+    if df.empty:
+        return np.empty(0, dtype=np.int32)
+    missing = pd.Series("", index=df.index)
+    return registry.intern(
+        track_keys(df.get(artist_col, missing), df.get(name_col, missing))
+    )
+
+
+def frame_track_ids(
+    df: pd.DataFrame,
+    artist_col: str = "Artist",
+    name_col: str = "Name",
+    registry: Optional[TrackRegistry] = None,
+) -> np.ndarray:
+    """
+    Return the registry ID of every row in df.
+
+    Uses the TRACK_ID column when assign_track_ids() filled it from this
+    registry, otherwise interns the rows' keys.
+    """
+    if registry is None:
+        registry = get_registry()
+    if TRACK_ID in df.columns and df.attrs.get(TRACK_ID) == registry.token:
+        col = df[TRACK_ID]
+        if pd.api.types.is_integer_dtype(col.dtype):
+            ids = col.to_numpy(dtype=np.int32)
+            if not len(ids) or (ids.min() >= 0 and ids.max() < len(registry)):
+                return ids
+    return _intern_frame(df, registry, artist_col, name_col)
+
+
+def assign_track_ids(df: pd.DataFrame, registry: Optional[TrackRegistry] = None) -> pd.DataFrame:
+    """Intern every library row and store its ID in the TRACK_ID column (in place)."""
+    if registry is None:
+        registry = get_registry()
+    df[TRACK_ID] = _intern_frame(df, registry)
+    df.attrs[TRACK_ID] = registry.token
+    return df
@@ -1,5 +1,6 @@
 import os
 import re
+import sqlite3
 from pathlib import Path
 from urllib.parse import urlparse
 
@@ -50,6 +51,67 @@ def validate_path(path: str, must_exist: bool = False, base_dir: str | None = No
     return str(resolved)
 
 
+def sqlite_lookup(conn, table: str, key_cols, value_cols, keys) -> dict:
+    """
+    Fetch many rows of a SQLite table by key in one query.
+
+    Small key sets are bulk-inserted into a TEMP table and joined against
+    `table`'s index; key sets covering most of the table are answered by a
+    single scan into a dict.  Either way there is one statement, no
+    per-key round trip and no bound-variable limit to chunk around.
+
+    Args:
+        conn:       Open sqlite3 connection.
+        table:      Table to read (trusted identifier, not user input).
+        key_cols:   Column name(s) that make up the key.
+        value_cols: Columns to return for each hit.
+        keys:       Iterable of keys — plain values for a single key column,
+                    tuples for several.
+
+    Returns:
+        {key: tuple of value_cols} for every key present in the table.  When
+        several rows match a key (non-unique key columns) one of them wins.
+    """
+    if isinstance(key_cols, str):
+        key_cols = (key_cols,)
+    single = len(key_cols) == 1
+    rows = [(k,) for k in keys] if single else [tuple(k) for k in keys]
+    if not rows:
+        return {}
+    n = len(key_cols)
+    selected = ", ".join(list(key_cols) + list(value_cols))
+
+    try:
+        table_rows = conn.execute(f"SELECT MAX(rowid) FROM {table}").fetchone()[0] or 0
+    except sqlite3.OperationalError:  # WITHOUT ROWID table
+        table_rows = None
+    if table_rows is not None and len(rows) * 2 >= table_rows:
+        wanted = {r[0] for r in rows} if single else set(rows)
+        result = {}
+        for row in conn.execute(f"SELECT {selected} FROM {table}"):
+            key = row[0] if single else row[:n]
+            if key in wanted:
+                result[key] = row[n:]
+        return result
+
+    tmp = f"temp._lookup_{table}"
+    started = not conn.in_transaction
+    conn.execute(f"DROP TABLE IF EXISTS {tmp}")
+    conn.execute(f"CREATE TEMP TABLE _lookup_{table} ({', '.join(key_cols)})")
+    try:
+        conn.executemany(f"INSERT INTO {tmp} VALUES ({', '.join('?' * n)})", rows)
+        on = " AND ".join(f"t.{c} = k.{c}" for c in key_cols)
+        selected = ", ".join([f"k.{c}" for c in key_cols] + [f"t.{c}" for c in value_cols])
+        result = {}
+        for row in conn.execute(f"SELECT {selected} FROM {tmp} k JOIN {table} t ON {on}"):
+            result[row[0] if single else row[:n]] = row[n:]
+    finally:
+        conn.execute(f"DROP TABLE IF EXISTS {tmp}")
+        if started and conn.in_transaction:
+            conn.commit()  # only the temp-table inserts — release the read snapshot
+    return result
+
+
 def validate_url(url: str, allowed_schemes: tuple[str, ...] = ("http", "https")) -> str:
     """
     Validate a URL has an allowed scheme and a non-empty host.
@@ -66,6 +128,32 @@ def validate_url(url: str, allowed_schemes: tuple[str, ...] = ("http", "https"))
     return url
 
 
+_BUDGET_UNITS = {"s": 1, "m": 60, "h": 3600}
+
+
+def parse_budget(value) -> tuple[float | None, int | None]:
+    """
+    Parse an analysis budget into (seconds, tracks).
+
+    "500" (or 500) is a track count; "90s", "45m" and "2h" are wall-clock
+    durations.  None / "" means no budget: (None, None).
+
+    Raises:
+        ValueError: If value is not one of those forms.
+    """
+    if value is None or str(value).strip() == "":
+        return None, None
+    text = str(value).strip().lower()
+    if text.isdigit() and int(text) > 0:
+        return None, int(text)
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)\s*([smh])", text)
+    if match and float(match.group(1)) > 0:
+        return float(match.group(1)) * _BUDGET_UNITS[match.group(2)], None
+    raise ValueError(
+        f"invalid budget {value!r} — use a track count (500) or a duration (90s, 45m, 2h)"
+    )
+
+
 def validate_config(cfg: dict) -> list[str]:
     """
     Validate configuration values. Returns a list of warning messages
@@ -79,11 +167,20 @@ def validate_config(cfg: dict) -> list[str]:
         "MAX_PER_ARTIST": (1, 100),
         "TRACKS_PER_MIX": (1, 10000),
         "AUDIO_ANALYSIS_WORKERS": (0, 64),
+        "MUTAGEN_WORKERS": (0, 64),
         "AUDIO_ANALYSIS_DURATION": (1, 600),
+        "AUDIO_SAMPLE_WINDOWS": (1, 20),
+        "AUDIO_SAMPLE_SECONDS": (1, 120),
+        "AUDIO_CHECKPOINT_TRACKS": (1, 100000),
+        "AUDIO_CHECKPOINT_SECONDS": (1, 3600),
+        "AUDIO_PREFETCH_DEPTH": (0, 256),
+        "AUDIO_IO_WORKERS": (1, 64),
         "SESSION_GAP_MINUTES": (1, 1440),
         "RECENCY_HALF_LIFE_DAYS": (1, 3650),
         "AI_ENRICH_BATCH_SIZE": (1, 1000),
         "LASTFM_RATE_LIMIT_MS": (0, 10000),
+        "MOOD_CONCURRENCY": (1, 64),
+        "LASTFM_TRACK_MIN_PLAYS": (0, 1000000),
     }
     for key, (lo, hi) in int_ranges.items():
         val = cfg.get(key)
@@ -98,6 +195,17 @@ def validate_config(cfg: dict) -> list[str]:
             except (ValueError, TypeError):
                 warnings.append(f"{key}={val!r} is not a valid integer")
 
+    try:
+        parse_budget(cfg.get("AUDIO_ANALYSIS_BUDGET"))
+    except ValueError as exc:
+        warnings.append(f"AUDIO_ANALYSIS_BUDGET: {exc}; analysing everything")
+        cfg["AUDIO_ANALYSIS_BUDGET"] = None
+
+    mode = cfg.get("AUDIO_ANALYSIS_MODE")
+    if mode is not None and mode not in ("full", "sampled"):
+        warnings.append(f"AUDIO_ANALYSIS_MODE={mode!r} is not 'full' or 'sampled', using 'full'")
+        cfg["AUDIO_ANALYSIS_MODE"] = "full"
+
     # Validate URL if present
     ollama_url = cfg.get("OLLAMA_BASE_URL")
     if ollama_url:
@@ -0,0 +1,119 @@
+"""Tests for playlistgen/analysis_service.py"""
+
+import socket
+import sqlite3
+import tempfile
+import threading
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+import pandas as pd
+import pytest
+
+from playlistgen.analysis_service import _code_version, connect_service, serve, stop_service
+from playlistgen.audio_analysis import analyze_library
+
+
+def _write_click_track(path, seconds=5.0, bpm=120.0, sr=22050):
+    sf = pytest.importorskip("soundfile")
+    np = pytest.importorskip("numpy")
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    click = np.sin(2 * np.pi * 1000 * np.arange(int(0.03 * sr)) / sr).astype(np.float32)
+    for start in range(0, len(y) - len(click), int(sr * 60.0 / bpm)):
+        y[start:start + len(click)] += click
+    sf.write(path, y, sr)
+
+
+@pytest.fixture(scope="module")
+def service():
+    pytest.importorskip("librosa")
+    # Short directory: Unix socket paths are limited to ~100 characters
+    with tempfile.TemporaryDirectory(prefix="pg-svc-") as tmp:
+        socket_path = str(Path(tmp) / "a.sock")
+        thread = threading.Thread(target=serve, args=(socket_path, 1), daemon=True)
+        thread.start()
+        deadline = time.monotonic() + 60
+        while (probe := connect_service(socket_path)) is None:
+            assert thread.is_alive() and time.monotonic() < deadline
+            time.sleep(0.1)
+        probe.shutdown()
+        yield socket_path
+        assert stop_service(socket_path, timeout=30)
+        thread.join(30)
+        assert not thread.is_alive()
+        assert not Path(socket_path).exists()
+
+
+def test_connect_service_none_when_not_running(tmp_path):
+    assert connect_service(str(tmp_path / "missing.sock")) is None
+    # Stale socket + key left by a crashed service
+    (tmp_path / "stale.sock").touch()
+    (tmp_path / "stale.sock.key").write_bytes(b"k")
+    assert connect_service(str(tmp_path / "stale.sock")) is None
+    assert stop_service(str(tmp_path / "missing.sock")) is False
+
+
+def test_analyze_library_uses_service_workers(service, tmp_path, caplog):
+    paths = []
+    for i in range(3):
+        path = str(tmp_path / f"t{i}.wav")
+        _write_click_track(path, bpm=100.0 + 10 * i)
+        paths.append(path)
+    df = pd.DataFrame(
+        {"Location": paths, "Name": ["A", "B", "C"], "Artist": ["X"] * 3, "BPM": [None] * 3}
+    )
+    db_path = str(tmp_path / "audio.sqlite")
+
+    with caplog.at_level("INFO"), patch(
+        "playlistgen.audio_analysis.ProcessPoolExecutor",
+        side_effect=AssertionError("local pool started"),
+    ):
+        result = analyze_library(df, db_path=db_path, workers=4, service_socket=service)
+
+    assert "using 1 warm workers from the analysis service" in caplog.text
+    assert result["Energy"].notna().all()
+    assert result["BPM"].tolist() == pytest.approx([100.0, 110.0, 120.0], abs=4)
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM audio_features").fetchone()[0] == 3
+    conn.close()
+
+
+def test_worker_errors_come_back_as_exceptions(service):
+    from playlistgen.audio_analysis import _analyze_one
+
+    executor = connect_service(service)
+    try:
+        bad = executor.submit(_analyze_one, ("not", "a", "valid", "task"))
+        with pytest.raises(RuntimeError, match="ValueError"):
+            bad.result(timeout=30)
+        with pytest.raises(ValueError):
+            executor.submit(print, None)
+    finally:
+        executor.shutdown()
+
+
+def test_version_mismatch_falls_back_to_local(service, caplog):
+    with patch("playlistgen.analysis_service._code_version", return_value="0:other"):
+        assert connect_service(service, timeout=30) is None
+    assert "runs a different version" in caplog.text
+
+
+def test_stalled_client_does_not_block_others(service):
+    # Connects but never answers the authentication challenge
+    with socket.socket(socket.AF_UNIX) as stalled:
+        stalled.connect(service)
+        executor = connect_service(service, timeout=30)
+        assert executor is not None
+        executor.shutdown()
+
+
+def test_code_version_covers_worker_modules(tmp_path):
+    from playlistgen import utils
+
+    before = _code_version()
+    changed = tmp_path / "utils.py"
+    changed.write_bytes(Path(utils.__file__).read_bytes() + b"\n# changed\n")
+    with patch.object(utils, "__file__", str(changed)):
+        assert _code_version() != before
+    assert _code_version() == before
@@ -1,7 +1,9 @@
 """Tests for playlistgen/audio_analysis.py"""
 
+import os
 import sqlite3
 import tempfile
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from unittest.mock import patch, MagicMock
 
@@ -9,15 +11,27 @@ import pandas as pd
 import pytest
 
 from playlistgen.audio_analysis import (
+    _FEATURE_KEYS,
     _init_db,
-    _cache_get,
+    _cache_get_batch,
     _cache_set,
+    _file_fingerprint,
     _resolve_path,
+    _sample_offsets,
+    _aggregate_windows,
+    _priority_order,
     analyze_track,
     analyze_library,
+    compare_analysis_modes,
 )
 
 
+def _cache_get(conn, path, mtime):
+    """Cached bpm / energy / spectral_brightness / zcr for (path, mtime), or None."""
+    cached = _cache_get_batch(conn, [(path, mtime)]).get(path)
+    return None if cached is None else {k: cached[k] for k in _FEATURE_KEYS}
+
+
 # ---------------------------------------------------------------------------
 # _resolve_path
 # ---------------------------------------------------------------------------
@@ -166,3 +180,816 @@ def test_analyze_library_uses_cache():
         # (cache loading doesn't require librosa)
         # Note: if librosa is False the function returns early, so check gracefully
         assert isinstance(result, pd.DataFrame)
+
+
+def test_analyze_library_unchanged_tracks_still_check_the_file(tmp_path):
+    """Tracks outside the change set use the cached row only if mtime and size match."""
+    db_path = str(tmp_path / "audio.sqlite")
+    same, replaced = tmp_path / "same.mp3", tmp_path / "replaced.mp3"
+    same.write_bytes(b"x" * 100)
+    replaced.write_bytes(b"x" * 100)
+    conn = _init_db(db_path)
+    features = {"bpm": 128.0, "energy": 0.09, "spectral_brightness": 0.3, "zcr": 0.1}
+    _cache_set(conn, str(same), os.path.getmtime(same), features, "100:abc")
+    # Same path and mtime, different size: the file was replaced in place
+    _cache_set(conn, str(replaced), os.path.getmtime(replaced), features, "99:abc")
+    _cache_set(conn, "/not/on/disk.mp3", 1.0, features)
+    conn.close()
+
+    df = pd.DataFrame({
+        "Location": [str(same), str(replaced), "/not/on/disk.mp3"],
+        "Name": ["A", "B", "C"],
+        "Artist": ["X"] * 3,
+    })
+    with patch(
+        "playlistgen.audio_analysis._run_pool", return_value={"completed": 0, "failed": 0}
+    ) as run_pool:
+        result = analyze_library(df, db_path=db_path, changed_locations=[])
+
+    assert abs(result.at[0, "Energy"] - 0.09) < 1e-9
+    assert [path for _, path, _ in run_pool.call_args[0][1]] == [str(replaced)]
+    assert pd.isna(result.at[2, "Energy"])  # gone from disk: no stale features
+
+
+# ---------------------------------------------------------------------------
+# Sampled-window mode
+# ---------------------------------------------------------------------------
+
+def _write_click_track(path, seconds=60.0, bpm=120.0, sr=22050):
+    sf = pytest.importorskip("soundfile")
+    np = pytest.importorskip("numpy")
+    y = np.zeros(int(seconds * sr), dtype=np.float32)
+    click = np.sin(2 * np.pi * 1000 * np.arange(int(0.03 * sr)) / sr).astype(np.float32)
+    step = int(sr * 60.0 / bpm)
+    for start in range(0, len(y) - len(click), step):
+        y[start:start + len(click)] += click
+    sf.write(path, y, sr)
+
+
+def test_sample_offsets_centred_and_clamped():
+    assert _sample_offsets(200.0, 3, 10.0) == [45.0, 95.0, 145.0]
+    # Windows never start before 0 or run past the end
+    offsets = _sample_offsets(12.0, 3, 10.0)
+    assert all(0.0 <= o <= 2.0 for o in offsets)
+
+
+def test_aggregate_windows_mean_and_median_bpm():
+    per_window = [
+        {"bpm": 120.0, "energy": 0.1, "spectral_brightness": 0.2, "zcr": 0.01},
+        {"bpm": 60.0, "energy": 0.3, "spectral_brightness": 0.4, "zcr": 0.03},
+        {"bpm": 121.0, "energy": 0.2, "spectral_brightness": 0.3, "zcr": 0.02},
+    ]
+    result = _aggregate_windows(per_window)
+    assert result["bpm"] == 120.0
+    assert result["energy"] == pytest.approx(0.2)
+    assert result["zcr"] == pytest.approx(0.02)
+    assert _aggregate_windows([]) == {}
+
+
+def test_analyze_track_sampled_loads_only_windows(tmp_path):
+    pytest.importorskip("librosa")
+    path = str(tmp_path / "click.wav")
+    _write_click_track(path)
+
+    import playlistgen.audio_analysis as aa
+
+    with patch(
+        "playlistgen.audio_analysis._stream_features", wraps=aa._stream_features
+    ) as spy:
+        result = analyze_track(path, mode="sampled", windows=3, window_sec=5)
+
+    assert [c.args[1] for c in spy.call_args_list] == [12.5, 27.5, 42.5]
+    assert all(c.args[2] == 5 for c in spy.call_args_list)
+    assert set(result) == {"bpm", "energy", "spectral_brightness", "zcr"}
+    assert result["bpm"] == pytest.approx(120.0, abs=3)
+
+
+def test_analyze_track_sampled_short_track_falls_back_to_full(tmp_path):
+    pytest.importorskip("librosa")
+    path = str(tmp_path / "short.wav")
+    _write_click_track(path, seconds=8.0)
+    assert analyze_track(path, mode="sampled", windows=3, window_sec=5) == analyze_track(path)
+
+
+def test_compare_analysis_modes_reports_errors(tmp_path):
+    pytest.importorskip("librosa")
+    path = str(tmp_path / "click.wav")
+    _write_click_track(path)
+    report = compare_analysis_modes([path, str(tmp_path / "missing.wav")], windows=3, window_sec=5)
+    assert report["tracks"] == 1
+    assert report["bpm_within_2"] == 1.0
+    assert set(report["features"]) == {"energy", "spectral_brightness", "zcr"}
+    assert report["features"]["energy"]["mae"] < 0.01
+    assert report["speedup"] > 0
+
+
+# ---------------------------------------------------------------------------
+# Single-STFT kernel
+# ---------------------------------------------------------------------------
+
+def test_analyze_track_resamples_to_analysis_rate(tmp_path):
+    pytest.importorskip("librosa")
+    import playlistgen.audio_analysis as aa
+
+    path = str(tmp_path / "hires.wav")
+    _write_click_track(path, seconds=20.0, sr=48000)
+    pushed = []
+    real_push = aa._StreamAccumulator.push
+
+    def _spy(self, y):
+        pushed.append(len(y))
+        real_push(self, y)
+
+    with patch.object(aa._StreamAccumulator, "push", _spy):
+        result = analyze_track(path)
+    assert sum(pushed) == pytest.approx(20.0 * aa.ANALYSIS_SR, abs=64)
+    assert result["bpm"] == pytest.approx(120.0, abs=3)
+
+
+# ---------------------------------------------------------------------------
+# Streaming decode
+# ---------------------------------------------------------------------------
+
+def test_streamed_features_match_whole_buffer(tmp_path):
+    pytest.importorskip("librosa")
+    import librosa
+    import playlistgen.audio_analysis as aa
+
+    path = str(tmp_path / "click.flac")
+    _write_click_track(path, seconds=30.0, sr=44100)
+    y, sr = librosa.load(path, sr=aa.ANALYSIS_SR, mono=True)
+    whole = aa._buffer_features(y, sr)
+    # Tiny blocks: many carries across block boundaries
+    with patch.object(aa, "_STREAM_BLOCK_FRAMES", 3000):
+        streamed = analyze_track(path)
+    assert streamed["bpm"] == pytest.approx(whole["bpm"], abs=1)
+    for key in ("energy", "spectral_brightness", "zcr"):
+        assert streamed[key] == pytest.approx(whole[key], rel=0.02)
+
+
+def test_stream_reads_bounded_blocks(tmp_path):
+    pytest.importorskip("librosa")
+    import playlistgen.audio_analysis as aa
+
+    path = str(tmp_path / "long.wav")
+    _write_click_track(path, seconds=40.0, sr=48000)
+    sizes = []
+    real_read = aa.sf.SoundFile.read
+
+    def _spy(self, frames=-1, *args, **kwargs):
+        out = real_read(self, frames, *args, **kwargs)
+        sizes.append(len(out))
+        return out
+
+    with patch.object(aa, "_STREAM_BLOCK_FRAMES", 1 << 14), \
+            patch.object(aa.sf.SoundFile, "read", _spy):
+        analyze_track(path, duration=30)
+    assert max(sizes) == 1 << 14
+    assert sum(sizes) == 30 * 48000
+
+
+def test_estimate_tempo_matches_librosa():
+    np = pytest.importorskip("numpy")
+    librosa = pytest.importorskip("librosa")
+    import playlistgen.audio_analysis as aa
+
+    rng = np.random.default_rng(0)
+    env = rng.random(3000) * ((np.arange(3000) % 22) == 0)
+    expected = librosa.feature.tempo(onset_envelope=env, sr=aa.ANALYSIS_SR, hop_length=aa._HOP)[0]
+    assert aa._estimate_tempo(env, aa.ANALYSIS_SR) == pytest.approx(expected)
+
+
+def test_unsupported_format_falls_back_to_librosa_load(tmp_path):
+    pytest.importorskip("librosa")
+    import playlistgen.audio_analysis as aa
+
+    path = str(tmp_path / "click.wav")
+    _write_click_track(path, seconds=10.0)
+    no_libsndfile = MagicMock(SoundFile=MagicMock(side_effect=RuntimeError("unsupported")))
+    with patch.object(aa, "sf", no_libsndfile), \
+            patch("playlistgen.audio_analysis.librosa.load", wraps=aa.librosa.load) as spy:
+        result = analyze_track(path)
+    spy.assert_called_once()
+    assert result["bpm"] == pytest.approx(120.0, abs=3)
+
+
+def test_analyze_track_need_bpm_false_skips_tempo(tmp_path):
+    pytest.importorskip("librosa")
+    path = str(tmp_path / "click.wav")
+    _write_click_track(path, seconds=20.0)
+    with patch("playlistgen.audio_analysis.librosa.feature.tempo") as mock_tempo:
+        result = analyze_track(path, need_bpm=False)
+    mock_tempo.assert_not_called()
+    assert result["bpm"] is None
+    assert result["energy"] > 0
+
+
+def test_analyze_library_trusts_tag_bpm_and_fills_missing(tmp_path):
+    pytest.importorskip("librosa")
+    tagged = str(tmp_path / "tagged.wav")
+    untagged = str(tmp_path / "untagged.wav")
+    _write_click_track(tagged, seconds=20.0)
+    _write_click_track(untagged, seconds=20.0)
+    df = pd.DataFrame({
+        "Location": [tagged, untagged],
+        "Name": ["A", "B"],
+        "Artist": ["X", "Y"],
+        "BPM": [98.0, None],
+    })
+    db_path = str(tmp_path / "audio.sqlite")
+    result = analyze_library(df, db_path=db_path, workers=1)
+
+    assert result.at[0, "BPM"] == 98.0
+    assert result.at[1, "BPM"] == pytest.approx(120.0, abs=3)
+    assert result["Energy"].notna().all()
+    conn = sqlite3.connect(db_path)
+    cached_bpm = dict(conn.execute("SELECT path, bpm FROM audio_features").fetchall())
+    conn.close()
+    assert cached_bpm[tagged] is None
+
+
+# ---------------------------------------------------------------------------
+# Checkpointing
+# ---------------------------------------------------------------------------
+
+def _click_library(tmp_path, n):
+    paths = []
+    for i in range(n):
+        path = str(tmp_path / f"t{i}.wav")
+        _write_click_track(path, seconds=5.0, bpm=100.0 + 10 * i)  # distinct content
+        paths.append(path)
+    return pd.DataFrame({
+        "Location": paths,
+        "Name": [f"T{i}" for i in range(n)],
+        "Artist": ["X"] * n,
+    })
+
+
+def test_analyze_library_checkpoints_every_n_tracks(tmp_path):
+    pytest.importorskip("librosa")
+    import playlistgen.audio_analysis as aa
+
+    df = _click_library(tmp_path, 4)
+    real_set_batch = aa._cache_set_batch
+    sizes = []
+
+    def _record(conn, records):
+        sizes.append(len(records))
+        real_set_batch(conn, records)
+
+    with patch("playlistgen.audio_analysis._cache_set_batch", side_effect=_record):
+        analyze_library(df, db_path=str(tmp_path / "audio.sqlite"), workers=1,
+                        checkpoint_tracks=2, checkpoint_seconds=3600)
+    assert sizes == [2, 2, 0]
+
+
+def test_analyze_library_interrupted_run_resumes(tmp_path, caplog):
+    pytest.importorskip("librosa")
+    import playlistgen.audio_analysis as aa
+
+    df = _click_library(tmp_path, 5)
+    db_path = str(tmp_path / "audio.sqlite")
+    real_apply, real_wait = aa._apply_cached, aa.wait
+    applied = []
+
+    def _count_apply(*args):
+        applied.append(args)
+        real_apply(*args)
+
+    def _ctrl_c_after_two(*args, **kwargs):
+        if len(applied) >= 2:
+            raise KeyboardInterrupt
+        return real_wait(*args, **kwargs)
+
+    with patch("playlistgen.audio_analysis._apply_cached", side_effect=_count_apply), \
+            patch("playlistgen.audio_analysis.wait", side_effect=_ctrl_c_after_two):
+        with pytest.raises(KeyboardInterrupt):
+            analyze_library(df, db_path=db_path, workers=1, checkpoint_tracks=100)
+
+    conn = sqlite3.connect(db_path)
+    saved = conn.execute("SELECT COUNT(*) FROM audio_features").fetchone()[0]
+    conn.close()
+    assert saved == len(applied) and 2 <= saved < 5
+
+    with caplog.at_level("INFO"):
+        result = analyze_library(df, db_path=db_path, workers=1)
+    assert f"analyzing {5 - saved} new tracks" in caplog.text
+    assert result["Energy"].notna().all()
+    conn = sqlite3.connect(db_path)
+    assert conn.execute("SELECT COUNT(*) FROM audio_features").fetchone()[0] == 5
+    conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Content fingerprints — moved / renamed files
+# ---------------------------------------------------------------------------
+
+_FEATURES = {"bpm": 128.0, "energy": 0.09, "spectral_brightness": 0.3, "zcr": 0.1}
+
+
+def _no_analysis():
+    """Fail the test if any track is actually analyzed."""
+    return patch(
+        "playlistgen.audio_analysis.ProcessPoolExecutor",
+        side_effect=AssertionError("track was re-analyzed"),
+    )
+
+
+def test_file_fingerprint_content_based(tmp_path):
+    a = tmp_path / "a.mp3"
+    a.write_bytes(b"x" * 50000)
+    b = tmp_path / "sub" / "renamed.mp3"
+    b.parent.mkdir()
+    b.write_bytes(b"x" * 50000)
+    c = tmp_path / "c.mp3"
+    c.write_bytes(b"x" * 49999 + b"y")
+    assert _file_fingerprint(str(a)) == _file_fingerprint(str(b))
+    assert _file_fingerprint(str(a)) != _file_fingerprint(str(c))
+    assert _file_fingerprint(str(tmp_path / "missing.mp3")) is None
+
+
+def test_init_db_migrates_old_schema(tmp_path):
+    db_path = str(tmp_path / "audio.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute(
+        "CREATE TABLE audio_features (path TEXT PRIMARY KEY, mtime REAL, bpm REAL, "
+        "energy REAL, spectral_brightness REAL, zcr REAL, analyzed_at INTEGER)"
+    )
+    conn.execute("INSERT INTO audio_features VALUES ('/a.mp3', 1.0, 120, 0.1, 0.2, 0.3, 0)")
+    conn.commit()
+    conn.close()
+
+    conn = _init_db(db_path)
+    cols = {row[1] for row in conn.execute("PRAGMA table_info(audio_features)")}
+    assert {"fingerprint", "descriptors", "descriptor_version"} <= cols
+    assert _cache_get(conn, "/a.mp3", 1.0)["bpm"] == 120
+    conn.close()
+
+
+def test_analyze_library_matches_moved_file_by_content(tmp_path):
+    import os
+
+    old = tmp_path / "old" / "song.mp3"
+    old.parent.mkdir()
+    old.write_bytes(os.urandom(40000))
+    db_path = str(tmp_path / "audio.sqlite")
+    conn = _init_db(db_path)
+    _cache_set(conn, str(old), old.stat().st_mtime, _FEATURES, _file_fingerprint(str(old)))
+    conn.close()
+
+    new = tmp_path / "new" / "Artist - Song.mp3"
+    new.parent.mkdir()
+    old.rename(new)
+    df = pd.DataFrame({"Location": [str(new)], "Name": ["Song"], "Artist": ["Artist"]})
+    with _no_analysis():
+        result = analyze_library(df, db_path=db_path)
+
+    assert abs(result.at[0, "Energy"] - 0.09) < 1e-9
+    conn = sqlite3.connect(db_path)
+    rows = conn.execute("SELECT path, mtime, energy FROM audio_features").fetchall()
+    conn.close()
+    assert rows == [(str(new), new.stat().st_mtime, 0.09)]
+
+
+def test_analyze_library_keeps_row_for_duplicate_copy(tmp_path):
+    import os
+    import shutil
+
+    original = tmp_path / "a.mp3"
+    original.write_bytes(os.urandom(40000))
+    db_path = str(tmp_path / "audio.sqlite")
+    conn = _init_db(db_path)
+    _cache_set(conn, str(original), original.stat().st_mtime, _FEATURES,
+               _file_fingerprint(str(original)))
+    conn.close()
+
+    copy = tmp_path / "b.mp3"
+    shutil.copy(original, copy)
+    df = pd.DataFrame({"Location": [str(copy)], "Name": ["B"], "Artist": ["X"]})
+    with _no_analysis():
+        analyze_library(df, db_path=db_path)
+
+    conn = sqlite3.connect(db_path)
+    paths = {row[0] for row in conn.execute("SELECT path FROM audio_features")}
+    conn.close()
+    assert paths == {str(original), str(copy)}
+
+
+def test_analyze_library_backfills_missing_fingerprints(tmp_path):
+    song = tmp_path / "song.mp3"
+    song.write_bytes(b"\x01" * 30000)
+    db_path = str(tmp_path / "audio.sqlite")
+    conn = _init_db(db_path)
+    _cache_set(conn, str(song), song.stat().st_mtime, _FEATURES)
+    conn.close()
+
+    df = pd.DataFrame({"Location": [str(song)], "Name": ["S"], "Artist": ["X"]})
+    analyze_library(df, db_path=db_path)
+
+    conn = sqlite3.connect(db_path)
+    stored = conn.execute("SELECT fingerprint FROM audio_features").fetchone()[0]
+    conn.close()
+    assert stored == _file_fingerprint(str(song))
+
+
+# ---------------------------------------------------------------------------
+# Read-ahead
+# ---------------------------------------------------------------------------
+
+def test_analyze_track_decodes_prefetched_bytes(tmp_path):
+    pytest.importorskip("librosa")
+    path = tmp_path / "click.wav"
+    _write_click_track(str(path), seconds=10.0)
+    data = path.read_bytes()
+    from_disk = analyze_track(str(path))
+    path.unlink()  # must not be needed any more
+    assert analyze_track(str(path), data=data) == from_disk
+
+
+def test_analyze_track_bad_bytes_fall_back_to_file(tmp_path):
+    pytest.importorskip("librosa")
+    path = str(tmp_path / "click.wav")
+    _write_click_track(path, seconds=10.0)
+    assert analyze_track(path, data=b"not audio") == analyze_track(path)
+
+
+def test_read_ahead_yields_tasks_in_order_with_bytes(tmp_path):
+    from playlistgen.audio_analysis import _ReadAhead
+
+    tasks = []
+    for i in range(5):
+        p = tmp_path / f"{i}.bin"
+        p.write_bytes(bytes([i]) * 10)
+        tasks.append((i, str(p), {"mode": "full"}))
+    tasks.append((5, str(tmp_path / "missing.bin"), {"mode": "full"}))
+
+    ahead = _ReadAhead(tasks, depth=2, io_workers=2)
+    out = list(ahead)
+    ahead.close()
+    assert [t[0] for t in out] == list(range(6))
+    assert out[3][2] == {"mode": "full", "data": b"\x03" * 10}
+    assert "data" not in out[5][2]
+    assert ahead.wait_seconds >= 0
+
+
+def test_analyze_library_with_read_ahead(tmp_path, caplog):
+    pytest.importorskip("librosa")
+    df = _click_library(tmp_path, 3)
+    with caplog.at_level("INFO"):
+        result = analyze_library(df, db_path=str(tmp_path / "audio.sqlite"), workers=1,
+                                 prefetch_depth=2, io_workers=2)
+    assert result["Energy"].notna().all()
+    assert "waiting on file reads" in caplog.text
+
+
+# ---------------------------------------------------------------------------
+# Priority order and budget
+# ---------------------------------------------------------------------------
+
+def test_priority_order_play_count_then_undercovered_genre():
+    df = pd.DataFrame({
+        "Play Count": [0, 50, 0, 0, 5],
+        "Genre": ["Rock", "Rock", "Jazz", "Rock", "Jazz"],
+        "Energy": [None, None, None, 0.1, None],
+    })
+    tasks = [(i, f"/{i}.mp3", {}) for i in range(5)]
+    order = [t[0] for t in _priority_order(df, tasks)]
+    # Most played first; among unplayed tracks Jazz (0% analyzed) beats Rock (25%)
+    assert order == [1, 4, 2, 0, 3]
+
+
+def test_priority_order_prefers_score_when_present():
+    df = pd.DataFrame({
+        "Score": [1.0, 3.0, 2.0],
+        "Play Count": [99, 0, 0],
+        "Energy": [None, None, None],
+    })
+    tasks = [(i, f"/{i}.mp3", {}) for i in range(3)]
+    assert [t[0] for t in _priority_order(df, tasks)] == [1, 2, 0]
+
+
+def test_analyze_library_track_budget_defers_rest(tmp_path, caplog):
+    pytest.importorskip("librosa")
+    df = _click_library(tmp_path, 3)
+    df["Play Count"] = [1, 9, 5]
+    with caplog.at_level("INFO"):
+        result = analyze_library(df, db_path=str(tmp_path / "audio.sqlite"), workers=1,
+                                 budget_tracks=2)
+    assert result["Energy"].notna().tolist() == [False, True, True]
+    assert "1 tracks left for later runs" in caplog.text
+
+
+def test_analyze_library_time_budget_stops_submitting(tmp_path):
+    pytest.importorskip("librosa")
+    df = _click_library(tmp_path, 12)
+    result = analyze_library(df, db_path=str(tmp_path / "audio.sqlite"), workers=1,
+                             budget_seconds=1e-9)
+    # Only the initially queued tasks (4 per worker) run
+    assert result["Energy"].notna().sum() == 4
+
+
+# ---------------------------------------------------------------------------
+# Sharded analysis
+# ---------------------------------------------------------------------------
+
+def test_shards_export_analyze_merge_round_trip(tmp_path, caplog):
+    pytest.importorskip("librosa")
+    import json
+    import shutil
+
+    from playlistgen.audio_analysis import (
+        analyze_shard,
+        export_analysis_shards,
+        merge_analysis_shards,
+    )
+
+    lib = tmp_path / "lib"
+    lib.mkdir()
+    df = _click_library(lib, 5)
+    cache = str(tmp_path / "audio.sqlite")
+
+    shard_files = export_analysis_shards(df, cache, str(tmp_path / "shards"), shards=2)
+    assert len(shard_files) == 2
+    counts = [len(json.loads(p.read_text())["tracks"]) for p in shard_files]
+    assert sorted(counts) == [2, 3]
+
+    # The worker box mounts the library somewhere else
+    mounted = tmp_path / "mnt"
+    shutil.copytree(lib, mounted)
+    results = []
+    for i, shard_file in enumerate(shard_files):
+        out_db = str(tmp_path / f"result-{i}.sqlite")
+        analyzed = analyze_shard(str(shard_file), out_db, workers=1,
+                                 path_map=(str(lib), str(mounted)))
+        assert analyzed == counts[i]
+        # Re-running a finished shard does nothing
+        assert analyze_shard(str(shard_file), out_db, workers=1,
+                             path_map=(str(lib), str(mounted))) == 0
+        results.append(out_db)
+
+    assert merge_analysis_shards(cache, results) == 5
+    assert merge_analysis_shards(cache, results) == 0  # already cached
+
+    with caplog.at_level("INFO"):
+        result = analyze_library(df, db_path=cache, workers=1)
+    assert "all 5 tracks loaded from cache" in caplog.text
+    assert result["Energy"].notna().all()
+
+
+def test_export_analysis_shards_nothing_to_do(tmp_path):
+    from playlistgen.audio_analysis import export_analysis_shards
+
+    df = pd.DataFrame({"Location": [None], "Name": ["A"], "Artist": ["X"]})
+    assert export_analysis_shards(df, str(tmp_path / "a.sqlite"), str(tmp_path / "s"), 3) == []
+
+
+def test_export_analysis_shards_does_not_write_the_cache(tmp_path):
+    import os
+
+    from playlistgen.audio_analysis import export_analysis_shards
+
+    old = tmp_path / "old.mp3"
+    old.write_bytes(os.urandom(40000))
+    kept = tmp_path / "kept.mp3"
+    kept.write_bytes(os.urandom(40000))
+    db_path = str(tmp_path / "audio.sqlite")
+    conn = _init_db(db_path)
+    _cache_set(conn, str(old), old.stat().st_mtime, _FEATURES, _file_fingerprint(str(old)))
+    _cache_set(conn, str(kept), kept.stat().st_mtime, _FEATURES)  # no fingerprint yet
+    conn.close()
+    new = tmp_path / "new.mp3"
+    old.rename(new)
+
+    def rows():
+        conn = sqlite3.connect(db_path)
+        try:
+            return sorted(conn.execute("SELECT path, mtime, fingerprint FROM audio_features"))
+        finally:
+            conn.close()
+
+    before = rows()
+    df = pd.DataFrame({"Location": [str(new), str(kept)], "Name": ["N", "K"], "Artist": ["X", "X"]})
+    assert export_analysis_shards(df, db_path, str(tmp_path / "s"), 2) == []
+    assert rows() == before
+
+
+def test_merge_analysis_shards_missing_file_raises(tmp_path):
+    from playlistgen.audio_analysis import merge_analysis_shards
+
+    missing = tmp_path / "result-1.sqlite"
+    with pytest.raises(FileNotFoundError):
+        merge_analysis_shards(str(tmp_path / "audio.sqlite"), [str(missing)])
+    assert not missing.exists()
+
+
+# ---------------------------------------------------------------------------
+# Extended descriptors
+# ---------------------------------------------------------------------------
+
+def _write_scale_track(path, seconds=40.0, sr=22050):
+    """C major scale, quiet for the first 15 seconds."""
+    sf = pytest.importorskip("soundfile")
+    np = pytest.importorskip("numpy")
+    t = np.arange(int(seconds * sr)) / sr
+    notes = [261.63, 293.66, 329.63, 349.23, 392.0, 440.0, 493.88, 523.25]
+    freq = np.array(notes)[(t * 2).astype(int) % len(notes)]
+    y = 0.3 * np.sin(2 * np.pi * freq * t) * np.where(t < 15, 0.1, 1.0)
+    sf.write(path, y.astype(np.float32), sr)
+
+
+def test_analyze_track_extended_descriptors(tmp_path):
+    pytest.importorskip("librosa")
+    from playlistgen.audio_analysis import DESCRIPTOR_NAMES
+
+    path = str(tmp_path / "scale.wav")
+    _write_scale_track(path)
+    result = analyze_track(path, extended=True)
+    d = dict(zip(DESCRIPTOR_NAMES, result["descriptors"]))
+    assert len(result["descriptors"]) == len(DESCRIPTOR_NAMES)
+    assert result["descriptors"].dtype.str == "<f4"
+    assert (d["key"], d["key_mode"]) == (0, 1)  # C major
+    assert d["onset_density"] == pytest.approx(2.0, abs=0.5)  # two notes a second
+    assert d["intro_energy"] < d["outro_energy"] / 3
+    assert "descriptors" not in analyze_track(path)
+
+    sampled = analyze_track(path, extended=True, mode="sampled", window_sec=4)
+    assert sampled["descriptors"][-2:] == pytest.approx(result["descriptors"][-2:], rel=0.05)
+
+
+def test_analyze_library_extended_round_trip(tmp_path):
+    pytest.importorskip("librosa")
+    from playlistgen.audio_analysis import DESCRIPTOR_NAMES, load_descriptors
+
+    df = _click_library(tmp_path, 2)
+    df.loc[2] = [None, "T2", "X"]
+    db_path = str(tmp_path / "audio.sqlite")
+    analyze_library(df, db_path=db_path, workers=1, extended=True)
+
+    desc = load_descriptors(df, db_path)
+    assert list(desc.columns) == list(DESCRIPTOR_NAMES)
+    assert desc.loc[[0, 1]].notna().all().all()
+    assert desc.loc[2].isna().all()
+
+    with _no_analysis():
+        analyze_library(df, db_path=db_path, workers=1, extended=True)
+
+
+def test_analyze_library_upgrades_cached_rows_keeping_scalars(tmp_path, caplog):
+    pytest.importorskip("librosa")
+    from playlistgen.audio_analysis import load_descriptors
+
+    df = _click_library(tmp_path, 2)
+    db_path = str(tmp_path / "audio.sqlite")
+    conn = _init_db(db_path)
+    for path in df["Location"]:
+        _cache_set(conn, path, os.path.getmtime(path), _FEATURES)
+    conn.close()
+
+    with _no_analysis():
+        analyze_library(df, db_path=db_path, workers=1)  # not extended: all cached
+    with caplog.at_level("INFO"):
+        result = analyze_library(df, db_path=db_path, workers=1, extended=True)
+    assert "2 cached tracks need extended descriptors" in caplog.text
+    assert (result["Energy"] == _FEATURES["energy"]).all()
+
+    conn = _init_db(db_path)
+    for path in df["Location"]:
+        assert _cache_get(conn, path, os.path.getmtime(path)) == _FEATURES
+    conn.close()
+    assert load_descriptors(df, db_path).notna().all().all()
+
+
+def test_merge_takes_descriptors_for_already_cached_rows(tmp_path):
+    from playlistgen.audio_analysis import (
+        DESCRIPTOR_NAMES,
+        load_descriptors,
+        merge_analysis_shards,
+    )
+    np = pytest.importorskip("numpy")
+
+    cache = str(tmp_path / "audio.sqlite")
+    shard_db = str(tmp_path / "shard.sqlite")
+    conn = _init_db(cache)
+    _cache_set(conn, "/m/a.wav", 1.0, _FEATURES)
+    conn.close()
+    vec = np.arange(len(DESCRIPTOR_NAMES), dtype=np.float32)
+    conn = _init_db(shard_db)
+    _cache_set(conn, "/m/a.wav", 1.0, {"energy": 0.5, "descriptors": vec})
+    conn.close()
+
+    assert merge_analysis_shards(cache, [shard_db]) == 1
+    assert merge_analysis_shards(cache, [shard_db]) == 0
+    conn = _init_db(cache)
+    assert _cache_get(conn, "/m/a.wav", 1.0) == _FEATURES
+    conn.close()
+    df = pd.DataFrame({"Location": ["/m/a.wav"]})
+    assert load_descriptors(df, cache).iloc[0].tolist() == vec.tolist()
+
+
+# ---------------------------------------------------------------------------
+# Importing precomputed features
+# ---------------------------------------------------------------------------
+
+def _import_library(tmp_path, n=3):
+    paths = []
+    for i in range(n):
+        path = tmp_path / f"song{i}.mp3"
+        path.write_bytes(os.urandom(1000))
+        paths.append(str(path))
+    return pd.DataFrame({
+        "Location": paths,
+        "Artist": ["Radiohead", "Beck", "Björk"][:n],
+        "Name": ["Creep", "Loser", "Hyperballad"][:n],
+    })
+
+
+def test_import_audio_features_by_path_and_artist_title(tmp_path):
+    from playlistgen.audio_analysis import import_audio_features
+
+    df = _import_library(tmp_path)
+    dump = tmp_path / "dump.csv"
+    pd.DataFrame({
+        "File": [df.at[0, "Location"], None, "/not/in/library.mp3"],
+        "Artist": ["ignored", "BECK", "X"],
+        "Title": ["ignored", "loser", "Y"],
+        "Tempo": [128.0, 500.0, 90.0],  # 500 BPM is junk
+        "Energy": [0.1, 0.2, 0.3],
+        "Brightness": [0.3, 0.4, 0.5],
+        "ZCR": [0.05, 0.06, 0.07],
+        "Genre": ["Rock", "Rock", "Pop"],
+    }).to_csv(dump, index=False)
+    db_path = str(tmp_path / "audio.sqlite")
+
+    assert import_audio_features(df, db_path, str(dump)) == 2
+    conn = _init_db(db_path)
+    first = _cache_get(conn, df.at[0, "Location"], os.path.getmtime(df.at[0, "Location"]))
+    second = _cache_get(conn, df.at[1, "Location"], os.path.getmtime(df.at[1, "Location"]))
+    conn.close()
+    assert first == {"bpm": 128.0, "energy": 0.1, "spectral_brightness": 0.3, "zcr": 0.05}
+    assert second["bpm"] is None and second["energy"] == 0.2
+
+    # Only the third track is left for analysis
+    with patch("playlistgen.audio_analysis.analyze_track", return_value={}) as mock_analyze, \
+            patch("playlistgen.audio_analysis.ProcessPoolExecutor", ThreadPoolExecutor):
+        result = analyze_library(df, db_path=db_path, workers=1)
+    assert [c.args[0] for c in mock_analyze.call_args_list] == [df.at[2, "Location"]]
+    assert result.loc[[0, 1], "Energy"].tolist() == [0.1, 0.2]
+
+
+def test_import_audio_features_keeps_local_results_and_skips_incomplete(tmp_path):
+    import json
+
+    from playlistgen.audio_analysis import import_audio_features
+
+    df = _import_library(tmp_path, 2)
+    db_path = str(tmp_path / "audio.sqlite")
+    conn = _init_db(db_path)
+    _cache_set(conn, df.at[0, "Location"], os.path.getmtime(df.at[0, "Location"]), _FEATURES)
+    conn.close()
+    dump = tmp_path / "dump.json"
+    dump.write_text(json.dumps({"tracks": [
+        {"path": df.at[0, "Location"], "energy": 0.9, "spectral_brightness": 0.9, "zcr": 0.9},
+        {"path": df.at[1, "Location"], "bpm": 120, "energy": 0.5},
+    ]}))
+
+    assert import_audio_features(df, db_path, str(dump)) == 0
+    assert import_audio_features(df, db_path, str(dump), partial=True) == 1
+    assert import_audio_features(df, db_path, str(dump), overwrite=True, partial=True) == 2
+    conn = _init_db(db_path)
+    assert _cache_get(conn, df.at[0, "Location"], os.path.getmtime(df.at[0, "Location"]))["energy"] == 0.9
+    conn.close()
+
+
+def test_import_audio_features_skips_rows_without_location(tmp_path, monkeypatch):
+    from playlistgen.audio_analysis import import_audio_features
+
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "nan").write_bytes(b"")  # what str(NaN) would resolve to
+    df = _import_library(tmp_path, 2)
+    df.at[1, "Location"] = float("nan")
+    dump = tmp_path / "dump.csv"
+    pd.DataFrame({
+        "Artist": ["Radiohead", "Beck"],
+        "Title": ["Creep", "Loser"],
+        "Energy": [0.1, 0.2],
+        "Brightness": [0.3, 0.4],
+        "ZCR": [0.05, 0.06],
+    }).to_csv(dump, index=False)
+    db_path = str(tmp_path / "audio.sqlite")
+
+    assert import_audio_features(df, db_path, str(dump)) == 1
+    conn = sqlite3.connect(db_path)
+    paths = [row[0] for row in conn.execute("SELECT path FROM audio_features")]
+    conn.close()
+    assert paths == [df.at[0, "Location"]]
+
+
+def test_import_audio_features_needs_a_join_key(tmp_path, caplog):
+    from playlistgen.audio_analysis import import_audio_features
+
+    df = _import_library(tmp_path, 1)
+    dump = tmp_path / "dump.jsonl"
+    dump.write_text('{"energy": 0.1, "brightness": 0.2, "zcr": 0.3}\n')
+    assert import_audio_features(df, str(tmp_path / "a.sqlite"), str(dump)) == 0
+    assert "neither a path column nor artist" in caplog.text
+
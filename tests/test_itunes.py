@@ -4,6 +4,7 @@ import json
 import tempfile
 from pathlib import Path
 
+import numpy as np
 import pandas as pd
 import pytest
 from playlistgen.itunes import (
@@ -141,3 +142,177 @@ def test_save_and_reload(tmp_path):
     df2 = load_itunes_json(str(out))
     assert len(df2) == 1
     assert df2.iloc[0]["Name"] == "Song"
+
+
+# ---------------------------------------------------------------------------
+# convert_itunes_xml — streaming parser matches the whole-plist converter
+# ---------------------------------------------------------------------------
+
+def _sample_library():
+    import datetime
+    return {
+        "Major Version": 1,
+        "Application Version": "12.9",
+        "Date": datetime.datetime(2024, 1, 2, 3, 4, 5),
+        "Tracks": {
+            "101": {
+                "Track ID": 101, "Name": "Café Song", "Artist": "Ångström",
+                "Genre": "Indie", "Play Count": 7, "Total Time": 210000,
+                "Year": 2005, "Compilation": True, "Rating": 80,
+                "Date Added": datetime.datetime(2020, 5, 6, 7, 8, 9),
+                "Persistent ID": "ABCDEF0123456789",
+                "Location": "file://localhost/Users/me/Music/my%20song.mp3",
+            },
+            "102": {
+                "Track ID": 102, "Name": "Second", "Artist": "B",
+                "Album Rating Computed": False, "Volume Adjustment": -12,
+            },
+            "103": {"Track ID": 103, "Name": "Odd", "Artist": "C", "Tags": ["a", "b"],
+                    "Extra": {"Nested": 1.5}},
+        },
+        "Playlists": [{"Name": "Library", "Playlist Items": [{"Track ID": 101}]}],
+    }
+
+
+def _legacy_convert(xml_path, out_path):
+    import plistlib
+    from playlistgen.itunes import _convert_datetimes
+    with open(xml_path, "rb") as f:
+        plist = plistlib.load(f)
+    tracks = _convert_datetimes(list(plist.get("Tracks", {}).values()))
+    for t in tracks:
+        if "Location" in t:
+            t["Location"] = _decode_location(t["Location"])
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"tracks": tracks}, f, ensure_ascii=False, indent=2)
+
+
+@pytest.mark.parametrize("library", [
+    _sample_library(),
+    {"Major Version": 1, "Tracks": {}, "Playlists": []},
+])
+def test_convert_itunes_xml_matches_whole_plist_output(tmp_path, library):
+    import plistlib
+    xml_path = tmp_path / "Library.xml"
+    xml_path.write_bytes(plistlib.dumps(library, fmt=plistlib.FMT_XML))
+
+    convert_itunes_xml(str(xml_path), str(tmp_path / "stream.json"))
+    _legacy_convert(xml_path, tmp_path / "legacy.json")
+
+    assert (tmp_path / "stream.json").read_bytes() == (tmp_path / "legacy.json").read_bytes()
+
+
+def test_iter_itunes_tracks_yields_incrementally(tmp_path, monkeypatch):
+    import plistlib
+    import playlistgen.itunes as itunes_mod
+    lib = {"Tracks": {str(i): {"Track ID": i, "Name": f"T{i}", "Artist": "A"}
+                      for i in range(200)}}
+    xml_path = tmp_path / "Library.xml"
+    xml_path.write_bytes(plistlib.dumps(lib, fmt=plistlib.FMT_XML))
+    monkeypatch.setattr(itunes_mod, "_PLIST_CHUNK_BYTES", 256)
+
+    it = itunes_mod.iter_itunes_tracks(str(xml_path))
+    first = next(it)
+    assert first == {"Track ID": 0, "Name": "T0", "Artist": "A"}
+    assert len(list(it)) == 199
+
+
+def test_iter_itunes_tracks_binary_plist_fallback(tmp_path):
+    import plistlib
+    from playlistgen.itunes import iter_itunes_tracks
+    lib = {"Tracks": {"1": {"Track ID": 1, "Name": "S", "Artist": "A",
+                            "Location": "file://localhost/x%20y.mp3"}}}
+    path = tmp_path / "Library.plist"
+    path.write_bytes(plistlib.dumps(lib, fmt=plistlib.FMT_BINARY))
+    assert list(iter_itunes_tracks(str(path))) == [
+        {"Track ID": 1, "Name": "S", "Artist": "A", "Location": "/x y.mp3"}
+    ]
+
+
+# ---------------------------------------------------------------------------
+# Columnar library snapshot
+# ---------------------------------------------------------------------------
+
+def test_snapshot_round_trip_matches_json_load(tmp_path):
+    from playlistgen.itunes import save_library_snapshot, load_library_snapshot
+    tracks = [
+        {"Name": "Song A", "Artist": "Artist 1", "Genre": "rock",
+         "Location": "file://localhost/m/a%20b.mp3", "Play Count": 5,
+         "Skip Count": 1, "Year": 2005, "BPM": 120, "Total Time": 210000,
+         "Album": "Über"},
+        {"Name": "Song B", "Artist": "Artist 2", "Genre": None,
+         "Play Count": None, "Year": 1800},
+        {"Name": "Song C", "Artist": "Artist 1", "Genre": "Rock", "BPM": 500},
+    ]
+    path = _write_json(tmp_path, tracks)
+    expected = load_itunes_json(path, use_snapshot=False)
+    save_library_snapshot(expected, path)
+
+    loaded = load_library_snapshot(path)
+    assert loaded is not None
+    pd.testing.assert_frame_equal(loaded, expected)
+    pd.testing.assert_frame_equal(load_itunes_json(path), expected)
+
+
+def test_snapshot_round_trips_empty_strings_numbers_and_nan(tmp_path):
+    from playlistgen.itunes import save_library_snapshot, load_library_snapshot
+    tracks = [
+        {"Name": 1984, "Artist": "A", "Album": "", "Location": "/a.mp3"},
+        {"Name": "Song\0B", "Artist": "B", "Album": "", "Location": None},
+        {"Name": "Song C", "Artist": "", "Album": ""},
+    ]
+    path = _write_json(tmp_path, tracks)
+    expected = load_itunes_json(path, use_snapshot=False)
+    expected["Comment"] = pd.Series(["x", np.nan, None], dtype=object)
+    save_library_snapshot(expected, path)
+
+    loaded = load_library_snapshot(path)
+    pd.testing.assert_frame_equal(loaded, expected)
+    assert loaded["Album"].tolist() == ["", "", ""]
+    assert loaded["Name"].tolist()[0] == 1984
+    assert loaded["Comment"][1] is not None and loaded["Comment"][2] is None
+
+
+def test_snapshot_ignored_when_json_changes(tmp_path):
+    from playlistgen.itunes import save_library_snapshot, load_library_snapshot
+    path = _write_json(tmp_path, [{"Name": "Old", "Artist": "A"}])
+    save_library_snapshot(load_itunes_json(path, use_snapshot=False), path)
+
+    _write_json(tmp_path, [{"Name": "New", "Artist": "A"}, {"Name": "X", "Artist": "B"}])
+    assert load_library_snapshot(path) is None
+    df = load_itunes_json(path)
+    assert list(df["Name"]) == ["New", "X"]
+
+
+def test_refresh_library_snapshot_writes_once(tmp_path):
+    from playlistgen.itunes import refresh_library_snapshot, library_snapshot_path
+    path = _write_json(tmp_path, [{"Name": "S", "Artist": "A", "Year": 2001}])
+    assert refresh_library_snapshot(path) is True
+    assert library_snapshot_path(path).exists()
+    assert refresh_library_snapshot(path) is False
+
+
+def test_refresh_library_snapshot_bad_json_does_not_raise(tmp_path):
+    from playlistgen.itunes import refresh_library_snapshot
+    p = tmp_path / "lib.json"
+    p.write_text("{}")
+    assert refresh_library_snapshot(str(p)) is False
+
+
+def test_build_library_from_dir_nested_and_parallel(tmp_path):
+    (tmp_path / "a" / "b").mkdir(parents=True)
+    for i, sub in enumerate(["", "a", "a/b"]):
+        (tmp_path / sub / f"Artist{i} - Song{i}.FLAC").write_bytes(b"")
+    (tmp_path / "a" / "cover.jpg").write_bytes(b"")
+    df = build_library_from_dir(str(tmp_path), workers=4)
+    assert sorted(df["Artist"]) == ["Artist0", "Artist1", "Artist2"]
+    assert (df["Play Count"] == 0).all()
+
+
+def test_build_library_from_dir_skips_symlinked_dirs(tmp_path):
+    music = tmp_path / "music"
+    music.mkdir()
+    (music / "A - B.mp3").write_bytes(b"")
+    (music / "loop").symlink_to(music, target_is_directory=True)
+    df = build_library_from_dir(str(music))
+    assert len(df) == 1
@@ -1,18 +1,27 @@
 """Tests for lastfm_client.py — SQLite cache, rate limiting, migration."""
 
 import json
+import threading
 import time
 import sqlite3
 import tempfile
 from pathlib import Path
+from unittest.mock import MagicMock
 
 import pytest
+import playlistgen.lastfm_client as lc
 from playlistgen.lastfm_client import (
+    TagDB,
+    TagStore,
+    TokenBucket,
+    fetch_track_tags,
+    generate_tag_cache,
     init_cache_db,
     _get_cached,
     _set_cached,
     load_tag_db_from_sqlite,
     migrate_json_to_sqlite,
+    select_track_lookups,
 )
 
 
@@ -127,3 +136,342 @@ def test_migrate_missing_file(tmp_path):
     count = migrate_json_to_sqlite(str(tmp_path / "nonexistent.json"), conn)
     assert count == 0
     conn.close()
+
+
+# ---------------------------------------------------------------------------
+# Rate limiter + concurrent fetching
+# ---------------------------------------------------------------------------
+
+
+def _response(track):
+    resp = MagicMock(status_code=200)
+    resp.json.return_value = {"toptags": {"tag": [{"name": f"tag-{track}"}]}}
+    return resp
+
+
+def _response_empty():
+    resp = MagicMock(status_code=200)
+    resp.json.return_value = {"toptags": {"tag": []}}
+    return resp
+
+
+@pytest.fixture
+def fake_lastfm(monkeypatch):
+    """Patch requests with a thread-safe fake; returns its call log."""
+    calls = []
+    lock = threading.Lock()
+    state = {"delay": 0.0, "fail_once": set()}
+
+    def get(url, params, timeout):
+        time.sleep(state["delay"])
+        name = params.get("track", params["artist"])
+        with lock:
+            calls.append((time.monotonic(), name))
+            if name in state["fail_once"]:
+                state["fail_once"].discard(name)
+                return MagicMock(status_code=503)
+        if name in state.get("untagged", ()):
+            return _response_empty()
+        return _response(name)
+
+    fake = MagicMock()
+    fake.Session.return_value.get.side_effect = get
+    monkeypatch.setattr(lc, "_requests", fake)
+    monkeypatch.setattr(lc, "_REQUESTS_AVAILABLE", True)
+    monkeypatch.setattr(lc, "_sessions", threading.local())
+    monkeypatch.setattr(lc, "_RETRY_DELAY_SEC", 0.0)
+    return calls, state, fake
+
+
+def test_token_bucket_holds_aggregate_rate_across_threads():
+    bucket = TokenBucket(rate=100.0)  # one token per 10 ms
+    stamps = []
+    lock = threading.Lock()
+
+    def worker():
+        for _ in range(5):
+            bucket.acquire()
+            with lock:
+                stamps.append(time.monotonic())
+
+    threads = [threading.Thread(target=worker) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    stamps.sort()
+    # 20 tokens, the first free: at least 19 intervals of 10 ms
+    assert stamps[-1] - stamps[0] >= 0.19 * 0.95
+
+
+def test_token_bucket_unlimited_never_waits():
+    bucket = TokenBucket(rate=0)
+    assert all(bucket.acquire() == 0.0 for _ in range(100))
+
+
+def test_generate_tag_cache_fetches_concurrently(tmp_path, fake_lastfm):
+    calls, state, _ = fake_lastfm
+    state["delay"] = 0.05
+    tracks = [("Artist", f"Track {i}") for i in range(20)]
+
+    started = time.monotonic()
+    db = generate_tag_cache(
+        tracks, "key", str(tmp_path / "tags.sqlite"), rate_limit_ms=0, workers=10
+    )
+    elapsed = time.monotonic() - started
+
+    assert len(calls) == 20
+    assert isinstance(db, TagStore)  # lazy: the cache is not loaded into memory
+    assert db["artist - track 3"] == ["tag-Track 3"]
+    assert len(db) == 20
+    db.close()
+    assert elapsed < 20 * 0.05 / 2  # serial would take 1 s
+
+
+def test_generate_tag_cache_respects_rate_limit_with_workers(tmp_path, fake_lastfm):
+    calls, _, _ = fake_lastfm
+    tracks = [("Artist", f"Track {i}") for i in range(10)]
+    generate_tag_cache(
+        tracks, "key", str(tmp_path / "tags.sqlite"), rate_limit_ms=20, workers=5
+    )
+    stamps = sorted(t for t, _ in calls)
+    assert stamps[-1] - stamps[0] >= 9 * 0.020 * 0.95
+
+
+def test_generate_tag_cache_retries_and_skips_cached(tmp_path, fake_lastfm):
+    calls, state, fake = fake_lastfm
+    db_path = str(tmp_path / "tags.sqlite")
+    conn = init_cache_db(db_path)
+    _set_cached(conn, "artist - track 0", ["cached"])
+    conn.close()
+    state["fail_once"] = {"Track 1"}
+
+    db = generate_tag_cache(
+        [("Artist", "Track 0"), ("Artist", "Track 1")], "key", db_path,
+        rate_limit_ms=0, workers=2,
+    )
+
+    assert [name for _, name in calls] == ["Track 1", "Track 1"]
+    assert db == {"artist - track 0": ["cached"], "artist - track 1": ["tag-Track 1"]}
+    # One keep-alive session per worker thread, not one per request
+    assert fake.Session.call_count == 1
+
+
+def test_fetch_track_tags_uses_cache_then_api(tmp_db, fake_lastfm):
+    _, conn = tmp_db
+    calls, _, _ = fake_lastfm
+    assert fetch_track_tags("A", "Song", "key", conn, rate_limit_ms=0) == ["tag-Song"]
+    assert fetch_track_tags("a", "song ", "key", conn, rate_limit_ms=0) == ["tag-Song"]
+    assert len(calls) == 1
+
+
+# ---------------------------------------------------------------------------
+# Background cache writer
+# ---------------------------------------------------------------------------
+
+
+def test_cache_writer_batches_commits(tmp_db):
+    db_path, conn = tmp_db
+    statements = []
+    conn.set_trace_callback(statements.append)
+    with lc._CacheWriter(conn, batch_size=4, flush_seconds=60) as writer:
+        for i in range(10):
+            writer.put(f"a - t{i}", [f"tag{i}"])
+    conn.set_trace_callback(None)
+
+    assert writer.written == 10
+    assert sum(s.strip().upper() == "COMMIT" for s in statements) == 3  # 4 + 4 + 2
+    assert load_tag_db_from_sqlite(db_path)["a - t9"] == ["tag9"]
+
+
+def test_cache_writer_flushes_on_timer(tmp_db):
+    db_path, conn = tmp_db
+    with lc._CacheWriter(conn, batch_size=1000, flush_seconds=0.05) as writer:
+        writer.put("a - t", ["rock"])
+        deadline = time.monotonic() + 5
+        while "a - t" not in load_tag_db_from_sqlite(db_path):
+            assert time.monotonic() < deadline
+            time.sleep(0.01)
+
+
+def test_cache_writer_survives_a_malformed_batch(tmp_db, caplog):
+    db_path, conn = tmp_db
+    with lc._CacheWriter(conn, batch_size=1, flush_seconds=60) as writer:
+        writer.put("a - bad", [object()])  # not JSON-serialisable
+        writer.put("a - good", ["rock"])
+    assert writer.written == 1
+    assert load_tag_db_from_sqlite(db_path) == {"a - good": ["rock"]}
+    assert "cache write failed for 1 tracks" in caplog.text
+
+
+def test_interrupted_fetch_keeps_completed_results(tmp_path, fake_lastfm, monkeypatch):
+    def interrupt_after_five(iterable, desc="", total=None):
+        for i, item in enumerate(iterable):
+            if i == 5:
+                raise KeyboardInterrupt
+            yield item
+
+    monkeypatch.setattr(lc, "progress_bar", interrupt_after_five)
+    db_path = str(tmp_path / "tags.sqlite")
+    tracks = [("Artist", f"Track {i}") for i in range(50)]
+    with pytest.raises(KeyboardInterrupt):
+        generate_tag_cache(tracks, "key", db_path, rate_limit_ms=0, workers=2)
+
+    assert len(load_tag_db_from_sqlite(db_path)) == 5
+
+
+# ---------------------------------------------------------------------------
+# Artist tag tier
+# ---------------------------------------------------------------------------
+
+
+def test_tag_db_falls_back_to_artist_tags():
+    db = TagDB(
+        {"a - hit": ["pop"], "a - cut": []},
+        {"a": ["indie"], "x - y": ["shoegaze"]},
+    )
+    assert db.get("a - hit") == ["pop"]
+    assert db.get("a - cut") == ["indie"]  # looked up, empty
+    assert db.get("a - never fetched", []) == ["indie"]
+    assert db.get("x - y - song") == ["shoegaze"]  # artist containing " - "
+    assert db.get("b - song", []) == []
+    # Iteration (and IDF counting) sees track-level rows only
+    assert len(db) == 2 and set(db) == {"a - hit", "a - cut"}
+
+
+def test_select_track_lookups_keeps_played_tracks():
+    plays = {("A", "Hit "): 12, ("A", "Cut"): 0, ("B", "Song"): 1}
+    assert select_track_lookups(plays) == {"a - hit", "b - song"}
+    assert select_track_lookups(plays, min_plays=5) == {"a - hit"}
+
+
+def test_tiered_fetch_calls_artists_once(tmp_path, fake_lastfm):
+    calls, state, _ = fake_lastfm
+    state["untagged"] = {"Obscure"}
+    tracks = [("Artist A", f"Cut {i}") for i in range(5)]
+    tracks += [("Artist A", "Hit"), ("Artist B", "Obscure"), ("Artist C", "Single")]
+    lookups = select_track_lookups({("Artist A", "Hit"): 3, ("Artist B", "Obscure"): 1,
+                                    ("Artist C", "Single"): 2})
+    db_path = str(tmp_path / "tags.sqlite")
+
+    db = generate_tag_cache(tracks, "key", db_path, rate_limit_ms=0, workers=4,
+                            track_lookups=lookups)
+
+    # 3 track calls; artist calls only where a track has no track tags
+    assert sorted(name for _, name in calls) == [
+        "Artist A", "Artist B", "Hit", "Obscure", "Single",
+    ]
+    assert db.get("artist a - cut 3") == ["tag-Artist A"]
+    assert db.get("artist a - hit") == ["tag-Hit"]
+    assert db.get("artist b - obscure") == ["tag-Artist B"]
+    assert "artist a - cut 3" not in db  # never looked up at track level
+
+    calls.clear()
+    generate_tag_cache(tracks, "key", db_path, rate_limit_ms=0, workers=4,
+                       track_lookups=lookups)
+    assert calls == []
+
+
+def test_load_tag_db_without_artist_table(tmp_path):
+    db_path = str(tmp_path / "old.sqlite")
+    conn = sqlite3.connect(db_path)
+    conn.execute("CREATE TABLE tag_cache (key TEXT PRIMARY KEY, tags_json TEXT, fetched_at INT)")
+    conn.execute("INSERT INTO tag_cache VALUES ('a - b', '[\"rock\"]', 0)")
+    conn.commit()
+    conn.close()
+    db = load_tag_db_from_sqlite(db_path)
+    assert db == {"a - b": ["rock"]}
+    assert db.artist_tags == {}
+
+
+# ---------------------------------------------------------------------------
+# Lazy TagStore
+# ---------------------------------------------------------------------------
+
+
+@pytest.fixture
+def tag_cache(tmp_path):
+    db_path = str(tmp_path / "tags.sqlite")
+    conn = init_cache_db(db_path)
+    lc._set_cached_batch(conn, [
+        ("a - hit", ["Pop", "ÉLECTRO", "pop"]),
+        ("a - cut", []),
+        ("b - song", ["électro", "rock"]),
+        ("x - y - song", []),
+    ])
+    conn.execute("INSERT INTO tag_cache VALUES ('bad - json', 'not json', 0)")
+    lc._set_cached_batch(conn, [("a", ["indie"]), ("x - y", ["shoegaze"])], lc._ARTIST_TABLE)
+    conn.commit()
+    conn.close()
+    return db_path
+
+
+def test_tag_store_matches_full_load(tag_cache):
+    from playlistgen.mood_map import build_tag_counts
+
+    full = load_tag_db_from_sqlite(tag_cache)
+    store = TagStore(tag_cache)
+    probes = list(full) + ["a - never fetched", "nobody - song", "x - y - other"]
+    assert [store.get(k, []) for k in probes] == [full.get(k, []) for k in probes]
+    assert store.get("nobody - song") is None
+    assert len(store) == len(full) and set(store) == set(full)
+    assert store["a - cut"] == [] and "a - cut" in store and "a - never" not in store
+    with pytest.raises(KeyError):
+        store["a - never"]
+    # IDF counts aggregated in SQLite, Unicode-lowered in Python
+    assert build_tag_counts(store) == build_tag_counts(dict(full))
+    assert build_tag_counts(store)["électro"] == 2
+
+
+def test_tag_store_load_pins_only_requested_keys(tag_cache):
+    store = TagStore(tag_cache)
+    assert store.load(["a - hit", "a - cut", "zzz - none"]) == 2
+    assert set(store._pinned) == {"a - hit", "a - cut", "zzz - none"}
+
+    statements = []
+    store._connection().set_trace_callback(statements.append)
+    assert store.get("a - cut") == ["indie"]
+    assert store.get("zzz - none", []) == []
+    assert statements == []  # served from memory
+
+
+def test_tag_store_lru_is_bounded(tag_cache):
+    store = TagStore(tag_cache, cache_size=2)
+    for key in ("a - hit", "b - song", "a - cut"):
+        store.get(key)
+    assert list(store._lru) == ["b - song", "a - cut"]
+
+
+def test_score_tracks_with_tag_store_matches_dict(tag_cache):
+    import pandas as pd
+    from playlistgen.scoring import score_tracks
+
+    df = pd.DataFrame({
+        "Name": ["Hit", "Cut", "Song"],
+        "Artist": ["A", "A", "B"],
+        "Genre": ["", "", ""],
+        "Year": [2000, 2000, 2000],
+        "Play Count": [1, 0, 0],
+        "Skip Count": [0, 0, 0],
+    })
+    store = TagStore(tag_cache)
+    lazy = score_tracks(df, config={}, tag_mood_db=store)
+    eager = score_tracks(df, config={}, tag_mood_db=load_tag_db_from_sqlite(tag_cache))
+    assert lazy["Mood"].tolist() == eager["Mood"].tolist()
+    assert set(store._pinned) == {"a - hit", "a - cut", "b - song"}
+
+
+def test_tag_counts_persist_until_cache_changes(tag_cache):
+    store = TagStore(tag_cache)
+    first = store.tag_counts()
+    store.close()
+
+    again = TagStore(tag_cache)
+    again._count_tags = MagicMock(side_effect=AssertionError("recounted"))
+    assert again.tag_counts() == first  # read from the tag_counts table
+
+    conn = init_cache_db(tag_cache)
+    _set_cached(conn, "c - new", ["Rock"])
+    conn.close()
+    fresh = TagStore(tag_cache).tag_counts()
+    assert fresh["rock"] == first["rock"] + 1
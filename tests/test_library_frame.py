@@ -0,0 +1,117 @@
+"""Tests for playlistgen.library_frame — compact dtypes and stage copies."""
+
+import numpy as np
+import pandas as pd
+
+from playlistgen.clustering import cluster_tracks
+from playlistgen import library_frame
+from playlistgen.library_frame import (
+    ENRICHED_COLS,
+    compact_library,
+    copy_on_write,
+    working_copy,
+)
+from playlistgen.playlist_builder import fill_short_pool
+from playlistgen.scoring import score_tracks
+
+
+def _library(n=40):
+    return pd.DataFrame({
+        "Name": [f"Track {i}" for i in range(n)],
+        "Artist": [f"Artist {i % 5}" for i in range(n)],
+        "Genre": [["Rock", "Jazz", None, "Pop"][i % 4] for i in range(n)],
+        "Album": [f"Album {i % 7}" for i in range(n)],
+        "Location": [f"/music/{i}.mp3" for i in range(n)],
+        "Play Count": list(range(n)),
+        "Skip Count": [i % 3 for i in range(n)],
+        "Year": [1990.0 + i % 20 if i % 6 else np.nan for i in range(n)],
+        "BPM": [100.0 + i for i in range(n)],
+    })
+
+
+class TestCompactLibrary:
+    def test_dtypes(self):
+        df = compact_library(_library())
+        for col in ("Artist", "Genre", "Album"):
+            assert isinstance(df[col].dtype, pd.CategoricalDtype)
+        assert df["Year"].dtype == np.float32
+        assert df["BPM"].dtype == np.float32
+        assert df["Play Count"].dtype == np.int8
+        assert df["Name"].dtype != "category"
+        assert df["Year"].isna().sum() == _library()["Year"].isna().sum()
+
+    def test_idempotent(self):
+        df = compact_library(_library())
+        dtypes = df.dtypes.copy()
+        compact_library(df)
+        assert df.dtypes.equals(dtypes)
+
+    def test_keep_object_leaves_enriched_columns_writable(self):
+        lib = _library()
+        lib["Mood"] = ["Chill", None] * 20
+        df = compact_library(lib, keep_object=ENRICHED_COLS)
+        assert isinstance(df["Artist"].dtype, pd.CategoricalDtype)
+        assert not isinstance(df["Mood"].dtype, pd.CategoricalDtype)
+        df.at[1, "Mood"] = "Euphoric"  # as the batch enrichers write it
+        assert df.at[1, "Mood"] == "Euphoric"
+        compact_library(df)
+        assert isinstance(df["Mood"].dtype, pd.CategoricalDtype)
+
+    def test_scores_match_default_frame(self):
+        profile = {
+            "artist_scores": {"Artist 1": 3.0},
+            "genre_scores": {"rock": 1.5},
+            "year_scores": {"1995": 2.0},
+            "track_play_counts": {"artist 2 - track 2": 4},
+        }
+        plain = score_tracks(_library(), config=profile, tag_mood_db={})
+        compact = score_tracks(compact_library(_library()), config=profile, tag_mood_db={})
+        pd.testing.assert_series_equal(plain["Score"], compact["Score"])
+        assert (plain["Mood"] == compact["Mood"]).all()
+
+    def test_downstream_stages_accept_categoricals(self):
+        scored = score_tracks(compact_library(_library()), config={}, tag_mood_db={})
+        compact_library(scored)
+        assert cluster_tracks(scored, n_clusters=3, strategy="tfidf")
+        assert cluster_tracks(scored, n_clusters=3, strategy="mood") is not None
+        filled = fill_short_pool(scored.head(3), scored, target_len=10, max_per_artist=2)
+        assert len(filled) > 3
+
+
+class TestWorkingCopy:
+    def test_writes_do_not_reach_original(self):
+        df = _library(5)
+        copy = working_copy(df)
+        copy.loc[0, "BPM"] = 999.0
+        copy["New"] = 1
+        assert df.loc[0, "BPM"] == 100.0
+        assert "New" not in df.columns
+
+
+class TestCopyOnWrite:
+    def _fake_options(self, monkeypatch):
+        options = {"mode.copy_on_write": False}
+        monkeypatch.setattr(library_frame, "copy_on_write_active", lambda: False)
+        monkeypatch.setattr(pd, "get_option", options.__getitem__)
+        monkeypatch.setattr(pd, "set_option", options.__setitem__)
+        return options
+
+    def test_option_is_restored_after_the_block(self, monkeypatch):
+        options = self._fake_options(monkeypatch)
+        with copy_on_write():
+            assert options["mode.copy_on_write"] is True
+        assert options["mode.copy_on_write"] is False
+
+    def test_option_is_restored_on_error(self, monkeypatch):
+        options = self._fake_options(monkeypatch)
+        try:
+            with copy_on_write():
+                raise RuntimeError("stage failed")
+        except RuntimeError:
+            pass
+        assert options["mode.copy_on_write"] is False
+
+    def test_disabled_leaves_option_alone(self, monkeypatch):
+        options = self._fake_options(monkeypatch)
+        with copy_on_write(enabled=False):
+            assert options["mode.copy_on_write"] is False
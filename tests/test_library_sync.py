@@ -0,0 +1,113 @@
+"""Tests for library_sync.py — track fingerprints and XML-to-XML change sets."""
+
+import plistlib
+
+from playlistgen.itunes import convert_itunes_xml
+from playlistgen.library_sync import (
+    consume_library_changes,
+    load_library_changes,
+    sync_state_path,
+    track_fingerprint,
+    track_sync_key,
+)
+
+
+def _track(tid, pid, **extra):
+    t = {"Track ID": tid, "Persistent ID": pid, "Name": f"Song {tid}",
+         "Artist": "A", "Play Count": 1,
+         "Location": f"file://localhost/music/{tid}.mp3"}
+    t.update(extra)
+    return t
+
+
+def _write_xml(path, tracks):
+    lib = {"Tracks": {str(t["Track ID"]): t for t in tracks}}
+    path.write_bytes(plistlib.dumps(lib, fmt=plistlib.FMT_XML))
+
+
+def test_track_sync_key_prefers_persistent_id():
+    assert track_sync_key({"Track ID": 5, "Persistent ID": "ABC"}) == "ABC"
+    assert track_sync_key({"Track ID": 5}) == "id:5"
+    assert track_sync_key({"Name": "x"}) is None
+
+
+def test_fingerprint_separates_play_fields():
+    base = _track(1, "P1")
+    played = dict(base, **{"Play Count": 2, "Play Date UTC": "2024-01-01T00:00:00"})
+    retagged = dict(base, Genre="Jazz")
+    meta, play = track_fingerprint(base).split(":")
+    assert track_fingerprint(played).split(":")[0] == meta
+    assert track_fingerprint(played).split(":")[1] != play
+    assert track_fingerprint(retagged).split(":")[0] != meta
+
+
+def test_first_conversion_has_unknown_changes(tmp_path):
+    xml, out = tmp_path / "lib.xml", tmp_path / "lib.json"
+    _write_xml(xml, [_track(1, "P1")])
+    convert_itunes_xml(str(xml), str(out))
+    assert sync_state_path(out).exists()
+    assert load_library_changes(out) is None
+
+
+def test_reconversion_classifies_changes(tmp_path):
+    xml, out = tmp_path / "lib.xml", tmp_path / "lib.json"
+    _write_xml(xml, [_track(1, "P1"), _track(2, "P2"), _track(3, "P3"), _track(4, "P4")])
+    convert_itunes_xml(str(xml), str(out))
+    consume_library_changes(out, load_library_changes(out))
+
+    _write_xml(xml, [
+        _track(1, "P1"),                           # unchanged
+        _track(2, "P2", **{"Play Count": 9}),     # play-count only
+        _track(3, "P3", Genre="Rock"),             # metadata
+        _track(5, "P5"),                           # added (P4 removed)
+    ])
+    convert_itunes_xml(str(xml), str(out))
+
+    changes = load_library_changes(out)
+    assert changes["added"] == ["P5"]
+    assert changes["removed"] == ["P4"]
+    assert changes["metadata"] == ["P3"]
+    assert changes["play_count"] == ["P2"]
+    assert sorted(changes["changed_locations"]) == ["/music/3.mp3", "/music/5.mp3"]
+
+
+def test_unchanged_reconversion_is_empty(tmp_path):
+    xml, out = tmp_path / "lib.xml", tmp_path / "lib.json"
+    _write_xml(xml, [_track(1, "P1")])
+    convert_itunes_xml(str(xml), str(out))
+    consume_library_changes(out, None)
+    convert_itunes_xml(str(xml), str(out))
+    changes = load_library_changes(out)
+    assert changes is not None
+    assert not any(changes.values())
+
+
+def test_changes_accumulate_until_consumed(tmp_path):
+    xml, out = tmp_path / "lib.xml", tmp_path / "lib.json"
+    _write_xml(xml, [_track(1, "P1"), _track(2, "P2"), _track(3, "P3")])
+    convert_itunes_xml(str(xml), str(out))
+    # Unknown stays unknown until someone has treated every track as changed
+    _write_xml(xml, [_track(1, "P1", Genre="Rock"), _track(2, "P2"), _track(3, "P3")])
+    convert_itunes_xml(str(xml), str(out))
+    assert load_library_changes(out) is None
+    consume_library_changes(out, None)
+
+    _write_xml(xml, [_track(1, "P1"), _track(2, "P2", Genre="Jazz"), _track(4, "P4")])
+    convert_itunes_xml(str(xml), str(out))
+    seen = load_library_changes(out)
+    _write_xml(xml, [_track(1, "P1"), _track(2, "P2", Genre="Pop"), _track(5, "P5")])
+    convert_itunes_xml(str(xml), str(out))
+
+    changes = load_library_changes(out)
+    assert changes["added"] == ["P5"]  # P4 came and went
+    assert changes["metadata"] == ["P1", "P2"]
+    assert changes["removed"] == ["P3", "P4"]
+    assert sorted(changes["changed_locations"]) == [
+        "/music/1.mp3", "/music/2.mp3", "/music/4.mp3", "/music/5.mp3",
+    ]
+
+    # A set that changed after it was loaded is not cleared
+    consume_library_changes(out, seen)
+    assert load_library_changes(out) == changes
+    consume_library_changes(out, changes)
+    assert not any(load_library_changes(out).values())
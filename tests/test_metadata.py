@@ -1,11 +1,20 @@
 """Tests for playlistgen.metadata — audio tag extraction and DataFrame enrichment."""
 
+import io
+import struct
 from unittest.mock import MagicMock, patch
 
 import pandas as pd
 import pytest
 
-from playlistgen.metadata import _strip_file_url, read_audio_tags, enrich_dataframe
+from playlistgen import metadata
+from playlistgen.metadata import (
+    _read_mp3_light,
+    _strip_file_url,
+    read_audio_tags,
+    read_audio_tags_many,
+    enrich_dataframe,
+)
 
 
 # ---------------------------------------------------------------------------
@@ -186,6 +195,124 @@ class TestReadAudioTags:
         assert result["bpm"] == 128
 
 
+# ---------------------------------------------------------------------------
+# header-only readers
+# ---------------------------------------------------------------------------
+
+_MPEG_FRAME = b"\xff\xfb\x90\x64" + b"\x00" * 413  # 128 kbps / 44.1 kHz, silent
+_ARTWORK = b"\x89PNG" + b"\x00" * 2_000_000
+
+
+def _make_mp3(path, v2_version):
+    from mutagen.id3 import APIC, ID3, TALB, TBPM, TCON, TDRC, TIT2
+
+    path.write_bytes(_MPEG_FRAME * 100)
+    tags = ID3()
+    tags.add(APIC(encoding=3, mime="image/png", type=3, desc="cover", data=_ARTWORK))
+    tags.add(TIT2(encoding=3, text="Title"))
+    tags.add(TDRC(encoding=3, text="2004-05-06"))
+    tags.add(TBPM(encoding=3, text="128"))
+    tags.add(TCON(encoding=1, text="(17)"))
+    tags.add(TALB(encoding=1, text="Üben"))
+    tags.save(str(path), v2_version=v2_version)
+
+
+def _make_flac(path):
+    from mutagen.flac import FLAC, Picture
+
+    streaminfo = bytearray(34)
+    streaminfo[10:18] = ((44100 << 44) | (1 << 41) | (15 << 36) | 441000).to_bytes(8, "big")
+    path.write_bytes(b"fLaC\x80" + (34).to_bytes(3, "big") + bytes(streaminfo))
+    audio = FLAC(str(path))
+    audio.update({"date": "2001", "bpm": "120", "genre": "Jazz", "album": "Blue"})
+    pic = Picture()
+    pic.data = _ARTWORK
+    audio.add_picture(pic)
+    audio.save()
+
+
+def _atom(name, payload):
+    return struct.pack(">I4s", 8 + len(payload), name) + payload
+
+
+def _make_m4a(path):
+    def item(name, data_type, data):
+        return _atom(name, _atom(b"data", data_type.to_bytes(4, "big") + b"\x00" * 4 + data))
+
+    ilst = _atom(
+        b"ilst",
+        item(b"\xa9day", 1, b"1999-01-01T00:00:00Z")
+        + item(b"tmpo", 21, (97).to_bytes(2, "big"))
+        + item(b"gnre", 0, (18).to_bytes(2, "big"))
+        + item(b"\xa9alb", 1, "Ålbum".encode())
+        + item(b"covr", 14, _ARTWORK),
+    )
+    hdlr = _atom(b"hdlr", b"\x00" * 8 + b"mdirappl" + b"\x00" * 9)
+    mvhd = _atom(b"mvhd", b"\x00" * 12 + struct.pack(">II", 1000, 187_500) + b"\x00" * 80)
+    moov = _atom(b"moov", mvhd + _atom(b"udta", _atom(b"meta", b"\x00" * 4 + hdlr + ilst)))
+    path.write_bytes(_atom(b"ftyp", b"M4A \x00\x00\x00\x00M4A mp42") + moov)
+
+
+def _full_read(path):
+    with patch.object(metadata, "_LIGHT_READERS", {}):
+        return read_audio_tags(str(path))
+
+
+class TestHeaderOnlyReader:
+    @pytest.mark.parametrize("v2_version", [3, 4])
+    def test_mp3_matches_full_read(self, tmp_path, v2_version):
+        f = tmp_path / "a.mp3"
+        _make_mp3(f, v2_version)
+        assert metadata._read_tags_light(str(f)) is not None
+        result = read_audio_tags(str(f))
+        assert result == _full_read(f)
+        assert result["genre"] == "Rock"
+        assert result["album"] == "Üben"
+
+    def test_flac_matches_full_read(self, tmp_path):
+        f = tmp_path / "a.flac"
+        _make_flac(f)
+        assert metadata._read_tags_light(str(f)) is not None
+        result = read_audio_tags(str(f))
+        assert result == _full_read(f)
+        assert result["duration_sec"] == 10
+
+    def test_m4a_matches_full_read(self, tmp_path):
+        f = tmp_path / "a.m4a"
+        _make_m4a(f)
+        assert metadata._read_tags_light(str(f)) is not None
+        result = read_audio_tags(str(f))
+        assert result == _full_read(f)
+        assert result == {
+            "year": 1999, "bpm": 97, "genre": "Rock", "duration_sec": 187, "album": "Ålbum",
+        }
+
+    def test_mp3_artwork_is_not_read(self, tmp_path):
+        f = tmp_path / "a.mp3"
+        _make_mp3(f, 4)
+        data = f.read_bytes()
+
+        class CountingIO(io.BytesIO):
+            bytes_read = 0
+
+            def read(self, *args):
+                chunk = super().read(*args)
+                CountingIO.bytes_read += len(chunk)
+                return chunk
+
+        assert _read_mp3_light(CountingIO(data)) is not None
+        assert CountingIO.bytes_read < len(_ARTWORK) // 10
+
+    def test_unsupported_or_untagged_falls_back(self, tmp_path):
+        ogg = tmp_path / "a.ogg"
+        ogg.write_bytes(b"OggS")
+        bare = tmp_path / "bare.mp3"
+        bare.write_bytes(_MPEG_FRAME * 10)
+        assert metadata._read_tags_light(str(ogg)) is None
+        assert metadata._read_tags_light(str(bare)) is None
+        assert read_audio_tags(str(bare))["duration_sec"] == _full_read(bare)["duration_sec"]
+
+
 # ---------------------------------------------------------------------------
 # enrich_dataframe
 # ---------------------------------------------------------------------------
@@ -242,6 +369,22 @@ class TestEnrichDataframe:
         assert result["BPM"].iloc[0] == 120
         assert result["Album"].iloc[0] == "X&Y"
 
+    @patch("playlistgen.metadata.MUTAGEN_AVAILABLE", True)
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_fills_empty_and_nan_strings(self, mock_tags):
+        mock_tags.return_value = {
+            "year": 2005, "bpm": None, "genre": "Rock",
+            "duration_sec": None, "album": "X&Y",
+        }
+        df = pd.DataFrame({
+            "Location": ["/a.mp3", "/b.mp3"],
+            "Genre": ["", "Jazz"],
+            "Album": ["nan", " None "],
+        })
+        result = enrich_dataframe(df)
+        assert result["Genre"].tolist() == ["Rock", "Jazz"]
+        assert result["Album"].tolist() == ["X&Y", "X&Y"]
+
     @patch("playlistgen.metadata.MUTAGEN_AVAILABLE", True)
     @patch("playlistgen.metadata.read_audio_tags")
     def test_skips_empty_location(self, mock_tags):
@@ -284,3 +427,101 @@ class TestEnrichDataframe:
         result = enrich_dataframe(df)
         assert result["Year"].iloc[0] == 2001
         assert pd.isna(result["Year"].iloc[1])
+
+
+# ---------------------------------------------------------------------------
+# read_audio_tags_many
+# ---------------------------------------------------------------------------
+
+
+class TestReadAudioTagsMany:
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_preserves_order_with_thread_pool(self, mock_tags):
+        import time
+
+        def fake(path):
+            # Later paths finish first
+            time.sleep(0.001 * (20 - int(path)))
+            return {"year": int(path)}
+
+        mock_tags.side_effect = fake
+        paths = [str(i) for i in range(20)]
+        result = read_audio_tags_many(paths, workers=4)
+        assert [r["year"] for r in result] == list(range(20))
+
+    @patch("playlistgen.metadata.MUTAGEN_AVAILABLE", True)
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_enrich_dataframe_parallel_fills_columns(self, mock_tags):
+        mock_tags.side_effect = lambda p: {
+            "year": 2000 + int(p[1:]), "bpm": None, "genre": "Rock",
+            "duration_sec": 100, "album": None,
+        }
+        df = pd.DataFrame({"Location": [f"/{i}" for i in range(10)]})
+        result = enrich_dataframe(df, workers=3)
+        assert list(result["Year"]) == [2000 + i for i in range(10)]
+        assert (result["Genre"] == "Rock").all()
+
+
+class TestTagCache:
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_unchanged_files_are_not_reread(self, mock_tags, tmp_path):
+        files = []
+        for i in range(3):
+            f = tmp_path / f"{i}.mp3"
+            f.write_bytes(b"x" * (i + 1))
+            files.append(str(f))
+        mock_tags.side_effect = lambda p: {
+            "year": 2000, "bpm": 100, "genre": "Rock", "duration_sec": 60, "album": "A",
+        }
+        db = str(tmp_path / "tags.sqlite")
+
+        first = read_audio_tags_many(files, workers=1, cache_db=db)
+        assert mock_tags.call_count == 3
+
+        second = read_audio_tags_many(files, workers=1, cache_db=db)
+        assert mock_tags.call_count == 3  # all served from cache
+        assert second == first
+
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_modified_file_is_reread(self, mock_tags, tmp_path):
+        f = tmp_path / "a.mp3"
+        f.write_bytes(b"x")
+        mock_tags.return_value = {
+            "year": 1999, "bpm": None, "genre": None, "duration_sec": None, "album": None,
+        }
+        db = str(tmp_path / "tags.sqlite")
+        read_audio_tags_many([str(f)], cache_db=db)
+        f.write_bytes(b"xyz")  # size changes
+        read_audio_tags_many([str(f)], cache_db=db)
+        assert mock_tags.call_count == 2
+
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_missing_file_returns_empty_tags(self, mock_tags, tmp_path):
+        result = read_audio_tags_many(
+            [str(tmp_path / "gone.mp3")], cache_db=str(tmp_path / "tags.sqlite")
+        )
+        assert result == [dict.fromkeys(["year", "bpm", "genre", "duration_sec", "album"])]
+        mock_tags.assert_not_called()
+
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_failed_reads_are_not_cached(self, mock_tags, tmp_path):
+        f = tmp_path / "a.mp3"
+        f.write_bytes(b"x")
+        mock_tags.return_value = dict.fromkeys(
+            ["year", "bpm", "genre", "duration_sec", "album"]
+        )
+        db = str(tmp_path / "tags.sqlite")
+        read_audio_tags_many([str(f)], cache_db=db)
+        read_audio_tags_many([str(f)], cache_db=db)
+        assert mock_tags.call_count == 2
+
+    @patch("playlistgen.metadata.read_audio_tags")
+    def test_cached_reads_show_progress(self, mock_tags, tmp_path):
+        f = tmp_path / "a.mp3"
+        f.write_bytes(b"x")
+        mock_tags.return_value = {
+            "year": 1999, "bpm": None, "genre": None, "duration_sec": None, "album": None,
+        }
+        with patch("playlistgen.metadata.progress_bar", side_effect=lambda it, **kw: it) as bar:
+            read_audio_tags_many([str(f)], cache_db=str(tmp_path / "tags.sqlite"))
+        assert bar.call_args_list[0].kwargs["total"] == 1
@@ -73,6 +73,29 @@ def test_canonical_mood_idf_weighting():
     assert result == "Sad"
 
 
+def test_canonical_mood_idf_follows_tag_counts():
+    # Weights are tabulated per tag_counts dict — a new dict, or one that
+    # grew, must not reuse the previous table
+    tags = ["happy", "melancholy"]
+    assert canonical_mood(tags, tag_counts={"happy": 10000, "melancholy": 1}) == "Sad"
+    assert canonical_mood(tags, tag_counts={"happy": 1, "melancholy": 10000}) == "Happy"
+    counts = {"happy": 1}
+    assert canonical_mood(tags, tag_counts=counts) == "Sad"
+    counts.update({"happy": 10000, "melancholy": 10000})
+    assert canonical_mood(["melancholy", "happy"], tag_counts=counts) == "Happy"  # tie → PRIORITY
+
+
+def test_canonical_mood_matches_keyword_substrings():
+    # Every keyword still matches inside a longer, punctuated tag
+    for mood, keywords in MOODS.items():
+        for kw in keywords:
+            tag = f"very {kw}!!"
+            result = canonical_mood([tag])
+            hits = [m for m, kws in MOODS.items() if any(k in f"very {kw}" for k in kws)]
+            assert mood in hits
+            assert result in hits
+
+
 def test_canonical_mood_legacy_dict_tags_not_accepted():
     # canonical_mood expects List[str], not dicts — should not raise
     result = canonical_mood(None, genre="Pop")
@@ -234,6 +234,26 @@ class TestBatchEnrichOllama:
         assert result.at[0, "Mood"] == "Happy"
         assert result.at[1, "Mood"] == "Chill"
 
+    def test_reads_cache_rows_written_under_the_existing_key_form(self, tmp_path):
+        """Cache keys come from the same strings as the row checks ("nan" included)."""
+        mod = _import_module()
+        cache_db = str(tmp_path / "compat.sqlite")
+        conn = sqlite3.connect(cache_db)
+        conn.executescript(mod._ENRICH_SCHEMA)
+        conn.executemany(
+            "INSERT INTO ollama_enrichment (key, mood, energy, valence) VALUES (?, ?, ?, ?)",
+            [("nan - song1", "Sad", 3, 2), ("artist2  - song2", "Happy", 7, 8)],
+        )
+        conn.commit()
+        conn.close()
+
+        df = pd.DataFrame({"Artist": [float("nan"), "Artist2 "], "Name": ["Song1", "Song2"]})
+        with patch.object(mod.requests, "post") as mock_post:
+            result = mod.batch_enrich_ollama(df, cache_db=cache_db)
+
+        assert mock_post.call_count == 0
+        assert list(result["Mood"]) == ["Sad", "Happy"]
+
     def test_skips_unknown_mood_values(self, tmp_path):
         """Rows with Mood='Unknown' must be treated as needing enrichment."""
         mod = _import_module()
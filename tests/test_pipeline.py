@@ -228,3 +228,48 @@ class TestRunPipelineFiltering:
         }
         result = run_pipeline(cfg, genre="metal")
         assert result == []
+
+
+# ---------------------------------------------------------------------------
+# run_pipeline — tag store lifetime
+# ---------------------------------------------------------------------------
+
+
+class TestRunPipelineTagStore:
+    def _run(self, tmp_path, score):
+        from playlistgen.lastfm_client import TagStore, init_cache_db
+
+        db_path = str(tmp_path / "lastfm.sqlite")
+        init_cache_db(db_path).close()
+        store = TagStore(db_path)
+        cfg = {
+            "ITUNES_JSON": str(tmp_path / "lib.json"),
+            "LIBROSA_ENABLED": False,
+            "AI_BATCH_ENRICH": False,
+        }
+        with patch("playlistgen.pipeline.ensure_itunes_json", return_value=tmp_path / "lib.json"), \
+                patch("playlistgen.pipeline.load_itunes_json", return_value=_make_scored_df()), \
+                patch("playlistgen.pipeline.ensure_tag_cache"), \
+                patch("playlistgen.pipeline.load_tag_mood_db", return_value=store), \
+                patch("playlistgen.pipeline.score_tracks", side_effect=score):
+            run_pipeline(cfg, genre="metal")
+        return store
+
+    def test_store_is_closed_after_scoring(self, tmp_path):
+        def score(df, tag_mood_db, **kwargs):
+            assert tag_mood_db._conn is not None  # opened by len() above
+            return df
+
+        store = self._run(tmp_path, score)
+        assert store._conn is None
+
+    def test_store_is_closed_when_scoring_fails(self, tmp_path):
+        stores = []
+
+        def score(df, tag_mood_db, **kwargs):
+            stores.append(tag_mood_db)
+            raise RuntimeError("scoring failed")
+
+        with pytest.raises(RuntimeError):
+            self._run(tmp_path, score)
+        assert stores[0]._conn is None
@@ -0,0 +1,93 @@
+"""Tests for playlistgen.track_index — canonical keys and the integer registry."""
+
+import numpy as np
+import pandas as pd
+
+from playlistgen.track_index import (
+    TRACK_ID,
+    TrackRegistry,
+    assign_track_ids,
+    frame_track_ids,
+    get_registry,
+    reset_registry,
+    track_key,
+    track_keys,
+)
+
+
+class TestTrackKey:
+    def test_normalises_case_and_outer_whitespace(self):
+        assert track_key(" Radiohead", "Karma Police ") == "radiohead - karma police"
+
+    def test_vectorised_matches_scalar(self):
+        artists = pd.Series(["Radiohead", "BECK ", None])
+        names = pd.Series(["Creep", "Loser", "Untitled"])
+        expected = [track_key("Radiohead", "Creep"), track_key("BECK ", "Loser"), "- untitled"]
+        assert list(track_keys(artists, names)) == expected
+
+
+class TestTrackRegistry:
+    def test_intern_assigns_dense_stable_ids(self):
+        reg = TrackRegistry()
+        ids = reg.intern(["a - x", "b - y", "a - x"])
+        assert ids.tolist() == [0, 1, 0]
+        assert ids.dtype == np.int32
+        assert reg.intern(["c - z", "b - y"]).tolist() == [2, 1]
+        assert len(reg) == 3
+
+    def test_lookup_does_not_add(self):
+        reg = TrackRegistry()
+        reg.intern(["a - x"])
+        assert reg.lookup(["a - x", "unknown"]).tolist() == [0, -1]
+        assert len(reg) == 1
+
+    def test_keys_round_trip(self):
+        reg = TrackRegistry()
+        ids = reg.intern(pd.Series(["a - x", "b - y"]))
+        assert list(reg.keys(ids[::-1])) == ["b - y", "a - x"]
+
+    def test_dense_scatters_known_keys_only(self):
+        reg = TrackRegistry()
+        reg.intern(["a - x", "b - y", "c - z"])
+        out = reg.dense({"b - y": 5, "not in library": 9})
+        assert out.tolist() == [0.0, 5.0, 0.0]
+
+    def test_empty_input(self):
+        reg = TrackRegistry()
+        assert reg.intern([]).tolist() == []
+        assert reg.dense({}).tolist() == []
+
+
+class TestFrameTrackIds:
+    def test_assign_then_reuse_column(self):
+        reg = reset_registry()
+        df = pd.DataFrame({"Artist": ["A", "B", "a"], "Name": ["X", "Y", "x"]})
+        assign_track_ids(df)
+        assert df[TRACK_ID].tolist() == [0, 1, 0]
+        assert get_registry() is reg
+
+        # Later stages read the column instead of re-interning
+        df[TRACK_ID] = [1, 0, 1]
+        assert frame_track_ids(df).tolist() == [1, 0, 1]
+
+    def test_column_from_another_registry_is_reinterned(self):
+        df = pd.DataFrame({"Artist": ["A", "B"], "Name": ["X", "Y"]})
+        assign_track_ids(df, registry=TrackRegistry())
+        reg = reset_registry()
+        reg.intern(["z - z"])
+        assert frame_track_ids(df).tolist() == [1, 2]
+
+        # Out-of-range IDs are never trusted, even from the right registry
+        assign_track_ids(df)
+        df[TRACK_ID] = [5, 9]
+        assert frame_track_ids(df).tolist() == [1, 2]
+
+        # A frame that never went through assign_track_ids
+        plain = pd.DataFrame({"Artist": ["B"], "Name": ["Y"], TRACK_ID: [0]})
+        assert frame_track_ids(plain).tolist() == [2]
+
+    def test_missing_name_column(self):
+        reg = TrackRegistry()
+        df = pd.DataFrame({"Artist": ["A"]})
+        ids = frame_track_ids(df, registry=reg)
+        assert list(reg.keys(ids)) == ["a -"]
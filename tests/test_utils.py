@@ -1,9 +1,11 @@
 """
 Tests for playlistgen/utils.py
-Covers: sanitize_label, validate_path, validate_url, validate_config
+Covers: sanitize_label, validate_path, validate_url, validate_config, sqlite_lookup, parse_budget
 """
 
 import os
+import sqlite3
+
 import pytest
 from pathlib import Path
 
@@ -12,6 +14,8 @@ from playlistgen.utils import (
     validate_path,
     validate_url,
     validate_config,
+    sqlite_lookup,
+    parse_budget,
 )
 
 
@@ -296,3 +300,83 @@ class TestValidateConfig:
         warnings = validate_config(cfg)
         assert warnings == []
         assert cfg["LASTFM_RATE_LIMIT_MS"] == 0
+
+
+# ---------------------------------------------------------------------------
+# sqlite_lookup
+# ---------------------------------------------------------------------------
+
+
+class TestSqliteLookup:
+    @pytest.fixture
+    def conn(self):
+        conn = sqlite3.connect(":memory:")
+        conn.execute("CREATE TABLE t (path TEXT PRIMARY KEY, mtime REAL, v INTEGER)")
+        conn.executemany(
+            "INSERT INTO t VALUES (?, ?, ?)", [("/a", 1.0, 10), ("/b", 2.0, 20)]
+        )
+        conn.executemany(
+            "INSERT INTO t VALUES (?, ?, ?)", [(f"/f{i}", 0.0, i) for i in range(1000)]
+        )
+        conn.commit()
+        yield conn
+        conn.close()
+
+    def test_single_key(self, conn):
+        assert sqlite_lookup(conn, "t", "path", ("v",), ["/a", "/missing", "/a"]) == {
+            "/a": (10,)
+        }
+
+    def test_composite_key(self, conn):
+        hits = sqlite_lookup(conn, "t", ("path", "mtime"), ("v",), [("/a", 1.0), ("/b", 9.0)])
+        assert hits == {("/a", 1.0): (10,)}
+
+    def test_empty_keys(self, conn):
+        assert sqlite_lookup(conn, "t", "path", ("v",), []) == {}
+
+    def test_leaves_no_temp_table_or_open_transaction(self, conn):
+        sqlite_lookup(conn, "t", "path", ("v",), ["/a"])
+        assert not conn.in_transaction
+        temp = conn.execute("SELECT name FROM sqlite_temp_master").fetchall()
+        assert temp == []
+
+    def test_large_key_set_scans_table(self, conn):
+        keys = [f"/x{i}" for i in range(5000)] + ["/b"]
+        assert sqlite_lookup(conn, "t", "path", ("v",), keys) == {"/b": (20,)}
+        pairs = [(f"/f{i}", 0.0) for i in range(1000)] + [("/a", 2.0)]
+        hits = sqlite_lookup(conn, "t", ("path", "mtime"), ("v",), pairs)
+        assert len(hits) == 1000 and hits[("/f7", 0.0)] == (7,)
+
+
+# ---------------------------------------------------------------------------
+# parse_budget
+# ---------------------------------------------------------------------------
+
+
+class TestParseBudget:
+    @pytest.mark.parametrize(
+        "value, expected",
+        [
+            (None, (None, None)),
+            ("", (None, None)),
+            ("500", (None, 500)),
+            (250, (None, 250)),
+            ("90s", (90.0, None)),
+            ("45m", (2700.0, None)),
+            ("1.5h", (5400.0, None)),
+            (" 2H ", (7200.0, None)),
+        ],
+    )
+    def test_valid(self, value, expected):
+        assert parse_budget(value) == expected
+
+    @pytest.mark.parametrize("value", ["0", "-5", "10 minutes", "abc", "0m"])
+    def test_invalid_raises(self, value):
+        with pytest.raises(ValueError, match="budget"):
+            parse_budget(value)
+
+    def test_validate_config_drops_invalid_budget(self):
+        cfg = {"AUDIO_ANALYSIS_BUDGET": "soon"}
+        warnings = validate_config(cfg)
+        assert cfg["AUDIO_ANALYSIS_BUDGET"] is None
+        assert any("AUDIO_ANALYSIS_BUDGET" in w for w in warnings)